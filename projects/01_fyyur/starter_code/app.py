@@ -2,167 +2,1782 @@
 # Imports
 #----------------------------------------------------------------------------#
 
+import io
+import os
+import csv
+import random
+import hmac
 import json
+import base64
+import hashlib
+import click
 import dateutil.parser
-import babel
-from flask import Flask, render_template, request, Response, flash, redirect, url_for
+from flask import Flask, Blueprint, current_app, render_template, request, Response, flash, redirect, url_for, abort, g, \
+  has_app_context, has_request_context, session, stream_with_context
 from flask_moment import Moment
-from flask_sqlalchemy import SQLAlchemy
 import logging
 from logging import Formatter, FileHandler
 from flask_wtf import Form
 from forms import *
+from search import TrigramIndex, search_text
+from schedule import IntervalIndex, free_slots
+from geo import Gazetteer, cover, distance_km, encode as geohash, prefix_end
+from formatting import DateTimeFormatter
+from cache import PageCache
+from profiler import QueryProfiler
+from tasks import TaskQueue
+from routing import RoutingSQLAlchemy, ReplicaRouter
+from serialize import dumps, encoded_response, json_response, requested_fields, sparse
+from seed import generate_venues, generate_artists, generate_shows
 from flask_migrate import Migrate
-from datetime import datetime
+from jinja2 import FileSystemBytecodeCache
+from datetime import datetime, timedelta
+from itertools import groupby
+from collections import defaultdict, namedtuple
 from flask.json import jsonify
+from sqlalchemy import event, DDL
+from sqlalchemy.engine.url import make_url
 from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import with_parent
 
 #----------------------------------------------------------------------------#
 # App Config.
 #----------------------------------------------------------------------------#
 
-app = Flask(__name__)
-moment = Moment(app)
-app.config.from_object('config')
-db = SQLAlchemy(app)
+# The extensions are bound to each app built by create_app() (see App
+# Factory below), and the routes and CLI commands live on the `main`
+# blueprint, so several independently configured apps can coexist.
+moment = Moment()
+db = RoutingSQLAlchemy()
+page_cache = PageCache()
+query_profiler = QueryProfiler()
+replicas = ReplicaRouter(db)
+migrate = Migrate()
+task_queue = TaskQueue(db)
+bp = Blueprint('main', __name__, cli_group=None)
+api = Blueprint('api', __name__, url_prefix='/api/v1')
 
-migrate = Migrate(app, db)
+#----------------------------------------------------------------------------#
+# Models.
+#----------------------------------------------------------------------------#
+
+
+class ShowTimeline(object):
+  '''
+  Past/upcoming show properties shared by Venue and Artist.
+
+  The loaded shows are sorted and split once against the request's "now"
+  and the result is kept on the instance until the session expires it
+  (or, inside a request, until the next request). Counts are taken with a
+  SQL COUNT when the shows are not loaded yet.
+  '''
+
+  def timeline(self):
+    now = request_now()
+    cached = self.__dict__.get('_timeline')
+    if cached is None or (has_request_context() and cached[0] != now):
+      cached = (now,) + split_shows(self.shows, now)
+      self._timeline = cached
+    return cached
+
+  def count_shows(self, criterion):
+    return db.session.query(db.func.count(Show.id)).filter(
+      with_parent(self, type(self).shows), criterion
+    ).scalar()
+
+  @property
+  def past_shows(self):
+    return self.timeline()[1]
+
+  @property
+  def num_past_shows(self):
+    if 'shows' in self.__dict__:
+      return len(self.past_shows)
+    return self.count_shows(~is_upcoming(Show.start_time, request_now()))
+
+  @property
+  def upcoming_shows(self):
+    return self.timeline()[2]
+
+  @property
+  def num_upcoming_shows(self):
+    if 'shows' in self.__dict__:
+      return len(self.upcoming_shows)
+    return self.count_shows(is_upcoming(Show.start_time, request_now()))
+
+
+class Venue(ShowTimeline, db.Model):
+    __tablename__ = 'Venue'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String)
+    genres = db.Column(db.ARRAY(db.String()).with_variant(db.JSON(), 'sqlite'))
+    address = db.Column(db.String(120))
+    # NOT NULL: /venues pages on (state, city, id) row values, which skip NULLs
+    city = db.Column(db.String(120), nullable=False)
+    state = db.Column(db.String(120), nullable=False)
+    phone = db.Column(db.String(120))
+    website = db.Column(db.String(500))
+    facebook_link = db.Column(db.String(500))
+    seeking_talent = db.Column(db.Boolean(500))
+    seeking_description = db.Column(db.String(500))
+    image_link = db.Column(db.String(500))
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    search_text = db.Column(db.Text)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
+    geohash = db.Column(db.String(12))
+
+    __table_args__ = (
+      db.Index('ix_Venue_search_text', 'search_text',
+               postgresql_using='gin', postgresql_ops={'search_text': 'gin_trgm_ops'}),
+      db.Index('ix_Venue_geohash', 'geohash'),
+    )
+
+    # children = db.relationship('SomeChild', backref='some_parent')
+    shows = db.relationship('Show', backref='Venue', lazy=True, cascade='all, delete-orphan')
+
+    # TODO: implement any missing fields, as a database migration using Flask-Migrate
+
+    # TODO: implement any missing fields, as a database migration using Flask-Migrate
+
+    # TODO Implement Show and Artist models, and complete all model relationships and properties, as a database migration.
+
+
+class Artist(ShowTimeline, db.Model):
+  __tablename__ = 'Artist'
+
+  id = db.Column(db.Integer, primary_key=True)
+  name = db.Column(db.String)
+  city = db.Column(db.String(120))
+  state = db.Column(db.String(120))
+  phone = db.Column(db.String(120))
+  genres = db.Column(db.ARRAY(db.String()).with_variant(db.JSON(), 'sqlite'))
+  image_link = db.Column(db.String(500))
+  facebook_link = db.Column(db.String(120))
+
+  # children = db.relationship('SomeChild', backref='some_parent')
+  shows = db.relationship('Show', backref='Artist', lazy=True)
+
+
+  website_link = db.Column(db.String(500))
+  seeking_venue = db.Column(db.Boolean, default=False, nullable=False)
+  seeking_description = db.Column(db.String(500), nullable=True)
+  upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+  past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+  search_text = db.Column(db.Text)
+  updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+  __table_args__ = (
+    db.Index('ix_Artist_search_text', 'search_text',
+             postgresql_using='gin', postgresql_ops={'search_text': 'gin_trgm_ops'}),
+  )
+
+
+class Show(db.Model):
+  __tablename__ = 'Show'
+
+  id = db.Column(db.Integer, primary_key=True)
+  start_time = db.Column(db.DateTime, nullable=False)
+  end_time = db.Column(db.DateTime, nullable=False)
+  artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id'), nullable=False)
+  venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id'), nullable=False)
+  updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+  __table_args__ = (
+    db.Index('ix_Show_venue_id_start_time', 'venue_id', 'start_time'),
+    db.Index('ix_Show_artist_id_start_time', 'artist_id', 'start_time'),
+    db.Index('ix_Show_start_time_id', 'start_time', 'id'),
+  )
+
+
+# A venue or an artist can only be booked for one show at a time. On
+# PostgreSQL the database refuses overlapping [start_time, end_time)
+# periods itself; the GiST indexes behind the constraints also serve the
+# conflict and free slot lookups (see Scheduling below).
+event.listen(Show.__table__, 'after_create', DDL('CREATE EXTENSION IF NOT EXISTS btree_gist').execute_if(
+  dialect='postgresql'))
+for column in ('venue_id', 'artist_id'):
+  event.listen(Show.__table__, 'after_create', DDL(
+    'ALTER TABLE "Show" ADD CONSTRAINT "ex_Show_{0}_period" '
+    'EXCLUDE USING gist ({0} WITH =, tsrange(start_time, end_time) WITH &&)'.format(column)
+  ).execute_if(dialect='postgresql'))
+
+
+class Genre(db.Model):
+  __tablename__ = 'Genre'
+
+  id = db.Column(db.Integer, primary_key=True)
+  name = db.Column(db.String(120), nullable=False, unique=True)
+
+
+# Venue/Artist <-> Genre links, keyed (genre_id, owner id) so the rows with
+# a genre are one index range
+venue_genres = db.Table(
+  'VenueGenre',
+  db.Column('genre_id', db.Integer, db.ForeignKey('Genre.id'), primary_key=True),
+  db.Column('venue_id', db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'), primary_key=True),
+  db.Index('ix_VenueGenre_venue_id', 'venue_id'),
+)
+
+artist_genres = db.Table(
+  'ArtistGenre',
+  db.Column('genre_id', db.Integer, db.ForeignKey('Genre.id'), primary_key=True),
+  db.Column('artist_id', db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE'), primary_key=True),
+  db.Index('ix_ArtistGenre_artist_id', 'artist_id'),
+)
+
+
+# VenueAreaSummary is kept out of db.metadata so that create_all() and
+# migration autogenerate don't take it for an ordinary table; the view (or
+# table) is created and dropped along with the rest of the schema below.
+summary_metadata = db.MetaData()
+
+
+class VenueAreaSummary(db.Model):
+  '''
+  One row per venue with its area and upcoming show count, as of the last
+  refresh_venue_summary(). A materialized view on PostgreSQL, a plain
+  table elsewhere.
+  '''
+  __table__ = db.Table(
+    'VenueAreaSummary', summary_metadata,
+    db.Column('venue_id', db.Integer, primary_key=True),
+    db.Column('city', db.String(120), nullable=False),
+    db.Column('state', db.String(120), nullable=False),
+    db.Column('name', db.String),
+    db.Column('num_upcoming_shows', db.Integer, nullable=False),
+    db.Column('updated_at', db.DateTime, nullable=False),
+    db.Index('ix_VenueAreaSummary_state_city_venue_id', 'state', 'city', 'venue_id'),
+  )
+
+  id = __table__.c.venue_id
+
+
+# The same view as migration 2b8e6c4d0a17. start_time is stored in local
+# time, like the LOCALTIMESTAMP it is compared with; updated_at is the
+# refresh time in UTC. REFRESH ... CONCURRENTLY needs the unique index.
+VENUE_SUMMARY_VIEW = (
+  'CREATE MATERIALIZED VIEW IF NOT EXISTS "VenueAreaSummary" AS '
+  'SELECT "Venue".id AS venue_id, "Venue".city, "Venue".state, "Venue".name, '
+  'count("Show".id) FILTER (WHERE "Show".start_time > LOCALTIMESTAMP) AS num_upcoming_shows, '
+  'timezone(\'utc\', now()) AS updated_at '
+  'FROM "Venue" LEFT OUTER JOIN "Show" ON "Show".venue_id = "Venue".id '
+  'GROUP BY "Venue".id, "Venue".city, "Venue".state, "Venue".name '
+  'WITH DATA',
+  'CREATE UNIQUE INDEX IF NOT EXISTS "ix_VenueAreaSummary_venue_id" ON "VenueAreaSummary" (venue_id)',
+  'CREATE INDEX IF NOT EXISTS "ix_VenueAreaSummary_state_city_venue_id" '
+  'ON "VenueAreaSummary" (state, city, venue_id)',
+)
+
+
+@event.listens_for(db.metadata, 'after_create')
+def create_venue_summary(target, connection, **kwargs):
+  if connection.dialect.name == 'postgresql':
+    for statement in VENUE_SUMMARY_VIEW:
+      connection.exec_driver_sql(statement)
+  else:
+    summary_metadata.create_all(connection)
+
+
+@event.listens_for(db.metadata, 'before_drop')
+def drop_venue_summary(target, connection, **kwargs):
+  # the view depends on Venue and Show, so it goes first
+  if connection.dialect.name == 'postgresql':
+    connection.exec_driver_sql('DROP MATERIALIZED VIEW IF EXISTS "VenueAreaSummary"')
+  else:
+    summary_metadata.drop_all(connection)
+
+
+# /api/v1/venues/lookup and /api/v1/artists/lookup prefix scans
+for model in (Venue, Artist):
+  db.Index('ix_{}_lower_name'.format(model.__tablename__), db.func.lower(model.name).label('lower_name'),
+           postgresql_ops={'lower_name': 'text_pattern_ops'})
+
+
+def forget_timeline(target, *args):
+  # target is None when an expired instance was already garbage collected
+  if target is not None:
+    target.__dict__.pop('_timeline', None)
+
+for model in (Venue, Artist):
+  event.listen(model, 'expire', forget_timeline)
+  event.listen(model.shows, 'append', forget_timeline)
+  event.listen(model.shows, 'remove', forget_timeline)
+
+
+#----------------------------------------------------------------------------#
+# Show counters.
+#----------------------------------------------------------------------------#
+
+# Venue/Artist keep persisted upcoming_shows_count / past_shows_count columns
+# so listings never have to count shows. Inserts, deletes and moves of a Show
+# through the ORM adjust them in the same transaction; roll_show_counters()
+# moves shows whose start_time has passed from upcoming to past, and
+# check_show_counters() finds (and optionally repairs) any drift. They all
+# split shows with is_upcoming(), so a show starting exactly at "now" is
+# counted, listed and rolled as past everywhere.
+
+COUNTED_MODELS = (
+  (Venue, Show.venue_id),
+  (Artist, Show.artist_id),
+)
+
+
+def is_upcoming(start_time, now):
+  '''
+  Whether a show starting at start_time is still upcoming at now; it is
+  past from its start on. Works on datetimes and on Show.start_time, whose
+  negation (~) is the SQL criterion for past shows.
+  '''
+  return start_time > now
+
+
+def bump_show_counters(connection, venue_id, artist_id, start_time, delta):
+  if isinstance(start_time, str):
+    start_time = dateutil.parser.parse(start_time)
+  if is_upcoming(start_time, request_now()):
+    column = 'upcoming_shows_count'
+  else:
+    column = 'past_shows_count'
+  for model, parent_id in ((Venue, venue_id), (Artist, artist_id)):
+    table = model.__table__
+    connection.execute(
+      table.update().where(table.c.id == parent_id).values({column: table.c[column] + delta})
+    )
+
+
+@event.listens_for(Show, 'after_insert')
+def count_new_show(mapper, connection, show):
+  bump_show_counters(connection, show.venue_id, show.artist_id, show.start_time, 1)
+
+
+@event.listens_for(Show, 'after_delete')
+def uncount_deleted_show(mapper, connection, show):
+  bump_show_counters(connection, show.venue_id, show.artist_id, show.start_time, -1)
+
+
+@event.listens_for(Show, 'after_update')
+def recount_moved_show(mapper, connection, show):
+  state = db.inspect(show)
+  old = {}
+  for attr in ('venue_id', 'artist_id', 'start_time'):
+    history = state.attrs[attr].history
+    old[attr] = history.deleted[0] if history.deleted else getattr(show, attr)
+  if old != {attr: getattr(show, attr) for attr in old}:
+    bump_show_counters(connection, old['venue_id'], old['artist_id'], old['start_time'], -1)
+    bump_show_counters(connection, show.venue_id, show.artist_id, show.start_time, 1)
+
+
+def recount_show_counters(model, foreign_key, ids=None, now=None):
+  '''
+  Recomputes the stored counters of model rows (all of them, or those whose
+  id is in ids - a list or a subquery) from the Show table in one UPDATE.
+  '''
+  now = now or datetime.now()
+  table = model.__table__
+  count = db.select(db.func.count(Show.id)).where(foreign_key == table.c.id)
+  stmt = table.update().values(
+    upcoming_shows_count=count.where(is_upcoming(Show.start_time, now)).scalar_subquery(),
+    past_shows_count=count.where(~is_upcoming(Show.start_time, now)).scalar_subquery()
+  )
+  if ids is not None:
+    stmt = stmt.where(table.c.id.in_(ids))
+  return db.session.execute(stmt).rowcount
+
+
+def roll_show_counters(since, now=None):
+  '''
+  Moves shows that started in (since, now] from the upcoming to the past
+  counter by recounting only the venues and artists they belong to. The
+  recount is idempotent, so overlapping windows are harmless.
+  '''
+  now = now or datetime.now()
+  rolled = 0
+  tags = []
+  for model, foreign_key in COUNTED_MODELS:
+    ids = db.session.execute(
+      db.select(foreign_key).where(
+        is_upcoming(Show.start_time, since), ~is_upcoming(Show.start_time, now)
+      ).distinct()
+    ).scalars().all()
+    if ids:
+      rolled += recount_show_counters(model, foreign_key, ids, now)
+      tags += ['{}:{}'.format(model.__tablename__.lower(), id) for id in ids]
+  db.session.commit()
+  if rolled:
+    # the listings and detail pages show the counters
+    page_cache.invalidate('venues', 'artists', *tags)
+    schedule_venue_summary_refresh()
+  return rolled
+
+
+def check_show_counters(repair=False, now=None):
+  '''
+  Compares every stored counter with a fresh grouped count and returns the
+  drifted rows as (model name, id, stored, actual) tuples, where stored and
+  actual are (upcoming, past) pairs. With repair=True the drifted rows are
+  recounted.
+  '''
+  now = now or datetime.now()
+  drifted = []
+  for model, foreign_key in COUNTED_MODELS:
+    upcoming = db.func.count(Show.id).filter(is_upcoming(Show.start_time, now))
+    past = db.func.count(Show.id).filter(~is_upcoming(Show.start_time, now))
+    rows = db.session.query(
+      model.id, model.upcoming_shows_count, model.past_shows_count, upcoming, past
+    ).outerjoin(
+      Show, foreign_key == model.id
+    ).group_by(
+      model.id, model.upcoming_shows_count, model.past_shows_count
+    ).having(
+      db.or_(model.upcoming_shows_count != upcoming, model.past_shows_count != past)
+    ).all()
+    drifted += [(model.__name__, row[0], tuple(row[1:3]), tuple(row[3:5])) for row in rows]
+    if repair and rows:
+      recount_show_counters(model, foreign_key, [row[0] for row in rows], now)
+  if repair:
+    db.session.commit()
+  return drifted
+
+
+@bp.cli.command('roll-show-counters')
+@click.option('--window', default=60, help='Look back this many minutes for shows that have started.')
+def roll_show_counters_command(window):
+  '''Move started shows from the upcoming to the past counters.'''
+  rolled = roll_show_counters(datetime.now() - timedelta(minutes=window))
+  click.echo('Recounted {} venues/artists.'.format(rolled))
+
+
+@bp.cli.command('check-show-counters')
+@click.option('--repair', is_flag=True, help='Recount the rows that drifted.')
+def check_show_counters_command(repair):
+  '''Recompute the show counters and report (or repair) drift.'''
+  drifted = check_show_counters(repair=repair)
+  for name, id, stored, actual in drifted:
+    click.echo('{} {}: stored {} actual {}'.format(name, id, stored, actual))
+  click.echo('{} counters drifted{}.'.format(len(drifted), ', repaired' if repair else ''))
+
+
+#----------------------------------------------------------------------------#
+# Genres.
+#----------------------------------------------------------------------------#
+
+# Venue.genres and Artist.genres stay the lists the pages display; Genre
+# and the VenueGenre/ArtistGenre link tables mirror them, so filtering by
+# genre is an index range scan instead of a look at every row's array. The
+# links are rewritten whenever genres is set through the ORM and by the
+# bulk seed; the list of genre names is cached under the 'genres' tag.
+
+GENRE_LINKS = {
+  Venue: (venue_genres, venue_genres.c.venue_id),
+  Artist: (artist_genres, artist_genres.c.artist_id),
+}
+
+
+def genre_ids(connection, names):
+  '''{name: id} of the genres called names, adding the missing ones.'''
+  names = set(names)
+  if not names:
+    return {}
+  table = Genre.__table__
+  select = db.select(table.c.name, table.c.id)
+  ids = dict(connection.execute(select.where(table.c.name.in_(names))).fetchall())
+  missing = names.difference(ids)
+  if missing:
+    connection.execute(table.insert(), [{"name": name} for name in sorted(missing)])
+    ids.update(connection.execute(select.where(table.c.name.in_(missing))).fetchall())
+  return ids
+
+
+def link_genres(connection, model, rows):
+  '''Replaces the genre links of rows of model, dicts with an id and genres.'''
+  table, owner = GENRE_LINKS[model]
+  ids = genre_ids(connection, [name for row in rows for name in row['genres'] or ()])
+  connection.execute(table.delete().where(owner.in_([row['id'] for row in rows])))
+  links = [{"genre_id": ids[name], owner.key: row['id']} for row in rows for name in set(row['genres'] or ())]
+  if links:
+    connection.execute(table.insert(), links)
+
+
+@event.listens_for(Venue, 'after_insert')
+@event.listens_for(Venue, 'after_update')
+@event.listens_for(Artist, 'after_insert')
+@event.listens_for(Artist, 'after_update')
+def store_genre_links(mapper, connection, target):
+  if db.inspect(target).attrs.genres.history.has_changes():
+    link_genres(connection, type(target), [{"id": target.id, "genres": target.genres}])
+    db.object_session(target).info['genres_changed'] = True
+
+
+@event.listens_for(Venue, 'before_delete')
+@event.listens_for(Artist, 'before_delete')
+def delete_genre_links(mapper, connection, target):
+  table, owner = GENRE_LINKS[type(target)]
+  connection.execute(table.delete().where(owner == target.id))
+
+
+@event.listens_for(db.session, 'after_commit')
+def invalidate_genre_names(session):
+  if session.info.pop('genres_changed', False):
+    page_cache.invalidate('genres')
+
+
+@event.listens_for(db.session, 'after_rollback')
+def discard_genre_changes(session):
+  session.info.pop('genres_changed', None)
+
+
+def genre_members(model, genre):
+  '''Select of the ids of the rows of model with genre.'''
+  table, owner = GENRE_LINKS[model]
+  return db.select(owner).select_from(
+    table.join(Genre.__table__, Genre.id == table.c.genre_id)
+  ).where(Genre.name == genre)
+
+
+def genre_filter(model, genre, id_column=None):
+  '''Criterion on id_column (model.id by default) keeping the rows of model with genre.'''
+  return (model.id if id_column is None else id_column).in_(genre_members(model, genre))
+
+
+def genre_names():
+  '''The names of all genres, sorted.'''
+  key = 'genres:' + page_cache.version('genres')
+  value = page_cache.store.get(key)
+  if value is not None:
+    return json.loads(value)
+  names = [name for name, in db.session.query(Genre.name).order_by(Genre.name)]
+  page_cache.store.set(key, json.dumps(names))
+  return names
+
+
+#----------------------------------------------------------------------------#
+# Venue area summary.
+#----------------------------------------------------------------------------#
+
+# With VENUES_FROM_SUMMARY, /venues pages through VenueAreaSummary on its
+# (state, city, venue_id) index instead of the Venue table. The summary is
+# rebuilt as a whole: REFRESH MATERIALIZED VIEW CONCURRENTLY on PostgreSQL
+# (readers keep the old rows meanwhile), a delete and insert in one
+# transaction elsewhere. Commits that touch venues or shows queue a refresh
+# job VENUE_SUMMARY_REFRESH_DELAY seconds out, and every commit in that
+# window shares it; `flask refresh-venue-summary` is meant to also run on a
+# schedule, since upcoming shows start without any write.
+
+
+def venue_summary_select(now=None):
+  '''The summary rows, computed from Venue and Show.'''
+  now = now or datetime.now()
+  return db.select(
+    Venue.id, Venue.city, Venue.state, Venue.name,
+    db.func.count(Show.id).filter(is_upcoming(Show.start_time, now)),
+    db.literal(datetime.utcnow(), db.DateTime)
+  ).select_from(Venue).outerjoin(
+    Show, Show.venue_id == Venue.id
+  ).group_by(Venue.id, Venue.city, Venue.state, Venue.name)
+
+
+@task_queue.task
+def refresh_venue_summary(now=None):
+  '''Rebuilds VenueAreaSummary on its own connection and transaction.'''
+  with db.engine.begin() as connection:
+    if connection.dialect.name == 'postgresql':
+      connection.exec_driver_sql('REFRESH MATERIALIZED VIEW CONCURRENTLY "VenueAreaSummary"')
+    else:
+      table = VenueAreaSummary.__table__
+      connection.execute(table.delete())
+      connection.execute(table.insert().from_select(
+        ['venue_id', 'city', 'state', 'name', 'num_upcoming_shows', 'updated_at'],
+        venue_summary_select(now)
+      ))
+  page_cache.invalidate('venues')
+
+
+def venue_summary_refresh():
+  '''(delay, key) for queueing a summary refresh, or None if it is not wanted.'''
+  delay = current_app.config.get('VENUE_SUMMARY_REFRESH_DELAY')
+  if not current_app.config.get('VENUES_FROM_SUMMARY') or delay is None:
+    return None
+  return {"delay": delay, "key": 'refresh_venue_summary'}
+
+
+def schedule_venue_summary_refresh():
+  '''
+  Queues a summary refresh VENUE_SUMMARY_REFRESH_DELAY seconds from now
+  unless one is already waiting; never for None.
+  '''
+  options = venue_summary_refresh()
+  if options is not None:
+    task_queue.enqueue('refresh_venue_summary', **options)
+
+
+@event.listens_for(db.session, 'after_flush')
+def collect_summary_changes(session, flush_context):
+  changed = session.new.union(session.dirty).union(session.deleted)
+  if any(isinstance(target, (Venue, Show)) for target in changed):
+    options = venue_summary_refresh()
+    if options is not None:
+      task_queue.after_commit('refresh_venue_summary', **options)
+
+
+@bp.cli.command('refresh-venue-summary')
+def refresh_venue_summary_command():
+  '''Rebuild the venue area summary behind /venues.'''
+  refresh_venue_summary()
+  click.echo('Refreshed the venue area summary.')
+
+
+#----------------------------------------------------------------------------#
+# Search.
+#----------------------------------------------------------------------------#
+
+# Venues and artists are searched on a lowercase search_text column (name,
+# city, state and genres). On PostgreSQL it has a pg_trgm GIN index and the
+# database ranks the matches; elsewhere an in-process TrigramIndex per model
+# is built on first use and kept in sync after each commit. Each app has its
+# own (see create_app()), built under the version of the model's 'search:'
+# tag in the page cache store. Every commit that writes venues or artists
+# bumps it and adopts the new version, so the other processes sharing the
+# store (PAGE_CACHE_BACKEND = 'redis') rebuild theirs on their next search.
+
+
+def search_indexes():
+  '''The current app's TrigramIndex per model.'''
+  return current_app.extensions['search_indexes']
+
+
+@event.listens_for(Venue, 'before_insert')
+@event.listens_for(Venue, 'before_update')
+@event.listens_for(Artist, 'before_insert')
+@event.listens_for(Artist, 'before_update')
+def set_search_text(mapper, connection, target):
+  target.search_text = search_text(target.name, target.city, target.state, target.genres)
+
+
+@event.listens_for(db.session, 'after_flush')
+def collect_search_changes(session, flush_context):
+  changes = session.info.setdefault('search_changes', [])
+  for target in session.new.union(session.dirty):
+    if isinstance(target, (Venue, Artist)):
+      changes.append((type(target), target.id, target.name, target.search_text))
+  for target in session.deleted:
+    if isinstance(target, (Venue, Artist)):
+      changes.append((type(target), target.id, None, None))
+
+
+def search_tag(model):
+  return 'search:' + model.__name__
+
+
+@event.listens_for(db.session, 'after_commit')
+def apply_search_changes(session):
+  changes = defaultdict(list)
+  for model, id, name, text in session.info.pop('search_changes', []):
+    changes[model].append((id, name, text))
+  for model, rows in changes.items():
+    index = search_indexes().get(model)
+    if index is not None and index.version != page_cache.version(search_tag(model)):
+      # another process wrote first: rebuild on the next search
+      del search_indexes()[model]
+      index = None
+    page_cache.invalidate(search_tag(model))
+    if index is None:
+      continue
+    for id, name, text in rows:
+      if text is None:
+        index.remove(id)
+      else:
+        index.add(id, name, text)
+    index.version = page_cache.version(search_tag(model))
+
+
+@event.listens_for(db.session, 'after_rollback')
+def discard_search_changes(session):
+  session.info.pop('search_changes', None)
+
+
+@event.listens_for(db.metadata, 'after_drop')
+def drop_search_indexes(*args, **kwargs):
+  if has_app_context():
+    search_indexes().clear()
+
+
+def search_index(model):
+  version = page_cache.version(search_tag(model))
+  index = search_indexes().get(model)
+  if index is None or index.version != version:
+    index = TrigramIndex(version)
+    for id, name, text in db.session.query(model.id, model.name, model.search_text):
+      index.add(id, name, text)
+    search_indexes()[model] = index
+  return index
+
+
+def search_catalog(model, term, limit=None, genre=None):
+  '''
+  Returns the venues or artists matching term on name, city, state or
+  genres (and having genre, if given), best match first, at most limit of
+  them.
+  '''
+  term = term.strip().lower()
+  limit = limit or current_app.config.get('SEARCH_RESULT_LIMIT', 50)
+
+  if db.engine.dialect.name == 'postgresql':
+    rank = db.func.word_similarity(term, model.search_text) + \
+      db.func.similarity(db.func.lower(model.name), term)
+    query = model.query.filter(db.or_(
+      model.search_text.contains(term, autoescape=True),
+      model.search_text.op('%>')(term)
+    ))
+    if genre:
+      query = query.filter(genre_filter(model, genre))
+    return query.order_by(rank.desc(), model.id).limit(limit).all()
+
+  if genre:
+    members = set(db.session.execute(genre_members(model, genre)).scalars())
+    ranked = [result for result in search_index(model).search(term) if result[0] in members][:limit]
+  else:
+    ranked = search_index(model).search(term, limit)
+  rows = {row.id: row for row in model.query.filter(model.id.in_([id for id, score in ranked]))}
+  return [rows[id] for id, score in ranked if id in rows]
+
+
+#----------------------------------------------------------------------------#
+# Choices.
+#----------------------------------------------------------------------------#
+
+# The new show form picks its venue and artist from a typeahead: a prefix
+# lookup on the lower(name) index, one LIMITed range scan per keystroke.
+# Clients that want every choice at once get a snapshot of both lists,
+# encoded once and kept in the page cache store under the version of the
+# 'choices' tag, which is bumped after every commit that touches a venue
+# or an artist.
+
+
+def choice_label(row):
+  return row.name + ' ({}, {})'.format(row.city, row.state)
+
+
+def prefix_lookup_query(model, prefix):
+  '''Venues or artists whose lowercased name starts with prefix, in name order.'''
+  key = db.func.lower(model.name)
+  query = db.session.query(model.id, model.name, model.city, model.state)
+  if prefix and db.engine.dialect.name == 'postgresql':
+    # LIKE 'prefix%' can use the text_pattern_ops index whatever the collation
+    query = query.filter(key.startswith(prefix, autoescape=True))
+  elif prefix:
+    query = query.filter(key >= prefix, key < prefix[:-1] + chr(ord(prefix[-1]) + 1))
+  return query.order_by(key, model.id)
+
+
+def prefix_lookup(model, prefix, limit=None):
+  '''
+  The venues or artists whose name starts with prefix, ignoring case, as
+  (id, label) pairs in name order: at most limit (and LOOKUP_RESULT_LIMIT)
+  of them.
+  '''
+  most = current_app.config.get('LOOKUP_RESULT_LIMIT', 10)
+  query = prefix_lookup_query(model, prefix.strip().lower()).limit(min(limit or most, most))
+  return [(row.id, choice_label(row)) for row in query]
+
+
+def choices_snapshot():
+  '''(version, JSON body) of every venue and artist choice.'''
+  version = page_cache.version('choices')
+  key = 'choices:' + version
+  body = page_cache.store.get(key)
+  if body is None:
+    body = dumps({
+      "version": version,
+      "venues": [(row.id, choice_label(row)) for row in
+                 db.session.query(Venue.id, Venue.name, Venue.city, Venue.state).order_by(Venue.id)],
+      "artists": [(row.id, choice_label(row)) for row in
+                  db.session.query(Artist.id, Artist.name, Artist.city, Artist.state).order_by(Artist.id)],
+    })
+    page_cache.store.set(key, body)
+  return version, body
+
+
+@event.listens_for(db.session, 'after_flush')
+def collect_choice_changes(session, flush_context):
+  if not session.info.get('choices_stale'):
+    changed = session.new.union(session.dirty).union(session.deleted)
+    session.info['choices_stale'] = any(isinstance(target, (Venue, Artist)) for target in changed)
+
+
+@event.listens_for(db.session, 'after_commit')
+def invalidate_changed_choices(session):
+  if session.info.pop('choices_stale', False):
+    page_cache.invalidate('choices')
+
+
+@event.listens_for(db.session, 'after_rollback')
+def discard_choice_changes(session):
+  session.info.pop('choices_stale', None)
+
+
+#----------------------------------------------------------------------------#
+# Locations.
+#----------------------------------------------------------------------------#
+
+# Venues are placed at their city with the bundled gazetteer (see geo.py):
+# when one is added or moves to another city through the ORM unless it was
+# given coordinates, and in bulk by `flask geocode-venues`. Radius searches
+# read only the rows in a handful of geohash ranges around the center.
+
+gazetteer = Gazetteer()
+
+
+@event.listens_for(Venue, 'before_insert')
+@event.listens_for(Venue, 'before_update')
+def set_location(mapper, connection, venue):
+  attrs = db.inspect(venue).attrs
+  moved = attrs.city.history.has_changes() or attrs.state.history.has_changes()
+  placed = attrs.latitude.history.has_changes() or attrs.longitude.history.has_changes()
+  if (moved or venue.latitude is None) and not placed:
+    venue.latitude, venue.longitude = gazetteer.locate(venue.city, venue.state) or (None, None)
+  located = venue.latitude is not None and venue.longitude is not None
+  venue.geohash = geohash(venue.latitude, venue.longitude) if located else None
+
+
+def geocode_venues(everything=False):
+  '''
+  Places the venues without coordinates (every venue, with everything) at
+  their city in one UPDATE per city, and returns how many were placed.
+  Venues in cities missing from the gazetteer are left alone.
+  '''
+  table = Venue.__table__
+  query = db.session.query(Venue.city, Venue.state).distinct()
+  if not everything:
+    query = query.filter(Venue.latitude.is_(None))
+  placed = 0
+  for city, state in query.all():
+    location = gazetteer.locate(city, state)
+    if location is None:
+      continue
+    stmt = table.update().where(table.c.city == city, table.c.state == state).values(
+      latitude=location[0], longitude=location[1], geohash=geohash(*location)
+    )
+    if not everything:
+      stmt = stmt.where(table.c.latitude.is_(None))
+    placed += db.session.execute(stmt).rowcount
+  db.session.commit()
+  return placed
+
+
+@bp.cli.command('geocode-venues')
+@click.option('--all', 'everything', is_flag=True, help='Also place venues that already have coordinates.')
+def geocode_venues_command(everything):
+  '''Fill in venue coordinates from the bundled gazetteer.'''
+  click.echo('Placed {} venues.'.format(geocode_venues(everything)))
+
+
+def venues_around(latitude, longitude, km):
+  '''The venues in the geohash cells covering km around a point.'''
+  bounds = []
+  for prefix in cover(latitude, longitude, km):
+    if bounds and bounds[-1][1] == prefix:
+      # adjacent cells make one range
+      bounds[-1][1] = prefix_end(prefix)
+    else:
+      bounds.append([prefix, prefix_end(prefix)])
+  ranges = []
+  for start, end in bounds:
+    criteria = [Venue.geohash >= start] if start else [Venue.geohash.isnot(None)]
+    if end is not None:
+      criteria.append(Venue.geohash < end)
+    ranges.append(db.and_(*criteria))
+  return db.session.query(
+    Venue.id, Venue.name, Venue.city, Venue.state, Venue.latitude, Venue.longitude,
+    Venue.upcoming_shows_count.label('num_upcoming_shows')
+  ).filter(db.or_(*ranges))
+
+
+def venues_near(latitude, longitude, km, limit=None):
+  '''
+  The venues within km of a point, nearest first, as (row, distance in
+  km) pairs, at most limit of them.
+  '''
+  limit = limit or current_app.config.get('SEARCH_RESULT_LIMIT', 50)
+  near = []
+  for row in venues_around(latitude, longitude, km):
+    distance = distance_km(latitude, longitude, row.latitude, row.longitude)
+    if distance <= km:
+      near.append((row, distance))
+  near.sort(key=lambda item: (item[1], item[0].id))
+  return near[:limit]
+
+
+#----------------------------------------------------------------------------#
+# Scheduling.
+#----------------------------------------------------------------------------#
+
+# A show books its venue and its artist for [start_time, end_time), by
+# default SHOW_DEFAULT_DURATION minutes. On PostgreSQL the overlapping
+# bookings of a venue or an artist are one probe of the GiST index behind
+# its exclusion constraint; elsewhere an in-process IntervalIndex (see
+# schedule.py) per venue and per artist is built on first use and dropped
+# after each commit that adds, moves or removes one of its shows. Like the
+# search indexes, they belong to the app, so they miss the shows other
+# processes write: without the constraints to fall back on, a new show is
+# checked again with an overlap query once its insert holds the write lock
+# (see create_show_submission()).
+
+
+def schedule_indexes():
+  '''The current app's IntervalIndex per (key, venue or artist id).'''
+  return current_app.extensions['schedule_indexes']
+
+
+def show_duration():
+  return timedelta(minutes=current_app.config.get('SHOW_DEFAULT_DURATION', 120))
+
+
+@event.listens_for(Show, 'before_insert')
+@event.listens_for(Show, 'before_update')
+def set_end_time(mapper, connection, show):
+  attrs = db.inspect(show).attrs
+  if show.end_time is None:
+    show.end_time = show.start_time + show_duration()
+  elif attrs.start_time.history.deleted and not attrs.end_time.history.has_changes():
+    # a moved show keeps its length
+    show.end_time += show.start_time - attrs.start_time.history.deleted[0]
+
+
+@event.listens_for(db.session, 'after_flush')
+def collect_schedule_changes(session, flush_context):
+  changes = session.info.setdefault('schedule_changes', set())
+  for show in session.new.union(session.dirty).union(session.deleted):
+    if isinstance(show, Show):
+      attrs = db.inspect(show).attrs
+      for key in ('venue_id', 'artist_id'):
+        history = getattr(attrs, key).history
+        changes.update((key, id) for id in history.sum() if id is not None)
+
+
+@event.listens_for(db.session, 'after_commit')
+def apply_schedule_changes(session):
+  indexes = schedule_indexes()
+  for key in session.info.pop('schedule_changes', ()):
+    indexes.pop(key, None)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def discard_schedule_changes(session):
+  session.info.pop('schedule_changes', None)
+
+
+@event.listens_for(db.metadata, 'after_drop')
+def drop_schedule_indexes(*args, **kwargs):
+  if has_app_context():
+    schedule_indexes().clear()
+
+
+def forget_schedules(venue_ids=(), artist_ids=()):
+  '''Drops the cached schedules of venues and artists whose shows were written in bulk.'''
+  indexes = schedule_indexes()
+  for key, ids in (('venue_id', venue_ids), ('artist_id', artist_ids)):
+    for id in ids:
+      indexes.pop((key, id), None)
+
+
+def overlaps(start_time, end_time):
+  '''Criterion for the shows overlapping [start_time, end_time).'''
+  if db.engine.dialect.name == 'postgresql':
+    # the form the exclusion constraints' GiST indexes answer
+    return db.func.tsrange(Show.start_time, Show.end_time).op('&&')(db.func.tsrange(start_time, end_time))
+  return db.and_(Show.start_time < end_time, Show.end_time > start_time)
+
+
+def schedule_index(key, id):
+  index = schedule_indexes().get((key, id))
+  if index is None:
+    index = IntervalIndex(db.session.query(Show.id, Show.start_time, Show.end_time).filter(
+      getattr(Show, key) == id))
+    schedule_indexes()[(key, id)] = index
+  return index
+
+
+def bookings(key, id, start_time, end_time, indexed=True):
+  '''
+  The (start_time, end_time, show id) of the shows of venue (key
+  'venue_id') or artist ('artist_id') id overlapping [start_time,
+  end_time), by start time. Unless indexed, they are read from the table
+  in the current transaction on every database.
+  '''
+  if not indexed or db.engine.dialect.name == 'postgresql':
+    return db.session.query(Show.start_time, Show.end_time, Show.id).filter(
+      getattr(Show, key) == id, overlaps(start_time, end_time)
+    ).order_by(Show.start_time).all()
+  return list(schedule_index(key, id).overlapping(start_time, end_time))
+
+
+def booking_conflict(venue_id, artist_id, start_time, end_time, exclude=None, indexed=True):
+  '''
+  ('venue_id' or 'artist_id', booking) for the first show other than
+  exclude that already books the venue or the artist during [start_time,
+  end_time), or None when both are free.
+  '''
+  for key, id in (('venue_id', venue_id), ('artist_id', artist_id)):
+    for booking in bookings(key, id, start_time, end_time, indexed):
+      if booking[2] != exclude:
+        return key, booking
+  return None
+
+
+def conflict_message(conflict):
+  key, (start_time, end_time, id) = conflict
+  return '{} is already booked from {:%Y-%m-%d %H:%M} to {:%Y-%m-%d %H:%M} ({})'.format(
+    'venue' if key == 'venue_id' else 'artist', start_time, end_time,
+    'show {}'.format(id) if isinstance(id, int) else id)
+
+
+def find_free_slots(venue_id, start_time, end_time, length=None, artist_id=None):
+  '''
+  The (start, end) periods of at least length (SHOW_DEFAULT_DURATION) in
+  [start_time, end_time) when the venue, and the artist if given, are both
+  free.
+  '''
+  busy = [bookings('venue_id', venue_id, start_time, end_time)]
+  if artist_id is not None:
+    busy.append(bookings('artist_id', artist_id, start_time, end_time))
+  return free_slots(busy, start_time, end_time, length or show_duration())
+
+
+def show_conflicts(key):
+  '''
+  Yields (venue or artist id, show id, overlapped show id) for every show
+  starting before an earlier show of the same venue (key 'venue_id') or
+  artist ('artist_id') ends, in one pass over the shows in index order.
+  '''
+  column = getattr(Show, key)
+  owner, latest = None, None
+  query = db.session.query(column, Show.start_time, Show.end_time, Show.id).order_by(column, Show.start_time)
+  for id, start_time, end_time, show_id in query.yield_per(5000):
+    if id == owner and start_time < latest[0]:
+      yield id, show_id, latest[1]
+    if id != owner or end_time > latest[0]:
+      owner, latest = id, (end_time, show_id)
+
+
+@bp.cli.command('check-show-conflicts')
+def check_show_conflicts_command():
+  '''List double-booked venues and artists (e.g. before adding the exclusion constraints).'''
+  found = 0
+  for key in ('venue_id', 'artist_id'):
+    for id, show_id, other_id in show_conflicts(key):
+      click.echo('{} {}: show {} overlaps show {}'.format(key[:-3], id, show_id, other_id))
+      found += 1
+  if found:
+    raise click.ClickException('{} double bookings.'.format(found))
+  click.echo('No double bookings.')
+
+
+#----------------------------------------------------------------------------#
+# Queries.
+#----------------------------------------------------------------------------#
+
+
+def request_now():
+  '''
+  One "now" per request, so every past/upcoming split made while handling
+  it agrees on where the boundary is.
+  '''
+  if has_request_context() and 'now' in g:
+    return g.now
+  return datetime.now()
+
+
+Page = namedtuple('Page', ['items', 'next_cursor', 'prev_cursor'])
+
+
+def encode_cursor(values):
+  values = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+  return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def decode_cursor(cursor, keys):
+  # a cursor is one scalar per key; anything else was not made by encode_cursor
+  try:
+    values = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+    if not isinstance(values, list) or len(values) != len(keys):
+      abort(400)
+    if not all(isinstance(value, (str, int, float)) and not isinstance(value, bool) for value in values):
+      abort(400)
+    return [datetime.fromisoformat(value) if key.type.python_type is datetime else value
+            for key, value in zip(keys, values)]
+  except (ValueError, TypeError):
+    abort(400)
+
+
+def keyset_page(query, keys, after=None, before=None, size=None):
+  '''
+  Returns one Page of query ordered by keys, a list of columns whose values
+  are unique together (ending with the primary key). The page starts right
+  after the `after` cursor or ends right before the `before` cursor, so
+  every page is a single index range scan no matter how deep it is.
+  '''
+  size = size or current_app.config.get('PAGE_SIZE', 50)
+  row_key = lambda row: [getattr(row, key.key) for key in keys]
+
+  if before:
+    query = query.filter(db.tuple_(*keys) < tuple(decode_cursor(before, keys)))
+    rows = query.order_by(*[key.desc() for key in keys]).limit(size + 1).all()
+    has_more = len(rows) > size
+    rows = rows[:size][::-1]
+    return Page(
+      rows,
+      encode_cursor(row_key(rows[-1])) if rows else None,
+      encode_cursor(row_key(rows[0])) if rows and has_more else None
+    )
+
+  if after:
+    query = query.filter(db.tuple_(*keys) > tuple(decode_cursor(after, keys)))
+  rows = query.order_by(*keys).limit(size + 1).all()
+  has_more = len(rows) > size
+  rows = rows[:size]
+  return Page(
+    rows,
+    encode_cursor(row_key(rows[-1])) if rows and has_more else None,
+    encode_cursor(row_key(rows[0])) if rows and after else None
+  )
+
+
+def venue_areas(after=None, before=None, size=None, genre=None):
+  '''
+  Builds one page of the city/state -> venues -> upcoming show count tree
+  for /venues from a single query over the venues and their stored show
+  counters (or VenueAreaSummary, with VENUES_FROM_SUMMARY), instead of one
+  query per area plus a lazy Venue.shows load per venue, optionally only
+  the venues with genre. Returns the areas and the Page they were built
+  from.
+  '''
+  if current_app.config.get('VENUES_FROM_SUMMARY'):
+    model = VenueAreaSummary
+    query = db.session.query(model.city, model.state, model.id, model.name,
+                             model.num_upcoming_shows, model.updated_at)
+  else:
+    model = Venue
+    query = db.session.query(
+      Venue.city, Venue.state, Venue.id, Venue.name,
+      Venue.upcoming_shows_count.label('num_upcoming_shows'), Venue.updated_at
+    )
+  if genre:
+    query = query.filter(genre_filter(Venue, genre, model.id))
+  page = keyset_page(query, [model.state, model.city, model.id], after, before, size)
+
+  areas = []
+  for (city, state), venues in groupby(page.items, key=lambda row: (row.city, row.state)):
+    areas.append({
+      "city": city,
+      "state": state,
+      "venues": [{
+        "id": venue.id,
+        "name": venue.name,
+        "num_upcoming_shows": venue.num_upcoming_shows
+      } for venue in venues]
+    })
+  return areas, page
+
+
+def split_shows(shows, now=None):
+  '''
+  Splits shows into (past, upcoming) lists in a single pass, both sorted
+  by start_time.
+  '''
+  now = now or request_now()
+  past_shows, upcoming_shows = [], []
+  for show in sorted(shows, key=lambda show: show.start_time):
+    if is_upcoming(show.start_time, now):
+      upcoming_shows.append(show)
+    else:
+      past_shows.append(show)
+  return past_shows, upcoming_shows
+
+
+def venue_detail(venue_id):
+  '''
+  Loads a venue with its shows and each show's artist in two statements
+  (the venue, then shows joined to artists) for the venue page.
+  '''
+  venue = Venue.query.options(
+    db.selectinload(Venue.shows).joinedload(Show.Artist)
+  ).get(venue_id)
+  if venue is None:
+    return None
+
+  past_shows, upcoming_shows = venue.past_shows, venue.upcoming_shows
+  return {
+    "id": venue.id,
+    "name": venue.name,
+    "genres": venue.genres,
+    "address": venue.address,
+    "city": venue.city,
+    "state": venue.state,
+    "phone": venue.phone,
+    "website": venue.website,
+    "facebook_link": venue.facebook_link,
+    "seeking_talent": True if venue.seeking_talent in (True, 't', 'True') else False,
+    "seeking_description": venue.seeking_description,
+    "image_link": venue.image_link if venue.image_link else "",
+    "past_shows": [{
+      "artist_id": show.artist_id,
+      "artist_name": show.Artist.name,
+      "artist_image_link": show.Artist.image_link,
+      "start_time": show.start_time
+    } for show in past_shows],
+    "upcoming_shows": [{
+      "artist_id": show.artist_id,
+      "artist_name": show.Artist.name,
+      "artist_image_link": show.Artist.image_link,
+      "start_time": show.start_time
+    } for show in upcoming_shows],
+    "past_shows_count": len(past_shows),
+    "upcoming_shows_count": len(upcoming_shows),
+  }
+
+
+def artist_detail(artist_id):
+  '''
+  Loads an artist with its shows and each show's venue in two statements
+  (the artist, then shows joined to venues) for the artist page.
+  '''
+  artist = Artist.query.options(
+    db.selectinload(Artist.shows).joinedload(Show.Venue)
+  ).get(artist_id)
+  if artist is None:
+    return None
+
+  past_shows, upcoming_shows = artist.past_shows, artist.upcoming_shows
+  return {
+    "id": artist.id,
+    "name": artist.name,
+    "genres": artist.genres,
+    "city": artist.city,
+    "state": artist.state,
+    "phone": artist.phone,
+    "seeking_venue": True if artist.seeking_venue in ('y', True, 't', 'True') else False,
+    "seeking_description": artist.seeking_description,
+    "image_link": artist.image_link,
+    "facebook_link": artist.facebook_link,
+    "website_link": artist.website_link,
+    "past_shows": [{
+      "venue_id": show.venue_id,
+      "venue_name": show.Venue.name,
+      "venue_image_link": show.Venue.image_link,
+      "start_time": show.start_time
+    } for show in past_shows],
+    "upcoming_shows": [{
+      "venue_id": show.venue_id,
+      "venue_name": show.Venue.name,
+      "venue_image_link": show.Venue.image_link,
+      "start_time": show.start_time
+    } for show in upcoming_shows],
+    "past_shows_count": len(past_shows),
+    "upcoming_shows_count": len(upcoming_shows)
+  }
+
+
+def show_listing_query():
+  '''Shows with their venue and artist names, as listed on /shows.'''
+  return Show.query.join(
+    Venue, (Venue.id == Show.venue_id)
+  ).join(
+    Artist, (Artist.id == Show.artist_id)
+  ).with_entities(Show.id, Show.venue_id, Venue.name.label('venue_name'), Show.artist_id, Artist.name.label('artist_name'),
+                  Artist.image_link, Show.start_time, Show.updated_at,
+                  Venue.updated_at.label('venue_updated_at'), Artist.updated_at.label('artist_updated_at'))
+
+
+def show_listing_item(row):
+  return {
+    "id": row.id,
+    "venue_id": row.venue_id,
+    "venue_name": row.venue_name,
+    "artist_id": row.artist_id,
+    "artist_name": row.artist_name,
+    "artist_image_link": row.image_link,
+    "start_time": row.start_time
+  }
+
+
+def stream_show_listing(after=None, batch_size=None):
+  '''
+  Yields the listing items of every show (after the `after` cursor), read
+  batch_size rows at a time from a server-side cursor (yield_per), so the
+  whole table never sits in memory.
+  '''
+  batch_size = batch_size or current_app.config.get('SHOWS_STREAM_BATCH_SIZE', 500)
+  keys = [Show.start_time, Show.id]
+  query = show_listing_query()
+  if after:
+    query = query.filter(db.tuple_(*keys) > tuple(decode_cursor(after, keys)))
+  for row in query.order_by(*keys).yield_per(batch_size):
+    yield show_listing_item(row)
+
+
+def venue_page_tags(venue_id):
+  '''
+  Cache tags of the pages showing this venue: its own page and the pages
+  of the artists that play there.
+  '''
+  artist_ids = db.session.query(Show.artist_id).filter(Show.venue_id == venue_id).distinct()
+  return ['venue:{}'.format(venue_id)] + ['artist:{}'.format(id) for id, in artist_ids]
+
+
+def artist_page_tags(artist_id):
+  '''
+  Cache tags of the pages showing this artist: its own page and the pages
+  of the venues it plays at.
+  '''
+  venue_ids = db.session.query(Show.venue_id).filter(Show.artist_id == artist_id).distinct()
+  return ['artist:{}'.format(artist_id)] + ['venue:{}'.format(id) for id, in venue_ids]
 
-# TODO: connect to a local postgresql database
-app.config['SQLALCHEMY_DATABASE_URI'] = 'postgresql://fuzzytake@localhost:5432/fyyurapp'
 
 #----------------------------------------------------------------------------#
-# Models.
+# Validators.
 #----------------------------------------------------------------------------#
 
+# Pages answer conditional GETs from the updated_at columns (UTC, set on
+# every INSERT and UPDATE the app issues, show counter updates included)
+# instead of rendering.
+# The ETag also covers the ids on a page and, for detail pages, how many
+# shows have started, so deletions and shows moving from upcoming to past
+# change it too. Whatever else a page renders that is not in those rows
+# (the genre facets) is passed as page cache tags, whose versions go into
+# the ETag. Last-Modified is the newest updated_at involved and is only
+# consulted by clients that do not send If-None-Match; pages with tags
+# have none, since a tag's version says nothing about when it changed.
 
-class Venue(db.Model):
-    __tablename__ = 'Venue'
 
-    id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String)
-    genres = db.Column(db.ARRAY(db.String()))
-    address = db.Column(db.String(120))
-    city = db.Column(db.String(120))
-    state = db.Column(db.String(120))
-    phone = db.Column(db.String(120))
-    website = db.Column(db.String(500))
-    facebook_link = db.Column(db.String(500))
-    seeking_talent = db.Column(db.Boolean(500))
-    seeking_description = db.Column(db.String(500))
-    image_link = db.Column(db.String(500))
+def validators(versions, *extra, tags=()):
+  '''
+  (etag, last_modified) of a page built from rows with these versions and
+  from whatever is cached under tags.
+  '''
+  versions = [version for version in versions if version is not None]
+  tag_versions = [page_cache.version(tag) for tag in tags]
+  key = repr((current_app.config.get('PAGE_VERSION'), versions, extra, tag_versions))
+  last_modified = max(versions) if versions and not tags else None
+  return hashlib.sha1(key.encode()).hexdigest(), last_modified
 
-    # children = db.relationship('SomeChild', backref='some_parent')
-    shows = db.relationship('Show', backref='Venue', lazy=True, cascade='all, delete-orphan')
 
+def page_validators(page, *columns, tags=()):
+  '''
+  Validators of a keyset Page whose rows carry the given updated_at
+  columns, also rendering what is cached under tags (e.g. the genre list).
+  '''
+  versions = [getattr(row, column) for row in page.items for column in columns]
+  return validators(versions, [row.id for row in page.items], page.next_cursor, page.prev_cursor, tags=tags)
 
-    @property
-    def past_shows(self):
-      past_shows = [show for show in self.shows
-                    if show.start_time < datetime.now()]
-      return past_shows
 
-    @property
-    def num_past_shows(self):
-      return len(self.past_shows)
+def detail_validators(model, id, foreign_key, other, other_key, now=None):
+  '''
+  Validators of a venue or artist page from one aggregate over the row,
+  its shows and the artists/venues (other) they are with, without loading
+  any of them. None if there is no such row.
+  '''
+  now = now or request_now()
+  row = db.session.query(
+    model.updated_at, db.func.max(Show.updated_at), db.func.max(other.updated_at),
+    db.func.count(Show.id), db.func.count(Show.id).filter(~is_upcoming(Show.start_time, now))
+  ).outerjoin(
+    Show, foreign_key == model.id
+  ).outerjoin(
+    other, other.id == other_key
+  ).filter(model.id == id).group_by(model.id, model.updated_at).first()
+  if row is None:
+    return None
+  return validators(row[:3], id, row[3], row[4])
 
-    @property
-    def upcoming_shows(self):
-      upcoming_shows = [show for show in self.shows
-                        if show.start_time > datetime.now()]
-      return upcoming_shows
 
-    @property
-    def num_upcoming_shows(self):
-      return len(self.upcoming_shows)
+#----------------------------------------------------------------------------#
+# Query plans.
+#----------------------------------------------------------------------------#
 
-    # TODO: implement any missing fields, as a database migration using Flask-Migrate
 
-    # TODO: implement any missing fields, as a database migration using Flask-Migrate
+def explain(statement):
+  '''
+  Returns the database's plan for statement as a list of lines and whether
+  every access to a table in it goes through an index.
+  '''
+  connection = db.session.connection()
+  compiled = statement.compile(dialect=connection.dialect)
+  params = compiled.construct_params()
+  if compiled.positional:
+    params = tuple(params[name] for name in compiled.positiontup)
+
+  if connection.dialect.name == 'postgresql':
+    lines = [row[0] for row in connection.exec_driver_sql('EXPLAIN ' + str(compiled), params)]
+    uses_index = not any('Seq Scan' in line for line in lines)
+  else:
+    lines = [row[-1] for row in connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + str(compiled), params)]
+    uses_index = all('USING' in line for line in lines if line.startswith(('SCAN', 'SEARCH')))
+  return lines, uses_index
 
-    # TODO Implement Show and Artist models, and complete all model relationships and properties, as a database migration.
 
+def explain_queries(now=None):
+  '''
+  EXPLAINs the show queries behind the detail and listing pages, the venue
+  typeahead, radius search and booking checks. The plans
+  only mean something on a realistically sized dataset, since planners
+  happily scan small tables.
+  '''
+  now = now or datetime.now()
+  venue_id = db.session.query(db.func.min(Show.venue_id)).scalar() or 1
+  artist_id = db.session.query(db.func.min(Show.artist_id)).scalar() or 1
+  cursor = [now, 0]
+  queries = {
+    'venue shows': Show.query.filter(Show.venue_id == venue_id).order_by(Show.start_time),
+    'artist shows': Show.query.filter(Show.artist_id == artist_id).order_by(Show.start_time),
+    'venue upcoming count': db.session.query(db.func.count(Show.id)).filter(
+      Show.venue_id == venue_id, Show.start_time > now),
+    'artist upcoming count': db.session.query(db.func.count(Show.id)).filter(
+      Show.artist_id == artist_id, Show.start_time > now),
+    'shows page': Show.query.filter(
+      db.tuple_(Show.start_time, Show.id) > tuple(cursor)
+    ).order_by(Show.start_time, Show.id).limit(current_app.config.get('PAGE_SIZE', 50)),
+    'started shows window': db.session.query(Show.venue_id).filter(
+      Show.start_time > now - timedelta(hours=1), Show.start_time <= now),
+    'venue name lookup': prefix_lookup_query(Venue, 'the').limit(current_app.config.get('LOOKUP_RESULT_LIMIT', 10)),
+    'venues near': venues_around(37.7749, -122.4194, 10),
+    'venue bookings': db.session.query(Show.start_time, Show.end_time, Show.id).filter(
+      Show.venue_id == venue_id, overlaps(now, now + timedelta(days=7))),
+  }
+  return [(name,) + explain(query.statement) for name, query in queries.items()]
 
-class Artist(db.Model):
-  __tablename__ = 'Artist'
 
-  id = db.Column(db.Integer, primary_key=True)
-  name = db.Column(db.String)
-  city = db.Column(db.String(120))
-  state = db.Column(db.String(120))
-  phone = db.Column(db.String(120))
-  genres = db.Column(db.ARRAY(db.String()))
-  image_link = db.Column(db.String(500))
-  facebook_link = db.Column(db.String(120))
+@bp.cli.command('explain-queries')
+def explain_queries_command():
+  '''Check that the show queries are planned as index scans.'''
+  failed = 0
+  for name, lines, uses_index in explain_queries():
+    click.echo('{} {}'.format('ok  ' if uses_index else 'SCAN', name))
+    for line in lines:
+      click.echo('      ' + line)
+    failed += not uses_index
+  if failed:
+    raise click.ClickException('{} queries do not use an index.'.format(failed))
 
-  # children = db.relationship('SomeChild', backref='some_parent')
-  shows = db.relationship('Show', backref='Artist', lazy=True)
 
+#----------------------------------------------------------------------------#
+# Bulk show import.
+#----------------------------------------------------------------------------#
 
-  website_link = db.Column(db.String(500))
-  seeking_venue = db.Column(db.Boolean, default=False, nullable=False)
-  seeking_description = db.Column(db.String(500), nullable=True)
+
+def read_show_records(stream, format='csv'):
+  '''
+  Yields (line number, record dict or error message) from a CSV (with an
+  artist_id,venue_id,start_time header) or NDJSON text stream, one line at
+  a time.
+  '''
+  if format == 'ndjson':
+    for line_number, line in enumerate(stream, 1):
+      if not line.strip():
+        continue
+      try:
+        record = json.loads(line)
+      except ValueError as e:
+        yield line_number, 'invalid JSON: {}'.format(e)
+        continue
+      yield line_number, record if isinstance(record, dict) else 'expected a JSON object'
+  else:
+    reader = csv.DictReader(stream)
+    for record in reader:
+      yield reader.line_num, record
 
 
-  @property
-  def past_shows(self):
-       past_shows = [show for show in self.shows
-                    if show.start_time < datetime.now()]
-       return past_shows
+def parse_time(value):
+  return value if isinstance(value, datetime) else dateutil.parser.parse(value)
 
 
-  @property
-  def num_past_shows(self):
-      return len(self.past_shows)
+def parse_show_record(record):
+  try:
+    start_time = parse_time(record['start_time'])
+    if record.get('end_time'):
+      end_time = parse_time(record['end_time'])
+    elif record.get('duration'):
+      end_time = start_time + timedelta(minutes=int(record['duration']))
+    else:
+      end_time = start_time + show_duration()
+    if end_time <= start_time:
+      return 'end_time must be after start_time'
+    return {
+      "artist_id": int(record['artist_id']),
+      "venue_id": int(record['venue_id']),
+      "start_time": start_time,
+      "end_time": end_time
+    }
+  except KeyError as e:
+    return 'missing {}'.format(e)
+  except (TypeError, ValueError, OverflowError) as e:
+    return 'invalid value: {}'.format(e)
 
-  @property
-  def upcoming_shows(self):
-      upcoming_shows = [show for show in self.shows
-                        if show.start_time > datetime.now()]
-      return upcoming_shows
 
-  @property
-  def num_upcoming_shows(self):
-      return len(self.upcoming_shows)
-    
+def insert_shows(rows):
+  '''
+  Inserts rows of Show column values in one round trip: COPY on PostgreSQL,
+  a single executemany elsewhere. Bypasses the ORM, so callers have to
+  recount the show counters themselves.
+  '''
+  connection = db.session.connection()
+  if connection.dialect.name == 'postgresql':
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    updated_at = datetime.utcnow().isoformat()
+    for row in rows:
+      writer.writerow([row['artist_id'], row['venue_id'], row['start_time'].isoformat(), row['end_time'].isoformat(),
+                       updated_at])
+    buffer.seek(0)
+    cursor = connection.connection.cursor()
+    cursor.copy_expert('COPY "Show" (artist_id, venue_id, start_time, end_time, updated_at) FROM STDIN WITH (FORMAT csv)',
+                       buffer)
+  else:
+    connection.execute(Show.__table__.insert(), rows)
 
-class Show(db.Model):
-  __tablename__ = 'Show'
 
-  id = db.Column(db.Integer, primary_key=True)
-  start_time = db.Column(db.DateTime, nullable=False)
-  artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id'), nullable=False)
-  venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id'), nullable=False)
+def batch_schedules(rows):
+  '''
+  IntervalIndexes of the existing bookings of the venues and artists of
+  rows over the period they span, keyed like schedule_indexes(), read with
+  one query.
+  '''
+  schedules = {}
+  for key in ('venue_id', 'artist_id'):
+    for row in rows:
+      schedules.setdefault((key, row[key]), [])
+  venue_ids = [id for key, id in schedules if key == 'venue_id']
+  artist_ids = [id for key, id in schedules if key == 'artist_id']
+  query = db.session.query(Show.id, Show.venue_id, Show.artist_id, Show.start_time, Show.end_time).filter(
+    db.or_(Show.venue_id.in_(venue_ids), Show.artist_id.in_(artist_ids)),
+    overlaps(min(row['start_time'] for row in rows), max(row['end_time'] for row in rows))
+  )
+  for show in query:
+    for key in ('venue_id', 'artist_id'):
+      booked = schedules.get((key, getattr(show, key)))
+      if booked is not None:
+        booked.append((show.id, show.start_time, show.end_time))
+  return {key: IntervalIndex(booked) for key, booked in schedules.items()}
+
+
+def import_show_batch(batch, report):
+  records = []
+  for line_number, record in batch:
+    row = parse_show_record(record) if isinstance(record, dict) else record
+    if isinstance(row, str):
+      report['errors'].append((line_number, row))
+    else:
+      records.append((line_number, row))
+
+  artist_ids = {row['artist_id'] for line_number, row in records}
+  venue_ids = {row['venue_id'] for line_number, row in records}
+  known_artists = {id for id, in db.session.query(Artist.id).filter(Artist.id.in_(artist_ids))}
+  known_venues = {id for id, in db.session.query(Venue.id).filter(Venue.id.in_(venue_ids))}
+
+  known = []
+  for line_number, row in records:
+    if row['artist_id'] not in known_artists:
+      report['errors'].append((line_number, 'unknown artist_id {}'.format(row['artist_id'])))
+    elif row['venue_id'] not in known_venues:
+      report['errors'].append((line_number, 'unknown venue_id {}'.format(row['venue_id'])))
+    else:
+      known.append((line_number, row))
+  if not known:
+    return
+
+  # double bookings, of existing shows or of earlier rows of the batch
+  schedules = batch_schedules([row for line_number, row in known])
+  booked = []
+  for line_number, row in known:
+    conflict = None
+    for key in ('venue_id', 'artist_id'):
+      booking = schedules[(key, row[key])].conflict(row['start_time'], row['end_time'])
+      if booking is not None:
+        conflict = (key, booking)
+        break
+    if conflict is not None:
+      report['errors'].append((line_number, conflict_message(conflict)))
+      continue
+    for key in ('venue_id', 'artist_id'):
+      schedules[(key, row[key])].add('line {}'.format(line_number), row['start_time'], row['end_time'])
+    booked.append((line_number, row))
+  if not booked:
+    return
+
+  rows = [row for line_number, row in booked]
+  try:
+    insert_shows(rows)
+    recount_show_counters(Venue, Show.venue_id, list({row['venue_id'] for row in rows}))
+    recount_show_counters(Artist, Show.artist_id, list({row['artist_id'] for row in rows}))
+    db.session.commit()
+  except SQLAlchemyError as e:
+    db.session.rollback()
+    error = str(getattr(e, 'orig', e))
+    report['errors'].extend((line_number, error) for line_number, row in booked)
+    return
+  forget_schedules({row['venue_id'] for row in rows}, {row['artist_id'] for row in rows})
+
+  report['inserted'] += len(rows)
+  report['venue_ids'].update(row['venue_id'] for row in rows)
+  report['artist_ids'].update(row['artist_id'] for row in rows)
+
+
+def import_shows(stream, format='csv', batch_size=None):
+  '''
+  Streams shows from stream into the database in batches, checking the
+  artist and venue ids of a whole batch with one query each. Bad rows are
+  reported as (line number, message) and skipped; the rest of the batch is
+  still imported. Each batch is committed on its own.
+  '''
+  batch_size = batch_size or current_app.config.get('BULK_IMPORT_BATCH_SIZE', 5000)
+  report = {"inserted": 0, "errors": [], "venue_ids": set(), "artist_ids": set()}
+  batch = []
+  for item in read_show_records(stream, format):
+    batch.append(item)
+    if len(batch) >= batch_size:
+      import_show_batch(batch, report)
+      batch = []
+  if batch:
+    import_show_batch(batch, report)
+
+  if report['inserted']:
+    page_cache.invalidate('shows', 'venues',
+                          *['venue:{}'.format(id) for id in report['venue_ids']] +
+                          ['artist:{}'.format(id) for id in report['artist_ids']])
+    schedule_venue_summary_refresh()
+  return {"inserted": report['inserted'], "errors": report['errors']}
+
+
+def import_format(filename, format=None):
+  if format:
+    return format
+  return 'ndjson' if filename.endswith(('.ndjson', '.jsonl')) else 'csv'
+
+
+@bp.cli.command('import-shows')
+@click.argument('file', type=click.File('r'))
+@click.option('--format', type=click.Choice(['csv', 'ndjson']), help='Defaults to the file extension.')
+@click.option('--batch-size', type=int, help='Rows per batch (BULK_IMPORT_BATCH_SIZE).')
+def import_shows_command(file, format, batch_size):
+  '''Bulk import shows from a CSV or NDJSON file.'''
+  result = import_shows(file, import_format(file.name, format), batch_size)
+  for line_number, error in result['errors']:
+    click.echo('line {}: {}'.format(line_number, error), err=True)
+  click.echo('{} shows imported, {} rows rejected.'.format(result['inserted'], len(result['errors'])))
 
 
 #----------------------------------------------------------------------------#
-# Filters.
+# Synthetic data.
 #----------------------------------------------------------------------------#
 
 
-def format_datetime(value, format='medium'):
-  #date = dateutil.parser.parse(value)
-  if isinstance(value, str):
-    date = dateutil.parser.parse(value)
-  else:
-    date = value
+def insert_batches(rows, insert, batch_size):
+  batch = []
+  for row in rows:
+    batch.append(row)
+    if len(batch) >= batch_size:
+      insert(batch)
+      db.session.commit()
+      batch = []
+  if batch:
+    insert(batch)
+    db.session.commit()
+
+
+def insert_catalog_rows(model, rows):
+  connection = db.session.connection()
+  connection.execute(model.__table__.insert(), rows)
+  link_genres(connection, model, rows)
+
+
+def seed_database(venues, artists, shows, seed=1, batch_size=None, anchor=None):
   '''
-  if format == 'full':
-      format = "EEEE MMMM, d, y 'at' h:mma"
-  elif format == 'medium':
-      format = "EE MM, dd, y h:mma"
+  Streams a deterministic synthetic catalog into the database in bulk
+  batches, after whatever is already there. The same seed and anchor (by
+  default today at midnight) always produce the same rows.
   '''
-  return babel.dates.format_datetime(date, format, locale='en')
+  batch_size = batch_size or current_app.config.get('BULK_IMPORT_BATCH_SIZE', 5000)
+  anchor = anchor or datetime.combine(datetime.now().date(), datetime.min.time())
+  rng = random.Random(seed)
+
+  first_venue = (db.session.query(db.func.max(Venue.id)).scalar() or 0) + 1
+  first_artist = (db.session.query(db.func.max(Artist.id)).scalar() or 0) + 1
+  insert_batches(generate_venues(venues, rng, first_venue),
+                 lambda rows: insert_catalog_rows(Venue, rows), batch_size)
+  insert_batches(generate_artists(artists, rng, first_artist),
+                 lambda rows: insert_catalog_rows(Artist, rows), batch_size)
+  if shows and venues and artists:
+    insert_batches(generate_shows(shows, rng, range(first_venue, first_venue + venues),
+                                  range(first_artist, first_artist + artists), anchor, duration=show_duration()),
+                   insert_shows, batch_size)
+
+  if db.engine.dialect.name == 'postgresql':
+    # ids were given explicitly, move the sequences past them
+    for table in ('Venue', 'Artist'):
+      db.session.connection().exec_driver_sql(
+        'SELECT setval(pg_get_serial_sequence(\'"{0}"\', \'id\'), (SELECT max(id) FROM "{0}"))'.format(table))
+  for model, foreign_key in COUNTED_MODELS:
+    recount_show_counters(model, foreign_key)
+  db.session.commit()
+  geocode_venues()
+  search_indexes().clear()
+  schedule_indexes().clear()
+  page_cache.clear()
+  schedule_venue_summary_refresh()
+
+
+@bp.cli.command('seed-data')
+@click.option('--venues', default=1000, help='Number of venues to add.')
+@click.option('--artists', default=1000, help='Number of artists to add.')
+@click.option('--shows', default=100000, help='Number of shows to add.')
+@click.option('--seed', default=1, help='Random seed; the same seed gives the same data.')
+@click.option('--batch-size', type=int, help='Rows per insert batch (BULK_IMPORT_BATCH_SIZE).')
+def seed_data_command(venues, artists, shows, seed, batch_size):
+  '''Load a deterministic synthetic catalog for benchmarks.'''
+  seed_database(venues, artists, shows, seed, batch_size)
+  click.echo('Added {} venues, {} artists and {} shows.'.format(venues, artists, shows))
+
+
+#----------------------------------------------------------------------------#
+# Filters.
+#----------------------------------------------------------------------------#
 
 
+# Shared by every app: results are memoized per (value, format, locale).
+format_datetime = DateTimeFormatter(locale='en')
 
-app.jinja_env.filters['datetime'] = format_datetime
 
 #----------------------------------------------------------------------------#
 # Controllers.
 #----------------------------------------------------------------------------#
 
-@app.route('/')
+@bp.before_app_request
+def set_request_now():
+  g.now = datetime.now()
+
+
+def conditional_response(page_validators):
+  '''
+  A response carrying page_validators: already an empty 304 when the
+  client's copy is current (never while flashes are pending), otherwise a
+  200 whose body the view renders with set_data().
+  '''
+  etag, last_modified = page_validators
+  response = Response(mimetype='text/html')
+  response.set_etag(etag)
+  if last_modified is not None:
+    # werkzeug would set None to the current time
+    response.last_modified = last_modified
+  response.cache_control.no_cache = True
+  if not session.get('_flashes'):
+    response.make_conditional(request)
+  return response
+
+
+@bp.route('/')
 def index():
   return render_template('pages/home.html')
 
@@ -170,7 +1785,9 @@ def index():
 #  Venues
 #  ----------------------------------------------------------------
 
-@app.route('/venues')
+@bp.route('/venues')
+@page_cache.cached('venues', 'genres')
+@replicas.read_only
 def venues():
   # TODO: replace with real venues data.
   #       num_shows should be aggregated based on number of upcoming shows per venue.
@@ -198,28 +1815,20 @@ def venues():
     }]
   }]
   '''
-  data = []
-  unique_city_state = Venue.query.with_entities(Venue.city, Venue.state).distinct().all()
-  for city_state in unique_city_state:
-    city = city_state[0]
-    state = city_state[1]
-    venues = Venue.query.filter_by(city=city, state=state).all()
-    shows = venues[0].upcoming_shows
-    #shows = db.relationship('Show', backref='venue', lazy=True)
-    data.append({
-      "city": city,
-      "state": state,
-      "venues": venues
-    })
-
-
-  return render_template('pages/venues.html', areas=data);
+  genre = request.args.get('genre')
+  data, page = venue_areas(request.args.get('after'), request.args.get('before'), genre=genre)
+  response = conditional_response(page_validators(page, 'updated_at', tags=['genres']))
+  if response.status_code == 304:
+    return response
+  response.set_data(render_template('pages/venues.html', areas=data, page=page, genres=genre_names(), genre=genre))
+  return response
 
 #  ----------------------------------------------------------------
 # Venue search
 #  ----------------------------------------------------------------
 
-@app.route('/venues/search', methods=['POST'])
+@bp.route('/venues/search', methods=['POST'])
+@replicas.read_only
 def search_venues():
   # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.
   # seach for Hop should return "The Musical Hop".
@@ -237,13 +1846,14 @@ def search_venues():
   '''
 
   search_term = request.form.get('search_term', '')
-  venues = Venue.query.filter(Venue.name.ilike('%' + search_term + '%'))
+  genre = request.form.get('genre')
+  venues = search_catalog(Venue, search_term, request.form.get('limit', type=int), genre)
   data = []
   for venue in venues:
     data.append({
       "id": venue.id,
       "name": venue.name,
-      "num_upcoming_shows": venue.num_upcoming_shows
+      "num_upcoming_shows": venue.upcoming_shows_count
     })
   count = len(data)
   response = {
@@ -251,13 +1861,16 @@ def search_venues():
     "data": data
   }
 
-  return render_template('pages/search_venues.html', results=response, search_term=search_term)
+  return render_template('pages/search_venues.html', results=response, search_term=search_term,
+                         genres=genre_names(), genre=genre)
 
 #  ----------------------------------------------------------------
 # Venue view
 #  ----------------------------------------------------------------
 
-@app.route('/venues/<int:venue_id>')
+@bp.route('/venues/<int:venue_id>')
+@page_cache.cached('venue:{venue_id}')
+@replicas.read_only
 def show_venue(venue_id):
   # shows the venue page with the given venue_id
   # TODO: replace with real venue data from the venues table, using venue_id
@@ -343,56 +1956,22 @@ def show_venue(venue_id):
   data = list(filter(lambda d: d['id'] == venue_id, [data1, data2, data3]))[0]
 '''
 
-  venue = Venue.query.get(venue_id)
-  if venue:
-    data = {
-      "id": venue.id,
-      "name": venue.name,
-      "genres": venue.genres,
-      "address": venue.address,
-      "city": venue.city,
-      "state": venue.state,
-      "phone": venue.phone,
-      "website": venue.website,
-      "facebook_link": venue.facebook_link,
-      "seeking_talent": True if venue.seeking_talent in (True, 't', 'True') else False,
-      "seeking_description": venue.seeking_description,
-      "image_link": venue.image_link if venue.image_link else "",
-      "past_shows_count": venue.num_past_shows,
-      "upcoming_shows_count": venue.num_upcoming_shows,
-    }
-
-  past_shows = []
-  for show in venue.past_shows:
-    artist = Artist.query.get(show.artist_id)
-    past_shows.append({
-      "artist_id": show.artist_id,
-      "artist_name": artist.name,
-      "artist_image_link": artist.image_link,
-      "start_time": str(show.start_time)
-    })
-
-  upcoming_shows = []
-  for show in venue.upcoming_shows:
-    artist = Artist.query.get(show.artist_id)
-    upcoming_shows.append({
-      "artist_id": show.artist_id,
-      "artist_name": artist.name,
-      "artist_image_link": artist.image_link,
-      "start_time": str(show.start_time)
-    })
-
-  data["past_shows"] = past_shows
-  data["upcoming_shows"] = upcoming_shows
+  page_validators = detail_validators(Venue, venue_id, Show.venue_id, Artist, Show.artist_id)
+  if page_validators is None:
+    abort(404)
+  response = conditional_response(page_validators)
+  if response.status_code == 304:
+    return response
 
-
-  return render_template('pages/show_venue.html', venue=data)
+  data = venue_detail(venue_id)
+  response.set_data(render_template('pages/show_venue.html', venue=data))
+  return response
 
 #  ----------------------------------------------------------------
 #  Create venue GET
 #  ----------------------------------------------------------------
 
-@app.route('/venues/create', methods=['GET'])
+@bp.route('/venues/create', methods=['GET'])
 def create_venue_form():
   form = VenueForm()
   return render_template('forms/new_venue.html', form=form)
@@ -404,7 +1983,7 @@ def create_venue_form():
 #  Create venue POST
 #  ----------------------------------------------------------------
 
-@app.route('/venues/create', methods=['POST'])
+@bp.route('/venues/create', methods=['POST'])
 def create_venue_submission():
   # TODO: insert form data as a new Venue record in the db, instead
   # TODO: modify data to be the data object returned from db insertion
@@ -421,6 +2000,7 @@ def create_venue_submission():
   try:
     db.session.add(venue)
     db.session.commit()
+    page_cache.invalidate('venues')
 
   # on successful db insert, flash success
     flash('Venue ' + request.form['name'] + ' was successfully listed!')
@@ -438,14 +2018,14 @@ def create_venue_submission():
   finally:
     db.session.close()
 
-  return redirect(url_for('venues'))
+  return redirect(url_for('main.venues'))
 
 
 #  ----------------------------------------------------------------
 #  Update venue GET
 #  ----------------------------------------------------------------
 
-@app.route('/venues/<int:venue_id>/edit', methods=['GET'])
+@bp.route('/venues/<int:venue_id>/edit', methods=['GET'])
 def edit_venue(venue_id):
   venue = Venue.query.get(venue_id)
   form = VenueForm(obj=venue)
@@ -475,7 +2055,7 @@ def edit_venue(venue_id):
 #  Update venue POST
 #  ----------------------------------------------------------------
 
-@app.route('/venues/<int:venue_id>/edit', methods=['POST'])
+@bp.route('/venues/<int:venue_id>/edit', methods=['POST'])
 def edit_venue_submission(venue_id):
   venue = Venue.query.get(venue_id)
   for field in request.form:
@@ -488,6 +2068,7 @@ def edit_venue_submission(venue_id):
   try:
     db.session.add(venue)
     db.session.commit()
+    page_cache.invalidate('venues', 'shows', *venue_page_tags(venue_id))
     flash('Venue ' + request.form['name'] + ' was successfully listed!')
 
   except SQLAlchemyError as e:
@@ -503,14 +2084,14 @@ def edit_venue_submission(venue_id):
   # TODO: take values from the form submitted, and update existing
   # venue record with ID <venue_id> using the new attributes
 
-  return redirect(url_for('show_venue', venue_id=venue_id))
+  return redirect(url_for('main.show_venue', venue_id=venue_id))
 
 
 #  ----------------------------------------------------------------
 #  Delete venue
 #  ----------------------------------------------------------------
 
-@app.route('/venues/<venue_id>', methods=['DELETE'])
+@bp.route('/venues/<venue_id>', methods=['DELETE'])
 def delete_venue(venue_id):
   # TODO: Complete this endpoint for taking a venue_id, and using
   # SQLAlchemy ORM to delete a record. Handle cases where the session commit could fail.
@@ -518,9 +2099,11 @@ def delete_venue(venue_id):
   # BONUS CHALLENGE: Implement a button to delete a Venue on a Venue Page, have it so that
   # clicking that button delete it from the db then redirect the user to the homepage
   venue = Venue.query.get(venue_id)
+  tags = venue_page_tags(venue_id)
   try:
     db.session.delete(venue)
     db.session.commit()
+    page_cache.invalidate('venues', 'shows', *tags)
     flash('Venue ' + venue.name + ' was successfully deleted!')
 
   except SQLAlchemyError as e:
@@ -541,10 +2124,21 @@ def delete_venue(venue_id):
 #  ----------------------------------------------------------------
 
 
-@app.route('/artists')
+@bp.route('/artists')
+@page_cache.cached('artists', 'genres')
+@replicas.read_only
 def artists():
-  artists = Artist.query.with_entities(Artist.id, Artist.name).all()
-  return render_template('pages/artists.html', artists=artists)
+  genre = request.args.get('genre')
+  query = Artist.query.with_entities(Artist.id, Artist.name, Artist.updated_at)
+  if genre:
+    query = query.filter(genre_filter(Artist, genre))
+  page = keyset_page(query, [Artist.id], request.args.get('after'), request.args.get('before'))
+  response = conditional_response(page_validators(page, 'updated_at', tags=['genres']))
+  if response.status_code == 304:
+    return response
+  response.set_data(render_template('pages/artists.html', artists=page.items, page=page,
+                                    genres=genre_names(), genre=genre))
+  return response
 
   # TODO: replace with real data returned from querying the database
 
@@ -568,28 +2162,31 @@ data=[{
 #  Artists search POST
 #  ----------------------------------------------------------------
 
-@app.route('/artists/search', methods=['POST'])
+@bp.route('/artists/search', methods=['POST'])
+@replicas.read_only
 def search_artists():
   # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.
   # seach for "A" should return "Guns N Petals", "Matt Quevado", and "The Wild Sax Band".
   # search for "band" should return "The Wild Sax Band".
 
   search_term = request.form.get('search_term', '')
-  artists = Artist.query.filter(Artist.name.ilike('%' + search_term + '%')).all()
+  genre = request.form.get('genre')
+  artists = search_catalog(Artist, search_term, request.form.get('limit', type=int), genre)
   data = []
   artist_count = len(artists)
   for artist in artists:
     data.append({
       "id": artist.id,
       "name": artist.name,
-      "num_upcoming_shows": artist.num_upcoming_shows
+      "num_upcoming_shows": artist.upcoming_shows_count
     })
 
   response = {
     "count": artist_count,
     "data": data
   }
-  return render_template('pages/search_artists.html', results=response, search_term=search_term)
+  return render_template('pages/search_artists.html', results=response, search_term=search_term,
+                         genres=genre_names(), genre=genre)
 
 '''
   response={
@@ -607,51 +2204,23 @@ def search_artists():
 #  Artists search VIEW
 #  ----------------------------------------------------------------
 
-@app.route('/artists/<int:artist_id>')
+@bp.route('/artists/<int:artist_id>')
+@page_cache.cached('artist:{artist_id}')
+@replicas.read_only
 def show_artist(artist_id):
   # shows the venue page with the given venue_id
   # TODO: replace with real venue data from the venues table, using venue_id
 
-  artist = Artist.query.get(artist_id)
-  past_shows = []
-  for show in artist.past_shows:
-    venue = Venue.query.get(show.venue_id)
-    past_shows.append({
-      "venue_id": venue.id,
-      "venue_name": venue.name,
-      "venue_image_link": venue.image_link,
-      "start_time": show.start_time
-    })
-  upcoming_shows = []
-  for show in artist.upcoming_shows:
-    venue = Venue.query.get(show.venue_id)
-    upcoming_shows.append({
-      "venue_id": venue.id,
-      "venue_name": venue.name,
-      "venue_image_link": venue.image_link,
-      "start_time": show.start_time
-    })
-  data = {
-    "id": artist.id,
-    "name": artist.name,
-    "genres": artist.genres,
-    "city": artist.city,
-    "state": artist.state,
-    "phone": artist.phone,
-    "seeking_venue": True if artist.seeking_venue in ('y', True, 't', 'True') else False,
-    "seeking_description": artist.seeking_description,
-    "image_link": artist.image_link,
-    # "https://images.unsplash.com/photo-1558369981-f9ca78462e61?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=794&q=80",
-    "facebook_link": artist.facebook_link,
-    "website_link": artist.website_link,
-    "past_shows": past_shows,
-    "upcoming_shows": upcoming_shows,
-    "past_shows_count": artist.num_past_shows,
-    "upcoming_shows_count": artist.num_upcoming_shows
-  }
-
+  page_validators = detail_validators(Artist, artist_id, Show.artist_id, Venue, Show.venue_id)
+  if page_validators is None:
+    abort(404)
+  response = conditional_response(page_validators)
+  if response.status_code == 304:
+    return response
 
-  return render_template('pages/show_artist.html', artist=data)
+  data = artist_detail(artist_id)
+  response.set_data(render_template('pages/show_artist.html', artist=data))
+  return response
 
 '''
   data1={
@@ -733,7 +2302,7 @@ def show_artist(artist_id):
 #  Artists Update - Edit (GET)
 #  ----------------------------------------------------------------
 
-@app.route('/artists/<int:artist_id>/edit', methods=['GET'])
+@bp.route('/artists/<int:artist_id>/edit', methods=['GET'])
 def edit_artist(artist_id):
   artist = Artist.query.get(artist_id)
   form = ArtistForm(obj=artist)
@@ -761,7 +2330,7 @@ def edit_artist(artist_id):
 #  Artists Update - Edit (POST)
 #  ----------------------------------------------------------------
 
-@app.route('/artists/<int:artist_id>/edit', methods=['POST'])
+@bp.route('/artists/<int:artist_id>/edit', methods=['POST'])
 def edit_artist_submission(artist_id):
   # TODO: take values from the form submitted, and update existing
   # artist record with ID <artist_id> using the new attributes
@@ -778,6 +2347,7 @@ def edit_artist_submission(artist_id):
   try:
     db.session.add(artist)
     db.session.commit()
+    page_cache.invalidate('artists', 'shows', *artist_page_tags(artist_id))
     flash('Artist ' + request.form['name'] + ' was successfully listed!')
 
   except SQLAlchemyError as e:
@@ -788,13 +2358,13 @@ def edit_artist_submission(artist_id):
   finally:
     db.session.close()
 
-  return redirect(url_for('show_artist', artist_id=artist_id))
+  return redirect(url_for('main.show_artist', artist_id=artist_id))
 
 #  ----------------------------------------------------------------
 #  Artists Create (GET)
 #  ----------------------------------------------------------------
 
-@app.route('/artists/create', methods=['GET'])
+@bp.route('/artists/create', methods=['GET'])
 def create_artist_form():
   form = ArtistForm()
   return render_template('forms/new_artist.html', form=form)
@@ -802,7 +2372,7 @@ def create_artist_form():
 #  ----------------------------------------------------------------
 #  Artists Create (POST)
 #  ----------------------------------------------------------------
-@app.route('/artists/create', methods=['POST'])
+@bp.route('/artists/create', methods=['POST'])
 def create_artist_submission():
   # called upon submitting the new artist listing form
   # TODO: insert form data as a new Venue record in the db, instead
@@ -820,6 +2390,7 @@ def create_artist_submission():
   try:
     db.session.add(artist)
     db.session.commit()
+    page_cache.invalidate('artists')
 
   # on successful db insert, flash success
     flash('Artist ' + request.form['name'] + ' was successfully listed!')
@@ -840,15 +2411,28 @@ def create_artist_submission():
 #  Shows
 #  ----------------------------------------------------------------
 
-@app.route('/shows')
+def stream_template(template_name, **context):
+  '''
+  Renders a template as a stream of chunks of SHOWS_STREAM_BUFFER
+  template output events, keeping the request context alive until the
+  last one is sent.
+  '''
+  current_app.update_template_context(context)
+  stream = current_app.jinja_env.get_template(template_name).stream(context)
+  stream.enable_buffering(current_app.config.get('SHOWS_STREAM_BUFFER', 100))
+  return Response(stream_with_context(stream), mimetype='text/html')
+
+
+@bp.route('/shows')
+@page_cache.cached('shows')
+@replicas.read_only
 def shows():
-  # displays list of shows at /shows
-  query = Show.query.join(
-    Venue, (Venue.id == Show.venue_id)
-  ).join(
-    Artist, (Artist.id == Show.artist_id)
-  ).with_entities(Show.venue_id, Venue.name.label('venue_name'), Show.artist_id, Artist.name.label('artist_name'),
-                  Artist.image_link, Show.start_time)
+  # displays list of shows at /shows; /shows?all=1 streams every show
+  if request.args.get('all'):
+    return stream_template('pages/shows.html', shows=stream_show_listing(request.args.get('after')), page=None)
+
+  page = keyset_page(show_listing_query(), [Show.start_time, Show.id],
+                     request.args.get('after'), request.args.get('before'))
 
   # TODO: replace with real venues data.
   #       num_shows should be aggregated based on number of upcoming shows per venue.
@@ -891,26 +2475,20 @@ def shows():
     "start_time": "2035-04-15T20:00:00.000Z"
   }]
   '''
-  data = []
-  for x in query:
-    data.append({
-      "venue_id": x.venue_id,
-      "venue_name": x.venue_name,
-      "artist_id": x.artist_id,
-      "artist_name": x.artist_name,
-      "artist_image_link": x.image_link,
-      "start_time": x.start_time
-    })
-  return render_template('pages/shows.html', shows=data)
+  response = conditional_response(page_validators(page, 'updated_at', 'venue_updated_at', 'artist_updated_at'))
+  if response.status_code == 304:
+    return response
 
+  data = [show_listing_item(x) for x in page.items]
+  response.set_data(render_template('pages/shows.html', shows=data, page=page))
+  return response
 
 
-@app.route('/shows/create')
+
+@bp.route('/shows/create')
 def create_shows():
   # renders form. do not touch.
   form = ShowForm()
-  form.artist_id.query = Artist.query
-  form.venue_id.choices = [(v.id, v.name + ' ({}, {})'.format(v.city, v.state)) for v in Venue.query]
   return render_template('forms/new_show.html', form=form)
 
 
@@ -918,20 +2496,35 @@ def create_shows():
 #  Show Create Post
 #  ----------------------------------------------------------------
 
-@app.route('/shows/create', methods=['POST'])
+@bp.route('/shows/create', methods=['POST'])
 def create_show_submission():
   # called to create new shows in the db, upon submitting new show listing form
   # TODO: insert form data as a new Show record in the db, instead
 
-  show = Show(
-    start_time=request.form.get('start_time'),
-    venue_id=request.form.get('venue_id'),
-    artist_id=request.form.get('artist_id')
-  )
+  record = parse_show_record(request.form)
+  if isinstance(record, str):
+    flash(record + '\nAn error occurred. Show could not be listed.')
+    return render_template('pages/home.html')
+  # the exclusion constraints still catch a booking that races this check
+  conflict = booking_conflict(record['venue_id'], record['artist_id'], record['start_time'], record['end_time'])
+  if conflict is not None:
+    flash('The ' + conflict_message(conflict) + '. Show could not be listed.')
+    return render_template('pages/home.html')
+  show = Show(**record)
 
   try:
     db.session.add(show)
+    if db.engine.dialect.name != 'postgresql':
+      # no constraints: check the table once the insert holds the write lock
+      db.session.flush()
+      conflict = booking_conflict(show.venue_id, show.artist_id, show.start_time, show.end_time,
+                                  exclude=show.id, indexed=False)
+      if conflict is not None:
+        db.session.rollback()
+        flash('The ' + conflict_message(conflict) + '. Show could not be listed.')
+        return render_template('pages/home.html')
     db.session.commit()
+    page_cache.invalidate('shows', 'venues', 'venue:{}'.format(show.venue_id), 'artist:{}'.format(show.artist_id))
 
   # on successful db insert, flash success
     flash('Show was successfully listed!')
@@ -947,24 +2540,317 @@ def create_show_submission():
 
   return render_template('pages/home.html')
 
-@app.errorhandler(404)
+
+#  ----------------------------------------------------------------
+#  Shows bulk import
+#  ----------------------------------------------------------------
+
+@bp.route('/shows/import', methods=['POST'])
+def import_shows_submission():
+  # streams an uploaded CSV/NDJSON file of shows into the db, see import_shows()
+  token = current_app.config.get('BULK_IMPORT_TOKEN')
+  if not token:
+    abort(403)
+  if not hmac.compare_digest(request.headers.get('Authorization', ''), 'Bearer ' + token):
+    abort(401)
+
+  upload = request.files.get('file')
+  if upload is None:
+    abort(400)
+  stream = io.TextIOWrapper(upload.stream, encoding='utf-8')
+  result = import_shows(stream, import_format(upload.filename or '', request.form.get('format')))
+  return jsonify({
+    "success": True,
+    "inserted": result['inserted'],
+    "errors": [{"line": line_number, "error": error} for line_number, error in result['errors']]
+  })
+
+#  ----------------------------------------------------------------
+#  JSON API
+#  ----------------------------------------------------------------
+
+# Fields of the /api/v1 listings, in output order; ?fields= picks a subset
+# and only those columns are queried.
+VENUE_FIELDS = ('id', 'name', 'genres', 'address', 'city', 'state', 'phone', 'website', 'facebook_link',
+                'seeking_talent', 'seeking_description', 'image_link', 'upcoming_shows_count', 'past_shows_count',
+                'latitude', 'longitude')
+ARTIST_FIELDS = ('id', 'name', 'genres', 'city', 'state', 'phone', 'website_link', 'facebook_link',
+                 'seeking_venue', 'seeking_description', 'image_link', 'upcoming_shows_count', 'past_shows_count')
+SHOW_FIELDS = ('id', 'venue_id', 'venue_name', 'artist_id', 'artist_name', 'artist_image_link', 'start_time')
+SEARCH_FIELDS = ('id', 'name', 'num_upcoming_shows')
+
+
+def api_fields(allowed):
+  try:
+    return requested_fields(allowed)
+  except ValueError as e:
+    abort(400, str(e))
+
+
+def api_listing(model, allowed):
+  fields = api_fields(allowed)
+  columns = [model.id] + [getattr(model, name) for name in fields or allowed if name != 'id']
+  query = db.session.query(*columns)
+  if request.args.get('genre'):
+    query = query.filter(genre_filter(model, request.args['genre']))
+  page = keyset_page(query, [model.id], request.args.get('after'), request.args.get('before'))
+  return json_response({
+    "data": [sparse(row._asdict(), fields) for row in page.items],
+    "next": page.next_cursor,
+    "prev": page.prev_cursor,
+  })
+
+
+def api_search(model):
+  fields = api_fields(SEARCH_FIELDS)
+  results = search_catalog(model, request.args.get('q', ''), request.args.get('limit', type=int),
+                           request.args.get('genre'))
+  return json_response({
+    "count": len(results),
+    "data": [sparse({
+      "id": row.id,
+      "name": row.name,
+      "num_upcoming_shows": row.upcoming_shows_count
+    }, fields) for row in results],
+  })
+
+
+def api_lookup(model):
+  choices = prefix_lookup(model, request.args.get('q', ''), request.args.get('limit', type=int))
+  return json_response({"data": [{"id": id, "label": label} for id, label in choices]})
+
+
+def api_detail(data):
+  if data is None:
+    abort(404)
+  return json_response(sparse(data, api_fields(list(data))))
+
+
+@api.route('/venues')
+@replicas.read_only
+def api_venues():
+  return api_listing(Venue, VENUE_FIELDS)
+
+
+@api.route('/venues/search')
+@replicas.read_only
+def api_search_venues():
+  return api_search(Venue)
+
+
+@api.route('/venues/near')
+@replicas.read_only
+def api_venues_near():
+  latitude = request.args.get('lat', type=float)
+  longitude = request.args.get('lng', type=float)
+  km = request.args.get('km', 10, type=float)
+  if latitude is None or longitude is None or not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+    abort(400, 'lat and lng must be a valid point')
+  if not 0 < km <= current_app.config.get('VENUES_NEAR_MAX_KM', 250):
+    abort(400, 'km must be between 0 and {}'.format(current_app.config.get('VENUES_NEAR_MAX_KM', 250)))
+  near = venues_near(latitude, longitude, km, request.args.get('limit', type=int))
+  return json_response({
+    "count": len(near),
+    "data": [dict(row._asdict(), distance_km=round(distance, 3)) for row, distance in near],
+  })
+
+
+@api.route('/venues/<int:venue_id>/free')
+@replicas.read_only
+def api_venue_free_slots(venue_id):
+  # ?from=&to= (a week from `from` by default), ?minutes= (SHOW_DEFAULT_DURATION)
+  # and ?artist_id= to only get the periods that artist is free too
+  try:
+    start_time = parse_time(request.args['from'])
+    end_time = parse_time(request.args['to']) if request.args.get('to') else start_time + timedelta(days=7)
+  except (KeyError, ValueError, OverflowError):
+    abort(400, 'from and to must be dates')
+  max_days = current_app.config.get('FREE_SLOTS_MAX_DAYS', 92)
+  if not start_time < end_time <= start_time + timedelta(days=max_days):
+    abort(400, 'to must be after from, by at most {} days'.format(max_days))
+  minutes = request.args.get('minutes', type=int)
+  if minutes is not None and minutes <= 0:
+    abort(400, 'minutes must be positive')
+  if db.session.query(Venue.id).filter(Venue.id == venue_id).scalar() is None:
+    abort(404)
+
+  slots = find_free_slots(venue_id, start_time, end_time, minutes and timedelta(minutes=minutes),
+                          request.args.get('artist_id', type=int))
+  return json_response({
+    "count": len(slots),
+    "data": [{"start_time": start, "end_time": end} for start, end in slots],
+  })
+
+
+@api.route('/venues/<int:venue_id>')
+@replicas.read_only
+def api_venue(venue_id):
+  return api_detail(venue_detail(venue_id))
+
+
+@api.route('/artists')
+@replicas.read_only
+def api_artists():
+  return api_listing(Artist, ARTIST_FIELDS)
+
+
+@api.route('/artists/search')
+@replicas.read_only
+def api_search_artists():
+  return api_search(Artist)
+
+
+@api.route('/artists/<int:artist_id>')
+@replicas.read_only
+def api_artist(artist_id):
+  return api_detail(artist_detail(artist_id))
+
+
+@api.route('/venues/lookup')
+@replicas.read_only
+def api_lookup_venues():
+  return api_lookup(Venue)
+
+
+@api.route('/artists/lookup')
+@replicas.read_only
+def api_lookup_artists():
+  return api_lookup(Artist)
+
+
+@api.route('/choices')
+@replicas.read_only
+def api_choices():
+  version, body = choices_snapshot()
+  return encoded_response(body, etag=version)
+
+
+@api.route('/shows')
+@replicas.read_only
+def api_shows():
+  fields = api_fields(SHOW_FIELDS)
+  page = keyset_page(show_listing_query(), [Show.start_time, Show.id],
+                     request.args.get('after'), request.args.get('before'))
+  return json_response({
+    "data": [sparse(show_listing_item(row), fields) for row in page.items],
+    "next": page.next_cursor,
+    "prev": page.prev_cursor,
+  })
+
+
+@api.route('/tasks/metrics')
+def api_task_metrics():
+  return json_response(task_queue.metrics())
+
+
+@api.errorhandler(400)
+@api.errorhandler(404)
+def api_error(error):
+  return json_response({"success": False, "error": error.code, "message": error.description}, error.code)
+
+
+@bp.app_errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
 
-@app.errorhandler(500)
+@bp.app_errorhandler(500)
 def server_error(error):
     return render_template('errors/500.html'), 500
 
 
-if not app.debug:
+
+#----------------------------------------------------------------------------#
+# App Factory.
+#----------------------------------------------------------------------------#
+
+def engine_options(config):
+  '''
+  create_engine() options from the DATABASE_* settings. The pool sizes
+  only apply to client/server databases (SQLite picks its own pool) and
+  the statement timeout only to PostgreSQL.
+  '''
+  backend = make_url(config['SQLALCHEMY_DATABASE_URI']).get_backend_name()
+  options = {"pool_pre_ping": config['DATABASE_POOL_PRE_PING']}
+  if backend == 'sqlite':
+    return options
+
+  options.update(
+    pool_size=config['DATABASE_POOL_SIZE'],
+    max_overflow=config['DATABASE_MAX_OVERFLOW'],
+    pool_recycle=config['DATABASE_POOL_RECYCLE'],
+  )
+  if backend == 'postgresql' and config['DATABASE_STATEMENT_TIMEOUT']:
+    options['connect_args'] = {"options": '-c statement_timeout={:d}'.format(config['DATABASE_STATEMENT_TIMEOUT'])}
+  return options
+
+
+def compile_templates(app):
+  '''
+  Loads every template under templates/, which compiles it into the
+  environment's in-memory cache and (with TEMPLATE_BYTECODE_CACHE) writes
+  its bytecode to TEMPLATE_CACHE_DIR for the next process. Returns the
+  template names.
+  '''
+  names = app.jinja_env.list_templates(extensions=['html'])
+  for name in names:
+    app.jinja_env.get_template(name)
+  return names
+
+
+@bp.cli.command('compile-templates')
+def compile_templates_command():
+  '''Precompile every template into the bytecode cache.'''
+  names = compile_templates(current_app)
+  click.echo('Compiled {} templates.'.format(len(names)))
+
+
+def create_app(config=None):
+  '''
+  Builds an app from config.py, updated with config: a dict of settings
+  or anything app.config.from_object() accepts.
+  '''
+  app = Flask(__name__)
+  app.config.from_object('config')
+  if isinstance(config, dict):
+    app.config.update(config)
+  elif config is not None:
+    app.config.from_object(config)
+  app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config))
+
+  moment.init_app(app)
+  replicas.init_app(app)
+  db.init_app(app)
+  migrate.init_app(app, db)
+  page_cache.init_app(app)
+  query_profiler.init_app(app)
+  task_queue.init_app(app)
+  app.register_blueprint(bp)
+  app.register_blueprint(api)
+  # in-process search and schedule indexes (see Search and Scheduling)
+  app.extensions['search_indexes'] = {}
+  app.extensions['schedule_indexes'] = {}
+  app.jinja_env.filters['datetime'] = format_datetime
+  if app.config['TEMPLATE_BYTECODE_CACHE']:
+    directory = app.config['TEMPLATE_CACHE_DIR']
+    if directory:
+      os.makedirs(directory, exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(directory)
+  if app.config['TEMPLATE_WARMUP']:
+    compile_templates(app)
+
+  if not app.debug:
     file_handler = FileHandler('error.log')
     file_handler.setFormatter(
-        Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
+      Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
     )
     app.logger.setLevel(logging.INFO)
     file_handler.setLevel(logging.INFO)
     app.logger.addHandler(file_handler)
     app.logger.info('errors')
+  return app
+
+
+app = create_app()
 
 #----------------------------------------------------------------------------#
 # Launch.
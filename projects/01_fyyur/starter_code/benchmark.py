@@ -0,0 +1,416 @@
+#----------------------------------------------------------------------------#
+# Route benchmarks.
+#
+#   python benchmark.py run --scale 100k --output results.json
+#   python benchmark.py compare baseline.json results.json --threshold 0.2
+#   python benchmark.py startup --output startup.json
+#   python benchmark.py render-shows --rows 1000
+#
+# `run` seeds a fresh database (a temporary SQLite file, or the PostgreSQL
+# database given by --database-url / BENCHMARK_DATABASE_URL) at the chosen
+# scale, drives every GET and POST route through the Flask test client and
+# writes p50/p95/p99 latency, query count and peak Python memory per route
+# as JSON. `compare` exits non-zero when a route got slower than the
+# threshold allows or runs more queries than before. `startup` times app
+# creation and the first response of every page in fresh processes, with a
+# cold (empty) and a warm Jinja bytecode cache, and with the warm cache plus
+# the startup template warm-up. `render-shows` measures how many /shows rows
+# per second the template renders with the plain babel datetime filter and
+# with the cached one.
+#----------------------------------------------------------------------------#
+
+import io
+import os
+import sys
+import json
+import shutil
+import statistics
+import subprocess
+import time
+import argparse
+import platform
+import tempfile
+import warnings
+import tracemalloc
+import itertools
+from datetime import datetime, timedelta
+
+SCALES = {
+  '1k': (100, 100, 1000),
+  '100k': (2000, 2000, 100000),
+  '1m': (10000, 10000, 1000000),
+}
+
+
+def percentile(samples, fraction):
+  ordered = sorted(samples)
+  return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def routes(venue_id, artist_id):
+  '''(name, method, url, request kwargs factory) for every GET and POST route.'''
+  venue = {
+    'name': 'Benchmark Hall', 'city': 'Austin', 'state': 'TX', 'address': '1 Main Street',
+    'phone': '512-000-0000', 'genres': 'Jazz', 'facebook_link': 'https://www.facebook.com/bench',
+  }
+  artist = {
+    'name': 'Benchmark Band', 'city': 'Austin', 'state': 'TX', 'phone': '512-000-0000',
+    'genres': 'Jazz', 'facebook_link': 'https://www.facebook.com/bench',
+  }
+  # every posted show gets a period of its own, or all but the first would
+  # time the double-booking rejection instead of an insert
+  periods = itertools.count()
+  start_time = lambda: (datetime(2035, 4, 1, 20) + timedelta(hours=3 * next(periods))).isoformat()
+  show = lambda: {'data': {'artist_id': artist_id, 'venue_id': venue_id, 'start_time': start_time()}}
+  shows_csv = lambda: {
+    'data': {'file': (io.BytesIO('artist_id,venue_id,start_time\n{},{},{}\n'.format(
+      artist_id, venue_id, start_time()).encode()), 'shows.csv')},
+    'headers': {'Authorization': 'Bearer benchmark'},
+  }
+  return [
+    ('GET /', 'get', '/', dict),
+    ('GET /venues', 'get', '/venues', dict),
+    ('GET /venues/<id>', 'get', '/venues/{}'.format(venue_id), dict),
+    ('GET /venues/create', 'get', '/venues/create', dict),
+    ('GET /venues/<id>/edit', 'get', '/venues/{}/edit'.format(venue_id), dict),
+    ('GET /artists', 'get', '/artists', dict),
+    ('GET /artists/<id>', 'get', '/artists/{}'.format(artist_id), dict),
+    ('GET /artists/create', 'get', '/artists/create', dict),
+    ('GET /artists/<id>/edit', 'get', '/artists/{}/edit'.format(artist_id), dict),
+    ('GET /shows', 'get', '/shows', dict),
+    ('GET /shows?all=1', 'get', '/shows?all=1', dict),
+    ('GET /shows/create', 'get', '/shows/create', dict),
+    ('GET /api/v1/venues', 'get', '/api/v1/venues', dict),
+    ('GET /api/v1/venues/<id>', 'get', '/api/v1/venues/{}'.format(venue_id), dict),
+    ('GET /api/v1/venues/search', 'get', '/api/v1/venues/search?q=hop', dict),
+    ('GET /api/v1/venues/lookup', 'get', '/api/v1/venues/lookup?q=the', dict),
+    ('GET /api/v1/venues/near', 'get', '/api/v1/venues/near?lat=30.2672&lng=-97.7431&km=25', dict),
+    ('GET /api/v1/venues/<id>/free', 'get',
+     '/api/v1/venues/{}/free?from=2035-03-01&to=2035-05-01&artist_id={}'.format(venue_id, artist_id), dict),
+    ('GET /api/v1/artists', 'get', '/api/v1/artists', dict),
+    ('GET /api/v1/artists/<id>', 'get', '/api/v1/artists/{}'.format(artist_id), dict),
+    ('GET /api/v1/artists/search', 'get', '/api/v1/artists/search?q=band', dict),
+    ('GET /api/v1/artists/lookup', 'get', '/api/v1/artists/lookup?q=the', dict),
+    ('GET /api/v1/choices', 'get', '/api/v1/choices', dict),
+    ('GET /api/v1/shows', 'get', '/api/v1/shows', dict),
+    ('POST /venues/search', 'post', '/venues/search', lambda: {'data': {'search_term': 'hop'}}),
+    ('POST /artists/search', 'post', '/artists/search', lambda: {'data': {'search_term': 'band'}}),
+    ('POST /venues/create', 'post', '/venues/create', lambda: {'data': venue}),
+    ('POST /venues/<id>/edit', 'post', '/venues/{}/edit'.format(venue_id), lambda: {'data': venue}),
+    ('POST /artists/create', 'post', '/artists/create', lambda: {'data': artist}),
+    ('POST /artists/<id>/edit', 'post', '/artists/{}/edit'.format(artist_id), lambda: {'data': artist}),
+    ('POST /shows/create', 'post', '/shows/create', show),
+    ('POST /shows/import', 'post', '/shows/import', shows_csv),
+  ]
+
+
+def measure(client, method, url, make_kwargs, iterations, db):
+  from profiler import recording
+
+  timings = []
+  for _ in range(iterations):
+    db.session.remove()
+    with recording() as profile:
+      started = time.perf_counter()
+      response = getattr(client, method)(url, **make_kwargs())
+      # streamed pages (/shows?all=1) only render while the body is read
+      response.get_data()
+      response.close()
+      timings.append(time.perf_counter() - started)
+    if response.status_code >= 500:
+      raise RuntimeError('{} {} returned {}'.format(method.upper(), url, response.status_code))
+
+  db.session.remove()
+  tracemalloc.start()
+  response = getattr(client, method)(url, **make_kwargs())
+  response.get_data()
+  response.close()
+  peak = tracemalloc.get_traced_memory()[1]
+  tracemalloc.stop()
+
+  return {
+    "p50_ms": round(percentile(timings, 0.50) * 1000, 3),
+    "p95_ms": round(percentile(timings, 0.95) * 1000, 3),
+    "p99_ms": round(percentile(timings, 0.99) * 1000, 3),
+    "queries": profile.count,
+    "peak_kb": round(peak / 1024.0, 1),
+  }
+
+
+def run(args):
+  database_url = args.database_url or os.environ.get('BENCHMARK_DATABASE_URL')
+  if not database_url:
+    database_url = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'benchmark.db')
+
+  from app import create_app, db, seed_database, Venue, Artist
+  app = create_app({
+    'SQLALCHEMY_DATABASE_URI': database_url,
+    'PAGE_CACHE_ENABLED': args.cache,
+    'QUERY_PROFILER_ENABLED': False,
+    'BULK_IMPORT_TOKEN': 'benchmark',
+  })
+  venues, artists, shows = SCALES[args.scale]
+
+  with app.app_context():
+    if db.engine.dialect.name == 'postgresql':
+      db.session.execute(db.text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+      db.session.commit()
+    dialect = db.engine.dialect.name
+    db.drop_all()
+    db.create_all()
+    started = time.perf_counter()
+    seed_database(venues, artists, shows, seed=args.seed)
+    seeded = time.perf_counter() - started
+    venue_id = db.session.query(db.func.min(Venue.id)).scalar()
+    artist_id = db.session.query(db.func.min(Artist.id)).scalar()
+
+    client = app.test_client()
+    results = {}
+    for name, method, url, make_kwargs in routes(venue_id, artist_id):
+      if args.route and not any(pattern in name for pattern in args.route):
+        continue
+      results[name] = measure(client, method, url, make_kwargs, args.iterations, db)
+      print('{:<30} p50 {p50_ms:>9.2f} ms  p95 {p95_ms:>9.2f} ms  p99 {p99_ms:>9.2f} ms  '
+            '{queries:>4} queries  {peak_kb:>9.1f} KiB'.format(name, **results[name]))
+
+  report = {
+    "meta": {
+      "scale": args.scale,
+      "venues": venues,
+      "artists": artists,
+      "shows": shows,
+      "database": dialect,
+      "iterations": args.iterations,
+      "seed_seconds": round(seeded, 2),
+      "python": platform.python_version(),
+      "date": datetime.now().isoformat(),
+    },
+    "routes": results,
+  }
+  if args.output:
+    with open(args.output, 'w') as f:
+      json.dump(report, f, indent=2, sort_keys=True)
+  return 0
+
+
+def compare(args):
+  with open(args.baseline) as f:
+    baseline = json.load(f)['routes']
+  with open(args.current) as f:
+    current = json.load(f)['routes']
+
+  regressions = 0
+  for name in sorted(set(baseline) & set(current)):
+    before, after = baseline[name], current[name]
+    slower = after[args.metric] > before[args.metric] * (1 + args.threshold)
+    more_queries = after['queries'] > before['queries']
+    flag = 'REGRESSED' if slower or more_queries else 'ok'
+    regressions += flag != 'ok'
+    print('{:<10}{:<30} {} {:.2f} -> {:.2f} ms, queries {} -> {}'.format(
+      flag, name, args.metric, before[args.metric], after[args.metric], before['queries'], after['queries']))
+  for name in sorted(set(baseline) ^ set(current)):
+    print('{:<10}{}'.format('missing', name))
+  return 1 if regressions else 0
+
+
+STARTUP_MODES = (
+  # (name, bytecode cache primed, TEMPLATE_WARMUP)
+  ('cold', False, False),
+  ('warm', True, False),
+  ('warm+warmup', True, True),
+)
+
+
+def seeded_database(scale, seed):
+  '''A temporary SQLite database seeded at scale; returns its URL.'''
+  from app import create_app, db, seed_database
+
+  url = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'benchmark.db')
+  app = create_app({'SQLALCHEMY_DATABASE_URI': url, 'TEMPLATE_WARMUP': False})
+  with app.app_context():
+    db.create_all()
+    seed_database(*SCALES[scale], seed=seed)
+    db.session.remove()
+  return url
+
+
+def first_response(args):
+  '''Runs in a fresh process: times create_app() and the first GET of args.url.'''
+  from app import create_app
+
+  started = time.perf_counter()
+  app = create_app({
+    'SQLALCHEMY_DATABASE_URI': args.database_url,
+    'PAGE_CACHE_ENABLED': False,
+    'TEMPLATE_BYTECODE_CACHE': True,
+    'TEMPLATE_CACHE_DIR': args.cache_dir,
+    'TEMPLATE_WARMUP': args.warmup,
+  })
+  created = time.perf_counter()
+  response = app.test_client().get(args.url)
+  responded = time.perf_counter()
+  if response.status_code != 200:
+    raise RuntimeError('GET {} returned {}'.format(args.url, response.status_code))
+  print(json.dumps({
+    "create_app_ms": round((created - started) * 1000, 3),
+    "first_response_ms": round((responded - created) * 1000, 3),
+  }))
+  return 0
+
+
+def startup(args):
+  database_url = seeded_database(args.scale, args.seed)
+  cache_dir = tempfile.mkdtemp()
+  pages = [(name, url) for name, method, url, make_kwargs in routes(1, 1)
+           if method == 'get' and not url.startswith('/api/')]
+  # the module-level app must not warm up (or touch the cache) on import
+  env = dict(os.environ, TEMPLATE_WARMUP='0', TEMPLATE_BYTECODE_CACHE='0', PYTHONWARNINGS='ignore',
+             DATABASE_URL=database_url, TEMPLATE_CACHE_DIR=cache_dir)
+
+  def child(url, warmup):
+    command = [sys.executable, os.path.abspath(__file__), 'first-response', '--database-url', database_url,
+               '--cache-dir', cache_dir, '--url', url] + (['--warmup'] if warmup else [])
+    result = subprocess.run(command, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if result.returncode:
+      raise RuntimeError(result.stderr.decode())
+    return json.loads(result.stdout.decode().strip().splitlines()[-1])
+
+  results = {}
+  for name, url in pages:
+    results[name] = {}
+    for mode, primed, warmup in STARTUP_MODES:
+      samples = []
+      for _ in range(args.repeat):
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        os.makedirs(cache_dir)
+        if primed:
+          child('/', True)
+        samples.append(child(url, warmup))
+      results[name][mode] = {
+        key: round(statistics.median(sample[key] for sample in samples), 3) for key in samples[0]
+      }
+    print('{:<30} '.format(name) + '  '.join(
+      '{} {:>7.1f} + {:>7.1f} ms'.format(mode, results[name][mode]['create_app_ms'],
+                                         results[name][mode]['first_response_ms'])
+      for mode, primed, warmup in STARTUP_MODES))
+
+  shutil.rmtree(cache_dir, ignore_errors=True)
+  report = {
+    "meta": {
+      "scale": args.scale,
+      "repeat": args.repeat,
+      "modes": [mode for mode, primed, warmup in STARTUP_MODES],
+      "python": platform.python_version(),
+      "date": datetime.now().isoformat(),
+    },
+    "routes": results,
+  }
+  if args.output:
+    with open(args.output, 'w') as f:
+      json.dump(report, f, indent=2, sort_keys=True)
+  return 0
+
+
+def babel_datetime(value, format='medium'):
+  '''The original filter: parse strings, then format with babel every time.'''
+  import babel.dates
+  import dateutil.parser
+
+  if isinstance(value, str):
+    value = dateutil.parser.parse(value)
+  return babel.dates.format_datetime(value, format, locale='en')
+
+
+def render_shows(args):
+  from app import create_app, db, seed_database, show_listing_query, show_listing_item, Show
+  from formatting import DateTimeFormatter
+
+  app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite://', 'TEMPLATE_WARMUP': False})
+  with app.app_context():
+    db.create_all()
+    seed_database(max(1, args.rows // 10), max(1, args.rows // 10), args.rows, seed=args.seed)
+    shows = [show_listing_item(row) for row in show_listing_query().order_by(Show.start_time, Show.id)]
+
+    with app.test_request_context('/shows'):
+      template = app.jinja_env.get_template('pages/shows.html')
+      formatter = DateTimeFormatter(locale='en')
+      variants = [
+        ('babel', babel_datetime),
+        ('cached, cold', formatter),
+        ('cached, warm', formatter),
+      ]
+      results = {}
+      for name, filter in variants:
+        app.jinja_env.filters['datetime'] = filter
+        timings = []
+        for _ in range(args.iterations):
+          if name == 'cached, cold':
+            formatter.cache_clear()
+            formatter.renderers.clear()
+          started = time.perf_counter()
+          template.render(shows=shows, page=None)
+          timings.append(time.perf_counter() - started)
+        results[name] = {
+          "median_ms": round(statistics.median(timings) * 1000, 3),
+          "rows_per_second": round(len(shows) / statistics.median(timings)),
+        }
+        print('{:<14} {:>10.2f} ms  {:>10} rows/s'.format(
+          name, results[name]['median_ms'], results[name]['rows_per_second']))
+    db.session.remove()
+
+  if args.output:
+    with open(args.output, 'w') as f:
+      json.dump({"rows": len(shows), "iterations": args.iterations, "filters": results}, f, indent=2)
+  return 0
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='Benchmark the Fyyur routes.')
+  commands = parser.add_subparsers(dest='command')
+  commands.required = True
+
+  run_parser = commands.add_parser('run', help='Seed a database and time every route.')
+  run_parser.add_argument('--scale', choices=sorted(SCALES), default='1k')
+  run_parser.add_argument('--iterations', type=int, default=20)
+  run_parser.add_argument('--seed', type=int, default=1)
+  run_parser.add_argument('--database-url', help='Defaults to a temporary SQLite file.')
+  run_parser.add_argument('--route', action='append', help='Only routes whose name contains this.')
+  run_parser.add_argument('--cache', action='store_true', help='Leave the page cache on.')
+  run_parser.add_argument('--output', help='Write the results to this JSON file.')
+  run_parser.set_defaults(handler=run)
+
+  compare_parser = commands.add_parser('compare', help='Fail if a route regressed.')
+  compare_parser.add_argument('baseline')
+  compare_parser.add_argument('current')
+  compare_parser.add_argument('--threshold', type=float, default=0.2, help='Allowed slowdown, 0.2 = 20%%.')
+  compare_parser.add_argument('--metric', choices=['p50_ms', 'p95_ms', 'p99_ms'], default='p95_ms')
+  compare_parser.set_defaults(handler=compare)
+
+  startup_parser = commands.add_parser('startup', help='Time to first response, cold and warm template cache.')
+  startup_parser.add_argument('--scale', choices=sorted(SCALES), default='1k')
+  startup_parser.add_argument('--seed', type=int, default=1)
+  startup_parser.add_argument('--repeat', type=int, default=3, help='Fresh processes per route and mode.')
+  startup_parser.add_argument('--output', help='Write the results to this JSON file.')
+  startup_parser.set_defaults(handler=startup)
+
+  render_parser = commands.add_parser('render-shows', help='/shows template rows per second per datetime filter.')
+  render_parser.add_argument('--rows', type=int, default=1000)
+  render_parser.add_argument('--iterations', type=int, default=5)
+  render_parser.add_argument('--seed', type=int, default=1)
+  render_parser.add_argument('--output', help='Write the results to this JSON file.')
+  render_parser.set_defaults(handler=render_shows)
+
+  first_parser = commands.add_parser('first-response')
+  first_parser.add_argument('--database-url', required=True)
+  first_parser.add_argument('--cache-dir', required=True)
+  first_parser.add_argument('--url', required=True)
+  first_parser.add_argument('--warmup', action='store_true')
+  first_parser.set_defaults(handler=first_response)
+
+  args = parser.parse_args(argv)
+  warnings.simplefilter('ignore', DeprecationWarning)
+  return args.handler(args)
+
+
+if __name__ == '__main__':
+  sys.exit(main())
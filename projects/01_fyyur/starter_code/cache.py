@@ -0,0 +1,150 @@
+#----------------------------------------------------------------------------#
+# Rendered page cache.
+#
+# GET pages are cached by their full path (route, entity id and query
+# string) under one or more tags, e.g. 'venues' or 'venue:3'. Each tag has
+# a random version stored next to the pages and the versions are part of
+# the page key, so invalidating a tag only means deleting its version: every
+# page rendered under the old version becomes unreachable and ages out of
+# the store.
+#
+# The store only needs get/set/delete/flushdb with redis-py semantics, so a
+# redis.Redis client (or any fake of one) can replace the in-process
+# MemoryCache default. Each app gets its own store unless one is passed in.
+#----------------------------------------------------------------------------#
+
+import json
+import time
+import uuid
+from collections import OrderedDict
+from functools import wraps
+from threading import Lock
+
+from flask import current_app, request, session, make_response
+
+# validators kept with a cached page, so cache hits still answer 304
+CACHED_HEADERS = ('ETag', 'Last-Modified', 'Cache-Control')
+
+
+def pack(response):
+  headers = {name: response.headers[name] for name in CACHED_HEADERS if name in response.headers}
+  return json.dumps(headers).encode() + b'\n' + response.get_data()
+
+
+def unpack(value):
+  headers, body = value.split(b'\n', 1)
+  response = make_response(body)
+  response.headers.extend(json.loads(headers))
+  return response
+
+
+class MemoryCache(object):
+  '''
+  Thread-safe in-process store with LRU eviction and per-key expiry,
+  exposing the subset of the redis-py client API used by PageCache.
+  '''
+
+  def __init__(self, max_entries=1024, default_ttl=None):
+    self.max_entries = max_entries
+    self.default_ttl = default_ttl
+    self.entries = OrderedDict()
+    self.lock = Lock()
+
+  def get(self, key):
+    with self.lock:
+      entry = self.entries.get(key)
+      if entry is None:
+        return None
+      value, expires = entry
+      if expires is not None and expires < time.time():
+        del self.entries[key]
+        return None
+      self.entries.move_to_end(key)
+      return value
+
+  def set(self, key, value, ex=None):
+    ttl = ex or self.default_ttl
+    with self.lock:
+      self.entries[key] = (value, time.time() + ttl if ttl else None)
+      self.entries.move_to_end(key)
+      while len(self.entries) > self.max_entries:
+        self.entries.popitem(last=False)
+    return True
+
+  def delete(self, *keys):
+    with self.lock:
+      return sum(1 for key in keys if self.entries.pop(key, None) is not None)
+
+  def flushdb(self):
+    with self.lock:
+      self.entries.clear()
+    return True
+
+
+class PageCache(object):
+
+  def __init__(self, app=None, backend=None):
+    self.backend = backend
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app):
+    app.config.setdefault('PAGE_CACHE_ENABLED', True)
+    app.config.setdefault('PAGE_CACHE_BACKEND', 'memory')
+    app.config.setdefault('PAGE_CACHE_REDIS_URL', 'redis://localhost:6379/0')
+    app.config.setdefault('PAGE_CACHE_TTL', 300)
+    app.config.setdefault('PAGE_CACHE_MAX_ENTRIES', 1024)
+
+    backend = self.backend
+    if backend is None:
+      if app.config['PAGE_CACHE_BACKEND'] == 'redis':
+        import redis
+        backend = redis.Redis.from_url(app.config['PAGE_CACHE_REDIS_URL'])
+      else:
+        backend = MemoryCache(app.config['PAGE_CACHE_MAX_ENTRIES'], app.config['PAGE_CACHE_TTL'])
+    app.extensions['page_cache'] = backend
+
+  @property
+  def store(self):
+    '''The backend of the current app.'''
+    return current_app.extensions['page_cache']
+
+  def version(self, tag):
+    version = self.store.get('tag:' + tag)
+    if version is None:
+      version = uuid.uuid4().hex
+      self.store.set('tag:' + tag, version)
+    return version.decode() if isinstance(version, bytes) else version
+
+  def cached(self, *tags):
+    '''
+    Caches the body and validators of a GET view under tags, which may use the view's
+    arguments as placeholders: @page_cache.cached('venue:{venue_id}').
+    Pages with pending flash messages are neither served from nor stored
+    in the cache, and streamed pages are not stored.
+    '''
+    def decorator(view):
+      @wraps(view)
+      def wrapper(*args, **kwargs):
+        if not current_app.config['PAGE_CACHE_ENABLED'] or session.get('_flashes'):
+          return view(*args, **kwargs)
+
+        versions = [self.version(tag.format(**kwargs)) for tag in tags]
+        key = 'page:' + request.full_path + ':' + '.'.join(versions)
+        value = self.store.get(key)
+        if value is not None:
+          return unpack(value).make_conditional(request)
+
+        response = make_response(view(*args, **kwargs))
+        if response.status_code == 200 and not response.is_streamed and not session.get('_flashes'):
+          self.store.set(key, pack(response), ex=current_app.config['PAGE_CACHE_TTL'])
+        return response
+      return wrapper
+    return decorator
+
+  def invalidate(self, *tags):
+    if tags:
+      self.store.delete(*['tag:' + tag for tag in tags])
+
+  def clear(self):
+    self.store.flushdb()
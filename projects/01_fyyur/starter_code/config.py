@@ -7,7 +7,97 @@ basedir = os.path.abspath(os.path.dirname(__file__))
 DEBUG = True
 
 # Connect to the database
+SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'postgresql://localhost:5432/fyyurapp')
+SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+# Connection pool, per app process (so per Gunicorn worker): pool_size
+# connections kept open plus up to max_overflow extra under load, recycled
+# after pool_recycle seconds and pinged before use if pre-ping is on.
+# Statements running longer than the timeout (milliseconds, PostgreSQL
+# only, 0 for none) are cancelled by the server.
+DATABASE_POOL_SIZE = int(os.environ.get('DATABASE_POOL_SIZE', 5))
+DATABASE_MAX_OVERFLOW = int(os.environ.get('DATABASE_MAX_OVERFLOW', 10))
+DATABASE_POOL_RECYCLE = int(os.environ.get('DATABASE_POOL_RECYCLE', 1800))
+DATABASE_POOL_PRE_PING = os.environ.get('DATABASE_POOL_PRE_PING', '1') == '1'
+DATABASE_STATEMENT_TIMEOUT = int(os.environ.get('DATABASE_STATEMENT_TIMEOUT', 0))
 
-# TODO IMPLEMENT DATABASE URL
-SQLALCHEMY_DATABASE_URI = '<Put your local database url>'
+# Read replicas (comma separated URLs) for the read-only pages and
+# searches. A client that commits a write reads from the primary for the
+# next DATABASE_REPLICA_STICKY seconds.
+DATABASE_REPLICA_URLS = [url for url in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if url]
+DATABASE_REPLICA_STICKY = int(os.environ.get('DATABASE_REPLICA_STICKY', 10))
+
+# Maximum number of venues/artists returned by a search
+SEARCH_RESULT_LIMIT = 50
+
+# Largest radius (km) accepted by /api/v1/venues/near
+VENUES_NEAR_MAX_KM = 250
+
+# Maximum number of venues/artists returned by a typeahead lookup
+LOOKUP_RESULT_LIMIT = 10
+
+# Length (minutes) of a show listed without an end time or duration, and
+# the longest date range /api/v1/venues/<id>/free searches (days)
+SHOW_DEFAULT_DURATION = 120
+FREE_SLOTS_MAX_DAYS = 92
+
+# Number of rows per page on the /venues, /artists and /shows listings
+PAGE_SIZE = 50
+
+# Serve /venues from the VenueAreaSummary materialized view (a table on
+# SQLite) instead of the Venue table. A task refreshes it this many seconds
+# after a commit that touches venues or shows (None: only `flask
+# refresh-venue-summary` does, e.g. from cron).
+VENUES_FROM_SUMMARY = os.environ.get('VENUES_FROM_SUMMARY') == '1'
+VENUE_SUMMARY_REFRESH_DELAY = 5
+
+# Rendered page cache: 'memory' (per process, LRU) or 'redis'
+PAGE_CACHE_ENABLED = True
+PAGE_CACHE_BACKEND = 'memory'
+PAGE_CACHE_REDIS_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+PAGE_CACHE_TTL = 300
+PAGE_CACHE_MAX_ENTRIES = 1024
+
+# Bulk show import: rows per batch, and the bearer token required by
+# POST /shows/import (the route is disabled while it is unset)
+BULK_IMPORT_BATCH_SIZE = 5000
+BULK_IMPORT_TOKEN = os.environ.get('BULK_IMPORT_TOKEN')
+
+# Per-request SQL profiling (X-Query-Profile header and a log line), and
+# the debug panel rendered at the bottom of every page
+QUERY_PROFILER_ENABLED = os.environ.get('QUERY_PROFILER') == '1'
+QUERY_PROFILER_TOOLBAR = DEBUG
+QUERY_PROFILER_N_PLUS_ONE = 3
+
+# JSON API: bodies at least this many bytes long are gzip/brotli compressed
+API_COMPRESS_MIN_SIZE = 500
+API_GZIP_LEVEL = 6
+API_BROTLI_QUALITY = 5
+
+# Post-commit task queue: 'thread' (in-process), 'sqlite' (durable, in the
+# TASK_QUEUE_PATH file, shared by every process using it) or 'eager' (run
+# inline). Failed jobs are retried TASK_QUEUE_MAX_RETRIES times, after
+# TASK_QUEUE_BACKOFF seconds and then twice as long each time.
+TASK_QUEUE_BACKEND = os.environ.get('TASK_QUEUE_BACKEND', 'thread')
+TASK_QUEUE_PATH = os.environ.get('TASK_QUEUE_PATH', os.path.join(basedir, 'tasks.sqlite'))
+TASK_QUEUE_WORKERS = int(os.environ.get('TASK_QUEUE_WORKERS', 2))
+TASK_QUEUE_MAX_RETRIES = 3
+TASK_QUEUE_BACKOFF = 1.0
+
+# Part of every page ETag: change it (e.g. per release) when templates change
+PAGE_VERSION = os.environ.get('RELEASE', '1')
+
+# Compiled templates are kept in a Jinja bytecode cache in TEMPLATE_CACHE_DIR
+# (the system temp directory when unset), so a restarted worker skips the
+# parse/compile step. TEMPLATE_WARMUP compiles every template when the app
+# is created instead of on the first request to each page; `flask
+# compile-templates` fills the cache at build time.
+TEMPLATE_BYTECODE_CACHE = os.environ.get('TEMPLATE_BYTECODE_CACHE', '1') == '1'
+TEMPLATE_CACHE_DIR = os.environ.get('TEMPLATE_CACHE_DIR')
+TEMPLATE_WARMUP = os.environ.get('TEMPLATE_WARMUP', '1') == '1'
+
+# /shows?all=1 streams every show: rows are fetched from a server-side
+# cursor this many at a time and the page is flushed every SHOWS_STREAM_BUFFER
+# template output events
+SHOWS_STREAM_BATCH_SIZE = 500
+SHOWS_STREAM_BUFFER = 100
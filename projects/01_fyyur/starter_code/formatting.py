@@ -0,0 +1,72 @@
+#----------------------------------------------------------------------------#
+# Cached datetime formatting for the Jinja `datetime` filter.
+#
+# babel.dates.format_datetime() resolves the locale and its date, time and
+# datetime patterns on every call, and the old filter ran every string
+# through dateutil first. Here each (format, locale) pair is resolved once
+# into a renderer holding the parsed babel patterns, datetimes are used as
+# they are (strings are still parsed, once), and whole results are memoized
+# in a bounded LRU: a page of shows repeats the same handful of start times.
+# The output is exactly babel's.
+#----------------------------------------------------------------------------#
+
+from functools import lru_cache
+
+import dateutil.parser
+from babel import Locale
+from babel.dates import UTC, format_date, format_time, get_date_format, get_datetime_format, \
+  get_time_format, parse_pattern
+
+NAMED_FORMATS = ('full', 'long', 'medium', 'short')
+
+
+def compile_format(format, locale):
+  '''Returns a function formatting an aware datetime with format in locale.'''
+  locale = Locale.parse(locale)
+  if format not in NAMED_FORMATS:
+    pattern = parse_pattern(format)
+    return lambda value: pattern.apply(value, locale)
+
+  template = get_datetime_format(format, locale=locale).replace("'", "")
+  date_pattern = parse_pattern(get_date_format(format, locale=locale))
+  time_pattern = parse_pattern(get_time_format(format, locale=locale))
+  return lambda value: template.replace(
+    '{0}', format_time(value, time_pattern, tzinfo=None, locale=locale)
+  ).replace(
+    '{1}', format_date(value, date_pattern, locale=locale)
+  )
+
+
+class DateTimeFormatter(object):
+  '''
+  Drop-in for babel.dates.format_datetime(value, format, locale=...) that
+  also accepts date strings. Naive datetimes are taken as UTC, as babel
+  does.
+  '''
+
+  def __init__(self, locale='en', max_entries=4096):
+    self.locale = locale
+    self.renderers = {}
+    self.memo = lru_cache(maxsize=max_entries)(self.render)
+
+  def __call__(self, value, format='medium', locale=None):
+    return self.memo(value, format, locale or self.locale)
+
+  def renderer(self, format, locale):
+    renderer = self.renderers.get((format, locale))
+    if renderer is None:
+      renderer = self.renderers[(format, locale)] = compile_format(format, locale)
+    return renderer
+
+  def render(self, value, format, locale):
+    if isinstance(value, str):
+      value = dateutil.parser.parse(value)
+    if value.tzinfo is None:
+      value = value.replace(tzinfo=UTC)
+    return self.renderer(format, locale)(value)
+
+  def cache_info(self):
+    return self.memo.cache_info()
+
+  def cache_clear(self):
+    self.memo.cache_clear()
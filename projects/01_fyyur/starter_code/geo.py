@@ -0,0 +1,119 @@
+#----------------------------------------------------------------------------#
+# Offline geocoding and geohash radius search.
+#
+# Venues are placed with gazetteer.csv, a bundled table of city/state
+# coordinates, so geocoding needs no network and no API key (and is only
+# as precise as the city). A point is indexed as its geohash: nearby
+# points share a prefix, so the venues within a radius are among those in
+# the 3x3 block of geohash cells around the center, cells at least as
+# large as the radius. Every cell is one range scan of an ordinary btree
+# index; the exact distance check runs on those candidates only.
+#----------------------------------------------------------------------------#
+
+import os
+import csv
+import math
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+EARTH_RADIUS_KM = 6371.0088
+
+GAZETTEER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gazetteer.csv')
+
+
+def encode(latitude, longitude, precision=12):
+  '''The geohash of a point, precision characters long.'''
+  lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+  chars, bits, value, even = [], 0, 0, True
+  while len(chars) < precision:
+    interval, coordinate = (lng_range, longitude) if even else (lat_range, latitude)
+    middle = (interval[0] + interval[1]) / 2
+    value <<= 1
+    if coordinate >= middle:
+      value |= 1
+      interval[0] = middle
+    else:
+      interval[1] = middle
+    even = not even
+    bits += 1
+    if bits == 5:
+      chars.append(BASE32[value])
+      bits, value = 0, 0
+  return ''.join(chars)
+
+
+def cell_size(precision):
+  '''(latitude, longitude) extent in degrees of a geohash cell.'''
+  lng_bits = (5 * precision + 1) // 2
+  lat_bits = 5 * precision // 2
+  return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lng_bits
+
+
+def cover(latitude, longitude, km):
+  '''
+  Geohash prefixes whose cells together contain every point within km of
+  the given one: the center cell and its neighbours at the finest
+  precision whose cells are still at least km across.
+  '''
+  lat_span = km / (math.pi * EARTH_RADIUS_KM / 180)
+  lng_span = lat_span / max(math.cos(math.radians(min(abs(latitude) + lat_span, 89.9))), 1e-6)
+  precision = 0
+  while precision < 12:
+    lat_cell, lng_cell = cell_size(precision + 1)
+    if lat_cell < lat_span or lng_cell < lng_span:
+      break
+    precision += 1
+  if precision == 0:
+    return ['']
+
+  lat_cell, lng_cell = cell_size(precision)
+  prefixes = set()
+  for dy in (-1, 0, 1):
+    for dx in (-1, 0, 1):
+      lat = min(max(latitude + dy * lat_cell, -90.0), 90.0)
+      lng = (longitude + dx * lng_cell + 180.0) % 360.0 - 180.0
+      prefixes.add(encode(lat, lng, precision))
+  return sorted(prefixes)
+
+
+def prefix_end(prefix):
+  '''The smallest geohash after every hash starting with prefix, or None.'''
+  chars = list(prefix)
+  while chars:
+    index = BASE32.index(chars[-1])
+    if index + 1 < len(BASE32):
+      chars[-1] = BASE32[index + 1]
+      return ''.join(chars)
+    chars.pop()
+  return None
+
+
+def distance_km(lat1, lng1, lat2, lng2):
+  '''Great-circle (haversine) distance between two points.'''
+  lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+  a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+  return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+class Gazetteer(object):
+  '''(city, state) -> (latitude, longitude), matched ignoring case and spacing.'''
+
+  def __init__(self, path=GAZETTEER_PATH):
+    self.path = path
+    self.places = None
+
+  @staticmethod
+  def key(city, state):
+    return ' '.join((city or '').lower().split()), (state or '').strip().upper()
+
+  def load(self):
+    if self.places is None:
+      with open(self.path, newline='') as stream:
+        self.places = {
+          self.key(row['city'], row['state']): (float(row['latitude']), float(row['longitude']))
+          for row in csv.DictReader(stream)
+        }
+    return self.places
+
+  def locate(self, city, state):
+    return self.load().get(self.key(city, state))
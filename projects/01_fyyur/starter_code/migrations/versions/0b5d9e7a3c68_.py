@@ -0,0 +1,29 @@
+"""Venue city and state NOT NULL
+
+Revision ID: 0b5d9e7a3c68
+Revises: f2c8a6d4b1e3
+Create Date: 2026-10-18 21:12:07.640195
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0b5d9e7a3c68'
+down_revision = 'f2c8a6d4b1e3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # /venues pages on (state, city, id) row values, which never match NULLs
+    op.execute('UPDATE "Venue" SET city = \'\' WHERE city IS NULL')
+    op.execute('UPDATE "Venue" SET state = \'\' WHERE state IS NULL')
+    op.alter_column('Venue', 'city', existing_type=sa.String(length=120), nullable=False)
+    op.alter_column('Venue', 'state', existing_type=sa.String(length=120), nullable=False)
+
+
+def downgrade():
+    op.alter_column('Venue', 'state', existing_type=sa.String(length=120), nullable=True)
+    op.alter_column('Venue', 'city', existing_type=sa.String(length=120), nullable=True)
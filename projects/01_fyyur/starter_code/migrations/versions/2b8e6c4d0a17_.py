@@ -0,0 +1,39 @@
+"""venue area summary materialized view
+
+Revision ID: 2b8e6c4d0a17
+Revises: 9d7e3b1f5a62
+Create Date: 2026-10-18 15:21:44.617093
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2b8e6c4d0a17'
+down_revision = '9d7e3b1f5a62'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # start_time is stored in local time, like the LOCALTIMESTAMP it is
+    # compared with; updated_at is the refresh time in UTC
+    op.execute(
+        'CREATE MATERIALIZED VIEW "VenueAreaSummary" AS '
+        'SELECT "Venue".id AS venue_id, "Venue".city, "Venue".state, "Venue".name, '
+        'count("Show".id) FILTER (WHERE "Show".start_time > LOCALTIMESTAMP) AS num_upcoming_shows, '
+        'timezone(\'utc\', now()) AS updated_at '
+        'FROM "Venue" LEFT OUTER JOIN "Show" ON "Show".venue_id = "Venue".id '
+        'GROUP BY "Venue".id, "Venue".city, "Venue".state, "Venue".name '
+        'WITH DATA'
+    )
+    # REFRESH ... CONCURRENTLY needs a unique index
+    op.create_index('ix_VenueAreaSummary_venue_id', 'VenueAreaSummary', ['venue_id'], unique=True)
+    # /venues keyset pages
+    op.create_index('ix_VenueAreaSummary_state_city_venue_id', 'VenueAreaSummary',
+                    ['state', 'city', 'venue_id'], unique=False)
+
+
+def downgrade():
+    op.execute('DROP MATERIALIZED VIEW "VenueAreaSummary"')
@@ -0,0 +1,30 @@
+"""composite indexes on Show
+
+Revision ID: 4e6b0f2a7c19
+Revises: c3a91e0b5d24
+Create Date: 2026-10-18 11:47:09.530127
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4e6b0f2a7c19'
+down_revision = 'c3a91e0b5d24'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # venue/artist detail pages and their past/upcoming counts
+    op.create_index('ix_Show_venue_id_start_time', 'Show', ['venue_id', 'start_time'], unique=False)
+    op.create_index('ix_Show_artist_id_start_time', 'Show', ['artist_id', 'start_time'], unique=False)
+    # /shows keyset pages, upcoming ranges and the counter roll-forward window
+    op.create_index('ix_Show_start_time_id', 'Show', ['start_time', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_Show_start_time_id', table_name='Show')
+    op.drop_index('ix_Show_artist_id_start_time', table_name='Show')
+    op.drop_index('ix_Show_venue_id_start_time', table_name='Show')
@@ -0,0 +1,28 @@
+"""lower(name) indexes for the typeahead lookups
+
+Revision ID: 6c1f9a3e7b52
+Revises: 2b8e6c4d0a17
+Create Date: 2026-10-18 16:08:12.390554
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6c1f9a3e7b52'
+down_revision = '2b8e6c4d0a17'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # text_pattern_ops lets LIKE 'prefix%' use the index under any collation
+    for table in ('Venue', 'Artist'):
+        op.create_index('ix_{}_lower_name'.format(table), table,
+                        [sa.text('lower(name) text_pattern_ops')], unique=False)
+
+
+def downgrade():
+    for table in ('Artist', 'Venue'):
+        op.drop_index('ix_{}_lower_name'.format(table), table_name=table)
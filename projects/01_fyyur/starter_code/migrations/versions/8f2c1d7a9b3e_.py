@@ -0,0 +1,35 @@
+"""show counters on Venue and Artist
+
+Revision ID: 8f2c1d7a9b3e
+Revises: 5337c0eb33c6
+Create Date: 2026-10-18 10:12:31.408215
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8f2c1d7a9b3e'
+down_revision = '5337c0eb33c6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table, foreign_key in (('Venue', 'venue_id'), ('Artist', 'artist_id')):
+        op.add_column(table, sa.Column('upcoming_shows_count', sa.Integer(), server_default='0', nullable=False))
+        op.add_column(table, sa.Column('past_shows_count', sa.Integer(), server_default='0', nullable=False))
+        op.execute(
+            'UPDATE "{table}" SET '
+            'upcoming_shows_count = (SELECT count(*) FROM "Show" WHERE "Show".{fk} = "{table}".id '
+            'AND "Show".start_time > LOCALTIMESTAMP), '
+            'past_shows_count = (SELECT count(*) FROM "Show" WHERE "Show".{fk} = "{table}".id '
+            'AND "Show".start_time < LOCALTIMESTAMP)'.format(table=table, fk=foreign_key)
+        )
+
+
+def downgrade():
+    for table in ('Venue', 'Artist'):
+        op.drop_column(table, 'past_shows_count')
+        op.drop_column(table, 'upcoming_shows_count')
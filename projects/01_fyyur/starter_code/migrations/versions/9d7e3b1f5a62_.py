@@ -0,0 +1,29 @@
+"""updated_at version columns
+
+Revision ID: 9d7e3b1f5a62
+Revises: 4e6b0f2a7c19
+Create Date: 2026-10-18 14:02:37.208511
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d7e3b1f5a62'
+down_revision = '4e6b0f2a7c19'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # existing rows start out as modified now (in UTC, like the values the
+    # app writes on every insert and update from here on)
+    for table in ('Venue', 'Artist', 'Show'):
+        op.add_column(table, sa.Column('updated_at', sa.DateTime(), nullable=False,
+                                       server_default=sa.text("timezone('utc', now())")))
+
+
+def downgrade():
+    for table in ('Show', 'Artist', 'Venue'):
+        op.drop_column(table, 'updated_at')
@@ -0,0 +1,60 @@
+"""Genre table with venue and artist links
+
+Revision ID: a4d2e8c6f031
+Revises: 6c1f9a3e7b52
+Create Date: 2026-10-18 17:26:51.074382
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4d2e8c6f031'
+down_revision = '6c1f9a3e7b52'
+branch_labels = None
+depends_on = None
+
+# the genre names of a row, for the ARRAY column as well as the older
+# VARCHAR one holding an array literal: translate() drops the braces and
+# quotes, what is left is split on commas
+GENRE_NAMES = "trim(unnest(string_to_array(translate(genres::text, '{}\"', ''), ',')))"
+
+
+def upgrade():
+    op.create_table('Genre',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=120), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    for table, owner in (('Venue', 'venue_id'), ('Artist', 'artist_id')):
+        op.create_table(table + 'Genre',
+        sa.Column('genre_id', sa.Integer(), nullable=False),
+        sa.Column(owner, sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['genre_id'], ['Genre.id'], ),
+        sa.ForeignKeyConstraint([owner], [table + '.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('genre_id', owner)
+        )
+        op.create_index('ix_{}Genre_{}'.format(table, owner), table + 'Genre', [owner], unique=False)
+
+    # backfill from the genres columns, which stay as the displayed lists
+    op.execute(
+        'INSERT INTO "Genre" (name) SELECT DISTINCT name FROM ('
+        'SELECT {0} AS name FROM "Venue" UNION SELECT {0} FROM "Artist"'
+        ") AS names WHERE name <> ''".format(GENRE_NAMES)
+    )
+    for table, owner in (('Venue', 'venue_id'), ('Artist', 'artist_id')):
+        op.execute(
+            'INSERT INTO "{0}Genre" (genre_id, {1}) SELECT DISTINCT "Genre".id, names.id FROM ('
+            'SELECT id, {2} AS name FROM "{0}"'
+            ') AS names JOIN "Genre" ON "Genre".name = names.name'.format(table, owner, GENRE_NAMES)
+        )
+
+
+def downgrade():
+    op.drop_index('ix_ArtistGenre_artist_id', table_name='ArtistGenre')
+    op.drop_table('ArtistGenre')
+    op.drop_index('ix_VenueGenre_venue_id', table_name='VenueGenre')
+    op.drop_table('VenueGenre')
+    op.drop_table('Genre')
@@ -0,0 +1,36 @@
+"""trigram search on Venue and Artist
+
+Revision ID: c3a91e0b5d24
+Revises: 8f2c1d7a9b3e
+Create Date: 2026-10-18 11:03:52.114870
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3a91e0b5d24'
+down_revision = '8f2c1d7a9b3e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for table in ('Venue', 'Artist'):
+        op.add_column(table, sa.Column('search_text', sa.Text(), nullable=True))
+        # genres::text works for both the ARRAY and the older VARCHAR column,
+        # translate() blanks out the array punctuation
+        op.execute(
+            'UPDATE "{}" SET search_text = lower(concat_ws(\' \', name, city, state, '
+            'translate(genres::text, \'{{}}",\', \'    \')))'.format(table)
+        )
+        op.create_index('ix_{}_search_text'.format(table), table, ['search_text'], unique=False,
+                        postgresql_using='gin', postgresql_ops={'search_text': 'gin_trgm_ops'})
+
+
+def downgrade():
+    for table in ('Venue', 'Artist'):
+        op.drop_index('ix_{}_search_text'.format(table), table_name=table)
+        op.drop_column(table, 'search_text')
@@ -0,0 +1,32 @@
+"""Venue coordinates and geohash
+
+Revision ID: e7b3f1a9c845
+Revises: a4d2e8c6f031
+Create Date: 2026-10-18 18:40:03.512967
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7b3f1a9c845'
+down_revision = 'a4d2e8c6f031'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # filled in afterwards by `flask geocode-venues`
+    op.add_column('Venue', sa.Column('latitude', sa.Float(), nullable=True))
+    op.add_column('Venue', sa.Column('longitude', sa.Float(), nullable=True))
+    op.add_column('Venue', sa.Column('geohash', sa.String(length=12), nullable=True))
+    # radius searches scan a few geohash prefix ranges
+    op.create_index('ix_Venue_geohash', 'Venue', ['geohash'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_Venue_geohash', table_name='Venue')
+    op.drop_column('Venue', 'geohash')
+    op.drop_column('Venue', 'longitude')
+    op.drop_column('Venue', 'latitude')
@@ -0,0 +1,37 @@
+"""Show end times and double-booking exclusion constraints
+
+Revision ID: f2c8a6d4b1e3
+Revises: e7b3f1a9c845
+Create Date: 2026-10-18 19:55:41.208316
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2c8a6d4b1e3'
+down_revision = 'e7b3f1a9c845'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # existing shows get the default two hours
+    op.add_column('Show', sa.Column('end_time', sa.DateTime(), nullable=True))
+    op.execute('UPDATE "Show" SET end_time = start_time + interval \'2 hours\'')
+    op.alter_column('Show', 'end_time', nullable=False)
+    # a venue or an artist plays one show at a time; fails on existing
+    # double bookings, list them first with `flask check-show-conflicts`
+    op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    for column in ('venue_id', 'artist_id'):
+        op.execute(
+            'ALTER TABLE "Show" ADD CONSTRAINT "ex_Show_{0}_period" '
+            'EXCLUDE USING gist ({0} WITH =, tsrange(start_time, end_time) WITH &&)'.format(column)
+        )
+
+
+def downgrade():
+    op.drop_constraint('ex_Show_artist_id_period', 'Show')
+    op.drop_constraint('ex_Show_venue_id_period', 'Show')
+    op.drop_column('Show', 'end_time')
@@ -0,0 +1,147 @@
+#----------------------------------------------------------------------------#
+# Per-request SQL profiler and N+1 detector.
+#
+# Opt-in with QUERY_PROFILER_ENABLED. Every statement any engine runs while
+# a profile is active is timed through the cursor execute events. At the end
+# of a request the totals go to an X-Query-Profile response header and a
+# structured log line, and with QUERY_PROFILER_TOOLBAR they are also
+# rendered into the <!-- query-profile --> slot of layouts/main.html.
+# Statements that repeat with the same shape (same SQL once literals and IN
+# lists are folded) are reported as N+1 suspects.
+#
+# recording() runs the same profile around any block of code, which is what
+# the tests use to hold routes to a query budget.
+#----------------------------------------------------------------------------#
+
+import re
+import json
+import time
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+from flask import current_app, g, request, render_template
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+PANEL_SLOT = b'<!-- query-profile -->'
+
+PLACEHOLDER_LIST = re.compile(r'\(\s*(?:\?|%\(\w+\)s)(?:\s*,\s*(?:\?|%\(\w+\)s))*\s*\)')
+LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+WHITESPACE = re.compile(r'\s+')
+
+active = threading.local()
+
+
+def statement_shape(statement):
+  shape = LITERAL.sub('?', statement)
+  shape = PLACEHOLDER_LIST.sub('(?)', shape)
+  return WHITESPACE.sub(' ', shape).strip()
+
+
+class QueryProfile(object):
+
+  def __init__(self):
+    self.statements = []
+
+  @property
+  def count(self):
+    return len(self.statements)
+
+  @property
+  def total_time(self):
+    return sum(duration for statement, duration in self.statements)
+
+  def slowest(self, limit=5):
+    return sorted(self.statements, key=lambda item: -item[1])[:limit]
+
+  def repeated(self, threshold=3):
+    '''Statement shapes run at least threshold times, most frequent first.'''
+    shapes = Counter(statement_shape(statement) for statement, duration in self.statements)
+    return [(shape, count) for shape, count in shapes.most_common() if count >= threshold]
+
+  def summary(self, threshold=3, limit=5):
+    return {
+      "queries": self.count,
+      "db_time_ms": round(self.total_time * 1000, 2),
+      "slowest": [{"statement": statement, "ms": round(duration * 1000, 2)}
+                  for statement, duration in self.slowest(limit)],
+      "n_plus_one": [{"statement": shape, "count": count} for shape, count in self.repeated(threshold)],
+    }
+
+
+def profiles():
+  if not hasattr(active, 'profiles'):
+    active.profiles = []
+  return active.profiles
+
+
+@contextmanager
+def recording():
+  profile = QueryProfile()
+  profiles().append(profile)
+  try:
+    yield profile
+  finally:
+    profiles().remove(profile)
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+  if profiles():
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def stop_query_timer(conn, cursor, statement, parameters, context, executemany):
+  starts = conn.info.get('query_start')
+  if profiles() and starts:
+    duration = time.perf_counter() - starts.pop()
+    for profile in profiles():
+      profile.statements.append((statement, duration))
+
+
+class QueryProfiler(object):
+
+  def __init__(self, app=None):
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app):
+    app.config.setdefault('QUERY_PROFILER_ENABLED', False)
+    app.config.setdefault('QUERY_PROFILER_TOOLBAR', False)
+    app.config.setdefault('QUERY_PROFILER_N_PLUS_ONE', 3)
+    app.config.setdefault('QUERY_PROFILER_SLOWEST', 5)
+    app.before_request(self.start)
+    app.after_request(self.finish)
+    app.teardown_request(self.discard)
+
+  def start(self):
+    if current_app.config['QUERY_PROFILER_ENABLED']:
+      g.query_recording = recording()
+      g.query_profile = g.query_recording.__enter__()
+
+  def finish(self, response):
+    recorder = g.pop('query_recording', None)
+    if recorder is None:
+      return response
+    recorder.__exit__(None, None, None)
+    summary = g.query_profile.summary(current_app.config['QUERY_PROFILER_N_PLUS_ONE'],
+                                      current_app.config['QUERY_PROFILER_SLOWEST'])
+
+    response.headers['X-Query-Profile'] = 'count={}; time={}ms; n+1={}'.format(
+      summary['queries'], summary['db_time_ms'], len(summary['n_plus_one']))
+    current_app.logger.info('query_profile %s', json.dumps(dict(summary, method=request.method, path=request.path)))
+
+    if current_app.config['QUERY_PROFILER_TOOLBAR'] and response.mimetype == 'text/html' \
+        and not response.is_streamed:
+      body = response.get_data()
+      if PANEL_SLOT in body:
+        panel = render_template('layouts/query_profile.html', profile=summary).encode()
+        response.set_data(body.replace(PANEL_SLOT, panel))
+    return response
+
+  def discard(self, exc=None):
+    recorder = g.pop('query_recording', None)
+    if recorder is not None:
+      recorder.__exit__(None, None, None)
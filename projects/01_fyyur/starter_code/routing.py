@@ -0,0 +1,105 @@
+#----------------------------------------------------------------------------#
+# Read replica routing.
+#
+# Every URL in DATABASE_REPLICA_URLS becomes a 'replica<N>' bind. Views
+# decorated with @replicas.read_only run their reads against one of them,
+# picked at random per request; every other view, every flush and every
+# statement after the first flush of a request stay on the primary.
+#
+# Replicas lag behind, so a client that has just committed a write is kept
+# on the primary for DATABASE_REPLICA_STICKY seconds (a timestamp in its
+# signed session cookie) and always reads what it wrote. Without replicas
+# configured the read-only views simply use the primary.
+#----------------------------------------------------------------------------#
+
+import time
+import random
+from functools import wraps
+
+from flask import current_app, session, has_request_context
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import event, orm
+
+STICKY_KEY = '_primary_until'
+
+
+class RoutingSession(SignallingSession):
+  '''
+  Session that reads from the bind key in self.replica while it is set and
+  nothing has been flushed; writes and mapped __bind_key__ models keep
+  their usual engine.
+  '''
+
+  def __init__(self, db, **options):
+    self.db = db
+    self.replica = None
+    self.wrote = False
+    SignallingSession.__init__(self, db, **options)
+
+  def get_bind(self, mapper=None, clause=None):
+    if self.replica is None or self.wrote or self._flushing:
+      return SignallingSession.get_bind(self, mapper, clause)
+    if mapper is not None and mapper.persist_selectable.info.get('bind_key') is not None:
+      return SignallingSession.get_bind(self, mapper, clause)
+    return self.db.get_engine(self.app, bind=self.replica)
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def pin_to_primary(session, flush_context):
+  session.wrote = True
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def stick_to_primary(db_session):
+  if db_session.wrote and has_request_context() and current_app.extensions.get('replicas'):
+    session[STICKY_KEY] = time.time() + current_app.config['DATABASE_REPLICA_STICKY']
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+
+  def create_session(self, options):
+    return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+class ReplicaRouter(object):
+
+  def __init__(self, db, app=None):
+    self.db = db
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app):
+    app.config.setdefault('DATABASE_REPLICA_URLS', [])
+    app.config.setdefault('DATABASE_REPLICA_STICKY', 10)
+
+    binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+    keys = []
+    for number, url in enumerate(app.config['DATABASE_REPLICA_URLS'], 1):
+      key = 'replica{}'.format(number)
+      binds[key] = url
+      keys.append(key)
+    app.config['SQLALCHEMY_BINDS'] = binds or None
+    app.extensions['replicas'] = keys
+    app.teardown_request(self.release)
+
+  def read_only(self, view):
+    '''Runs the view's queries on a replica unless the client is sticky.'''
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+      self.use_replica()
+      return view(*args, **kwargs)
+    return wrapper
+
+  def use_replica(self):
+    replicas = current_app.extensions['replicas']
+    if replicas and session.get(STICKY_KEY, 0) < time.time():
+      db_session = self.db.session()
+      db_session.replica = random.choice(replicas)
+      db_session.wrote = False
+
+  def release(self, exc=None):
+    # the scoped session can outlive the request (e.g. in tests)
+    if self.db.session.registry.has():
+      db_session = self.db.session()
+      db_session.replica = None
+      db_session.wrote = False
@@ -0,0 +1,75 @@
+#----------------------------------------------------------------------------#
+# Show scheduling: double-booking checks and free slots.
+#
+# A show books its venue and its artist for the half-open period
+# [start_time, end_time). IntervalIndex holds the bookings of one of them
+# sorted by start, along with the running maximum of their ends, so the
+# bookings overlapping a period are found with two binary searches: the
+# candidates start before the period ends, and the first one that can
+# still be running is where the running maximum passes the period's start.
+# A lookup is O(log n) plus the overlaps found (none, for a free period).
+#----------------------------------------------------------------------------#
+
+import heapq
+from bisect import bisect_left, bisect_right
+
+
+class IntervalIndex(object):
+  '''The (start, end, id) bookings of one venue or artist; ids only need to be unique.'''
+
+  def __init__(self, bookings=()):
+    self.bookings = sorted(((start, end, id) for id, start, end in bookings), key=lambda booking: booking[:2])
+    self.starts = [start for start, end, id in self.bookings]
+    self.reach = []
+    self.extend_reach(0)
+
+  def __len__(self):
+    return len(self.bookings)
+
+  def extend_reach(self, position):
+    # reach[i] is the latest end among bookings[:i + 1]
+    del self.reach[position:]
+    latest = self.reach[-1] if self.reach else None
+    for start, end, id in self.bookings[position:]:
+      latest = end if latest is None or end > latest else latest
+      self.reach.append(latest)
+
+  def add(self, id, start, end):
+    position = bisect_right(self.starts, start)
+    self.bookings.insert(position, (start, end, id))
+    self.starts.insert(position, start)
+    self.extend_reach(position)
+
+  def overlapping(self, start, end):
+    '''Yields the (start, end, id) bookings overlapping [start, end), by start.'''
+    first = bisect_right(self.reach, start)
+    for position in range(first, bisect_left(self.starts, end)):
+      booking = self.bookings[position]
+      if booking[1] > start:
+        yield booking
+
+  def conflict(self, start, end, exclude=None):
+    '''The first booking other than exclude overlapping [start, end), or None.'''
+    for booking in self.overlapping(start, end):
+      if booking[2] != exclude:
+        return booking
+    return None
+
+
+def free_slots(busy, start, end, length):
+  '''
+  The (start, end) periods of at least length within [start, end) free of
+  every booking in busy, a list of iterables of (start, end, ...) sorted by
+  start (the bookings of a venue, and of an artist to play it).
+  '''
+  slots = []
+  cursor = start
+  for booking in heapq.merge(*busy, key=lambda booking: booking[0]):
+    if booking[0] >= end:
+      break
+    if booking[0] - cursor >= length:
+      slots.append((cursor, booking[0]))
+    cursor = max(cursor, booking[1])
+  if end - cursor >= length:
+    slots.append((cursor, end))
+  return slots
@@ -0,0 +1,138 @@
+#----------------------------------------------------------------------------#
+# In-process trigram search index.
+#
+# Used for venue/artist search when the database is not PostgreSQL (SQLite in
+# development and tests). It mimics pg_trgm: text is split into words, each
+# word is padded and cut into trigrams, and an inverted trigram -> ids map
+# narrows every search down to the documents sharing a trigram with the term,
+# so a lookup costs the same whatever the size of the table. Terms too short
+# to have a trigram of their own (one or two characters) can only match as a
+# substring, so every one- and two-character fragment of the text is
+# indexed as well and they are looked up the same way.
+#
+# An index only sees the writes made through it: the app keeps one per
+# process and rebuilds it when another one changes the table (see
+# search_index() in app.py). A lock guards it against concurrent requests.
+#----------------------------------------------------------------------------#
+
+import re
+from collections import defaultdict
+from threading import Lock
+
+WORD = re.compile(r'\w+', re.UNICODE)
+
+# pg_trgm's default word_similarity_threshold
+WORD_SIMILARITY_THRESHOLD = 0.6
+
+
+def search_text(*fields):
+  '''
+  Flattens the searchable fields of a row (strings or lists of strings)
+  into the single lowercase text that is indexed.
+  '''
+  words = []
+  for field in fields:
+    if not field:
+      continue
+    if isinstance(field, str):
+      words.append(field)
+    else:
+      words.extend(field)
+  return ' '.join(words).lower()
+
+
+def trigrams(text):
+  grams = set()
+  for word in WORD.findall(text.lower()):
+    padded = '  ' + word + ' '
+    grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+  return grams
+
+
+def fragments(text):
+  '''The one- and two-character substrings of text.'''
+  return set(text) | {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+def similarity(a, b):
+  if not a or not b:
+    return 0.0
+  return len(a & b) / float(len(a | b))
+
+
+class TrigramIndex(object):
+
+  def __init__(self, version=None):
+    # whatever the owner uses to tell whether the index is still current
+    self.version = version
+    self.docs = {}
+    self.postings = defaultdict(set)
+    self.fragments = defaultdict(set)
+    self.lock = Lock()
+
+  def __len__(self):
+    return len(self.docs)
+
+  def add(self, id, name, text):
+    text = text or ''
+    doc = (text, trigrams(name or ''), trigrams(text))
+    with self.lock:
+      self.discard(id)
+      self.docs[id] = doc
+      for gram in doc[2]:
+        self.postings[gram].add(id)
+      for fragment in fragments(text):
+        self.fragments[fragment].add(id)
+
+  def remove(self, id):
+    with self.lock:
+      self.discard(id)
+
+  def discard(self, id):
+    # callers hold the lock
+    doc = self.docs.pop(id, None)
+    if doc is None:
+      return
+    for postings, keys in ((self.postings, doc[2]), (self.fragments, fragments(doc[0]))):
+      for key in keys:
+        ids = postings[key]
+        ids.discard(id)
+        if not ids:
+          del postings[key]
+
+  def search(self, term, limit=None):
+    '''
+    Returns (id, score) pairs for documents containing term or whose words
+    are similar enough to it, best match first. The score adds the term's
+    similarity to the name to its word similarity to the whole text, so
+    names that are closer to the term rank higher.
+    '''
+    term = term.strip().lower()
+    term_grams = trigrams(term)
+    with self.lock:
+      if not term:
+        candidates = list(self.docs.items())
+      else:
+        # a single word of three or more characters shares a trigram with
+        # every match; a shorter one can only match as a substring, which
+        # starts with its first two characters; anything else may match
+        # either way
+        word = WORD.fullmatch(term)
+        ids = set()
+        if not word or len(term) < 3:
+          ids |= self.fragments.get(term[:2], set())
+        if not word or len(term) >= 3:
+          for gram in term_grams:
+            ids |= self.postings.get(gram, set())
+        candidates = [(id, self.docs[id]) for id in ids]
+
+    results = []
+    for id, (text, name_grams, text_grams) in candidates:
+      word_similarity = len(term_grams & text_grams) / float(len(term_grams)) if term_grams else 0.0
+      if term not in text and word_similarity < WORD_SIMILARITY_THRESHOLD:
+        continue
+      score = word_similarity + similarity(term_grams, name_grams)
+      results.append((id, score))
+
+    results.sort(key=lambda result: (-result[1], result[0]))
+    return results[:limit] if limit else results
@@ -0,0 +1,123 @@
+#----------------------------------------------------------------------------#
+# Deterministic synthetic venues, artists and shows.
+#
+# Every generator draws from the random.Random it is given and yields one
+# row dict at a time, so the same seed always produces the same catalog and
+# any scale can be streamed into the database in batches with constant
+# memory (see seed_database() in app.py).
+#----------------------------------------------------------------------------#
+
+from datetime import timedelta
+
+from search import search_text
+
+GENRES = [
+  'Alternative', 'Blues', 'Classical', 'Country', 'Electronic', 'Folk', 'Funk',
+  'Hip-Hop', 'Heavy Metal', 'Instrumental', 'Jazz', 'Musical Theatre', 'Pop',
+  'Punk', 'R&B', 'Reggae', 'Rock n Roll', 'Soul', 'Other',
+]
+
+CITIES = [
+  ('San Francisco', 'CA'), ('Los Angeles', 'CA'), ('San Diego', 'CA'), ('New York', 'NY'),
+  ('Brooklyn', 'NY'), ('Austin', 'TX'), ('Houston', 'TX'), ('Chicago', 'IL'), ('Seattle', 'WA'),
+  ('Portland', 'OR'), ('Denver', 'CO'), ('Nashville', 'TN'), ('Atlanta', 'GA'), ('Miami', 'FL'),
+  ('Boston', 'MA'), ('Philadelphia', 'PA'), ('New Orleans', 'LA'), ('Detroit', 'MI'),
+  ('Minneapolis', 'MN'), ('Washington', 'DC'),
+]
+
+ADJECTIVES = [
+  'Dueling', 'Musical', 'Wild', 'Velvet', 'Electric', 'Golden', 'Crimson', 'Hidden', 'Blue',
+  'Lucky', 'Silver', 'Midnight', 'Rusty', 'Neon', 'Painted', 'Humble', 'Roaring', 'Quiet',
+]
+
+NOUNS = [
+  'Pianos', 'Hop', 'Sax', 'Petals', 'Owls', 'Lanterns', 'Foxes', 'Rivers', 'Echoes', 'Anchors',
+  'Comets', 'Harbors', 'Pines', 'Sparrows', 'Wolves', 'Engines', 'Tides', 'Ravens',
+]
+
+VENUE_KINDS = ['Bar', 'Hall', 'Club', 'Lounge', 'Theatre', 'Live Music & Coffee', 'Ballroom']
+ARTIST_KINDS = ['Band', 'Trio', 'Quartet', 'Collective', 'Orchestra', 'Project', 'Ensemble']
+STREETS = ['Folsom Street', 'Delancey Street', 'Whiskey Moore Ave', 'Main Street', 'Market Street']
+
+
+def pick_genres(rng):
+  return rng.sample(GENRES, rng.randint(1, 3))
+
+
+def generate_venues(count, rng, first_id=1):
+  for id in range(first_id, first_id + count):
+    city, state = rng.choice(CITIES)
+    name = 'The {} {} {}'.format(rng.choice(ADJECTIVES), rng.choice(NOUNS), rng.choice(VENUE_KINDS))
+    genres = pick_genres(rng)
+    yield {
+      "id": id,
+      "name": name,
+      "genres": genres,
+      "address": '{} {}'.format(rng.randint(1, 9999), rng.choice(STREETS)),
+      "city": city,
+      "state": state,
+      "phone": '{:03d}-{:03d}-{:04d}'.format(rng.randint(200, 999), rng.randint(0, 999), rng.randint(0, 9999)),
+      "website": 'https://www.venue{}.com'.format(id),
+      "facebook_link": 'https://www.facebook.com/venue{}'.format(id),
+      "seeking_talent": rng.random() < 0.3,
+      "seeking_description": None,
+      "image_link": None,
+      "search_text": search_text(name, city, state, genres),
+    }
+
+
+def generate_artists(count, rng, first_id=1):
+  for id in range(first_id, first_id + count):
+    city, state = rng.choice(CITIES)
+    name = '{} {} {}'.format(rng.choice(ADJECTIVES), rng.choice(NOUNS), rng.choice(ARTIST_KINDS))
+    genres = pick_genres(rng)
+    yield {
+      "id": id,
+      "name": name,
+      "city": city,
+      "state": state,
+      "phone": '{:03d}-{:03d}-{:04d}'.format(rng.randint(200, 999), rng.randint(0, 999), rng.randint(0, 9999)),
+      "genres": genres,
+      "image_link": None,
+      "facebook_link": 'https://www.facebook.com/artist{}'.format(id),
+      "website_link": 'https://www.artist{}.com'.format(id),
+      "seeking_venue": rng.random() < 0.3,
+      "seeking_description": None,
+      "search_text": search_text(name, city, state, genres),
+    }
+
+
+def generate_shows(count, rng, venue_ids, artist_ids, anchor, days=365, upcoming_share=0.3,
+                   duration=timedelta(hours=2)):
+  '''
+  Yields shows between random venues and artists (ids drawn from the given
+  ranges), starting on the hour within `days` of anchor, about
+  upcoming_share of them after it, each lasting duration. Draws that would
+  double-book a venue or an artist are skipped, so never ask for more
+  shows than there are free hours.
+  '''
+  hours = max(1, -(-int(duration.total_seconds()) // 3600))
+  span = 2 * (days * 24 + hours)
+  # (venue or artist, start hour) of every show so far: two shows of the
+  # same one overlap when they start less than `hours` apart
+  booked = set()
+  produced = 0
+  while produced < count:
+    if rng.random() < upcoming_share:
+      hour = rng.randint(1, days * 24)
+    else:
+      hour = -rng.randint(1, days * 24)
+    artist_id = rng.choice(artist_ids)
+    venue_id = rng.choice(venue_ids)
+    keys = ((2 * venue_id) * span + hour, (2 * artist_id + 1) * span + hour)
+    if any(key + delta in booked for key in keys for delta in range(1 - hours, hours)):
+      continue
+    booked.update(keys)
+    produced += 1
+    start_time = anchor + timedelta(hours=hour)
+    yield {
+      "artist_id": artist_id,
+      "venue_id": venue_id,
+      "start_time": start_time,
+      "end_time": start_time + duration,
+    }
@@ -0,0 +1,97 @@
+#----------------------------------------------------------------------------#
+# JSON API responses.
+#
+# Payloads are encoded with orjson when it is installed (the stdlib json
+# module with compact separators otherwise), trimmed to the fields a client
+# asked for with ?fields=, tagged with a weak ETag of the body so clients
+# can revalidate with If-None-Match, and compressed with brotli (when the
+# brotli package is installed) or gzip if the client accepts it.
+#----------------------------------------------------------------------------#
+
+import gzip
+import json
+import hashlib
+from datetime import date, datetime
+
+from flask import Response, current_app, request
+
+try:
+  import orjson
+except ImportError:
+  orjson = None
+
+try:
+  import brotli
+except ImportError:
+  brotli = None
+
+
+def encode_default(value):
+  if isinstance(value, (datetime, date)):
+    return value.isoformat()
+  raise TypeError('{!r} is not JSON serializable'.format(value))
+
+
+def dumps(payload):
+  '''Encodes payload to compact JSON bytes.'''
+  if orjson is not None:
+    return orjson.dumps(payload, default=encode_default)
+  return json.dumps(payload, default=encode_default, separators=(',', ':'), ensure_ascii=False).encode()
+
+
+def requested_fields(allowed):
+  '''
+  The names listed in ?fields=, in the order of allowed, or None when the
+  client did not ask for a fieldset. Raises ValueError on unknown names.
+  '''
+  value = request.args.get('fields')
+  if not value:
+    return None
+  fields = set(name.strip() for name in value.split(',') if name.strip())
+  unknown = fields.difference(allowed)
+  if unknown:
+    raise ValueError('unknown fields: ' + ', '.join(sorted(unknown)))
+  return [name for name in allowed if name in fields]
+
+
+def sparse(item, fields):
+  if fields is None:
+    return item
+  return {name: item[name] for name in fields if name in item}
+
+
+def compress(body):
+  '''Returns (encoding, body) for the best encoding the client accepts.'''
+  accepted = request.accept_encodings
+  if brotli is not None and accepted['br']:
+    return 'br', brotli.compress(body, quality=current_app.config.get('API_BROTLI_QUALITY', 5))
+  if accepted['gzip']:
+    return 'gzip', gzip.compress(body, compresslevel=current_app.config.get('API_GZIP_LEVEL', 6))
+  return None, body
+
+
+def json_response(payload, status=200):
+  return encoded_response(dumps(payload), status)
+
+
+def encoded_response(body, status=200, etag=None):
+  '''
+  Response for an encoded JSON body. Without an etag (a version the body
+  is known by) a weak one is derived from the body.
+  '''
+  response = Response(body, status, mimetype='application/json')
+  response.vary.add('Accept-Encoding')
+  if status != 200:
+    return response
+
+  if etag is None:
+    response.set_etag(hashlib.blake2b(body, digest_size=16).hexdigest(), weak=True)
+  else:
+    response.set_etag(etag)
+  response.make_conditional(request)
+  if response.status_code == 200 and len(body) >= current_app.config.get('API_COMPRESS_MIN_SIZE', 500):
+    encoding, compressed = compress(body)
+    if encoding is not None:
+      response.set_data(compressed)
+      response.headers['Content-Encoding'] = encoding
+  return response
@@ -0,0 +1,385 @@
+#----------------------------------------------------------------------------#
+# Post-commit task queue.
+#
+# Side effects of a write that the response does not have to wait for run
+# as jobs on background worker threads. A job is a registered function name
+# plus JSON-serializable arguments. TaskQueue.after_commit() queues one for
+# when the current database transaction commits (and forgets it on
+# rollback); TaskQueue.enqueue() queues one right away.
+#
+# Jobs are kept in process memory by default (TASK_QUEUE_BACKEND 'thread')
+# or in a SQLite file ('sqlite', TASK_QUEUE_PATH) that survives restarts and
+# can be shared by several processes; 'eager' runs every job inline, which
+# is what the tests use. A failing job is retried up to TASK_QUEUE_MAX_RETRIES
+# times, TASK_QUEUE_BACKOFF seconds later and twice as long after each
+# further failure. A job given a key is not queued again while one with the
+# same key is still waiting, so bursts of writes share one run.
+#----------------------------------------------------------------------------#
+
+import json
+import time
+import heapq
+import sqlite3
+import itertools
+import threading
+from collections import deque, namedtuple
+
+from flask import current_app, has_app_context
+from sqlalchemy import event
+
+Job = namedtuple('Job', ['id', 'name', 'args', 'attempts', 'run_at', 'enqueued_at', 'key'])
+
+LATENCY_SAMPLES = 1000
+
+
+class MemoryStore(object):
+  '''Jobs in a heap ordered by when they are due; lost with the process.'''
+
+  def __init__(self):
+    self.heap = []
+    self.keys = set()
+    self.ids = itertools.count(1)
+    self.lock = threading.Lock()
+
+  def put(self, name, args, run_at, key=None):
+    with self.lock:
+      if key is not None and key in self.keys:
+        return False
+      job = Job(next(self.ids), name, args, 0, run_at, time.time(), key)
+      heapq.heappush(self.heap, (run_at, job.id, job))
+      if key is not None:
+        self.keys.add(key)
+      return True
+
+  def claim(self, now):
+    '''(job, None) for the next due job, or (None, when the next one is due).'''
+    with self.lock:
+      if not self.heap:
+        return None, None
+      run_at, id, job = self.heap[0]
+      if run_at > now:
+        return None, run_at
+      heapq.heappop(self.heap)
+      self.keys.discard(job.key)
+      return job, None
+
+  def retry(self, job, run_at, error):
+    with self.lock:
+      job = job._replace(attempts=job.attempts + 1, run_at=run_at)
+      heapq.heappush(self.heap, (run_at, job.id, job))
+      # still waiting, so the key is taken again (as SQLiteStore's row is)
+      if job.key is not None:
+        self.keys.add(job.key)
+
+  def finish(self, job):
+    pass
+
+  def fail(self, job, error):
+    pass
+
+  def depth(self):
+    return len(self.heap)
+
+
+class SQLiteStore(object):
+  '''
+  Jobs in a table of a SQLite file. A claimed job is leased for `lease`
+  seconds: if its process dies before finishing it, another worker picks
+  it up again once the lease runs out. Failed jobs stay in the table.
+  '''
+
+  def __init__(self, path, lease=300):
+    self.path = path
+    self.lease = lease
+    connection = self.connect()
+    try:
+      connection.execute(
+        'CREATE TABLE IF NOT EXISTS jobs ('
+        'id INTEGER PRIMARY KEY, name TEXT NOT NULL, args TEXT NOT NULL, key TEXT, '
+        'attempts INTEGER NOT NULL DEFAULT 0, run_at REAL NOT NULL, enqueued_at REAL NOT NULL, '
+        "status TEXT NOT NULL DEFAULT 'queued', error TEXT)"
+      )
+      connection.execute('CREATE INDEX IF NOT EXISTS ix_jobs_status_run_at ON jobs (status, run_at)')
+      connection.execute('CREATE INDEX IF NOT EXISTS ix_jobs_key ON jobs (key) WHERE key IS NOT NULL')
+    finally:
+      connection.close()
+
+  def connect(self):
+    # autocommit; the writes below open their own IMMEDIATE transactions
+    connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+    connection.execute('PRAGMA journal_mode=WAL')
+    return connection
+
+  def transaction(self, statements):
+    connection = self.connect()
+    try:
+      connection.execute('BEGIN IMMEDIATE')
+      result = statements(connection)
+      connection.execute('COMMIT')
+      return result
+    except BaseException:
+      connection.execute('ROLLBACK')
+      raise
+    finally:
+      connection.close()
+
+  def put(self, name, args, run_at, key=None):
+    def insert(connection):
+      if key is not None and connection.execute(
+        "SELECT 1 FROM jobs WHERE key = ? AND status = 'queued'", (key,)
+      ).fetchone():
+        return False
+      connection.execute(
+        'INSERT INTO jobs (name, args, key, run_at, enqueued_at) VALUES (?, ?, ?, ?, ?)',
+        (name, json.dumps(args), key, run_at, time.time())
+      )
+      return True
+    return self.transaction(insert)
+
+  def claim(self, now):
+    def claim(connection):
+      row = connection.execute(
+        'SELECT id, name, args, attempts, run_at, enqueued_at, key FROM jobs '
+        "WHERE status = 'queued' AND run_at <= ? OR status = 'running' AND run_at <= ? "
+        'ORDER BY run_at LIMIT 1', (now, now - self.lease)
+      ).fetchone()
+      if row is None:
+        next_run_at = connection.execute("SELECT min(run_at) FROM jobs WHERE status = 'queued'").fetchone()[0]
+        return None, next_run_at
+      # a running job's run_at is when it was claimed
+      connection.execute("UPDATE jobs SET status = 'running', run_at = ? WHERE id = ?", (now, row[0]))
+      return Job(row[0], row[1], json.loads(row[2]), row[3], row[4], row[5], row[6]), None
+    return self.transaction(claim)
+
+  def retry(self, job, run_at, error):
+    self.transaction(lambda connection: connection.execute(
+      "UPDATE jobs SET status = 'queued', attempts = attempts + 1, run_at = ?, error = ? WHERE id = ?",
+      (run_at, error, job.id)
+    ))
+
+  def finish(self, job):
+    self.transaction(lambda connection: connection.execute('DELETE FROM jobs WHERE id = ?', (job.id,)))
+
+  def fail(self, job, error):
+    self.transaction(lambda connection: connection.execute(
+      "UPDATE jobs SET status = 'failed', attempts = attempts + 1, error = ? WHERE id = ?", (error, job.id)
+    ))
+
+  def depth(self):
+    connection = self.connect()
+    try:
+      return connection.execute("SELECT count(*) FROM jobs WHERE status IN ('queued', 'running')").fetchone()[0]
+    finally:
+      connection.close()
+
+
+class Worker(object):
+  '''The store, worker threads and metrics of one app.'''
+
+  def __init__(self, app, queue, store):
+    self.app = app
+    self.queue = queue
+    self.store = store
+    self.threads = []
+    self.lock = threading.Lock()
+    self.wakeup = threading.Condition(self.lock)
+    self.running = 0
+    self.stopped = False
+    self.counts = dict.fromkeys(('enqueued', 'succeeded', 'retried', 'failed'), 0)
+    self.latencies = deque(maxlen=LATENCY_SAMPLES)
+    self.durations = deque(maxlen=LATENCY_SAMPLES)
+
+  def count(self, name):
+    with self.lock:
+      self.counts[name] += 1
+
+  def put(self, name, args, delay=0, key=None):
+    if self.store is None:
+      self.count('enqueued')
+      self.run(Job(None, name, args, 0, time.time(), time.time(), key))
+      return True
+    if not self.store.put(name, args, time.time() + delay, key):
+      return False
+    self.count('enqueued')
+    self.start()
+    with self.wakeup:
+      self.wakeup.notify()
+    return True
+
+  def start(self):
+    with self.lock:
+      if self.threads:
+        return
+      for number in range(self.app.config['TASK_QUEUE_WORKERS']):
+        thread = threading.Thread(target=self.loop, name='task-worker-{}'.format(number + 1), daemon=True)
+        self.threads.append(thread)
+        thread.start()
+
+  def stop(self):
+    '''Lets the worker threads exit once their current job is done.'''
+    with self.wakeup:
+      self.stopped = True
+      self.wakeup.notify_all()
+    for thread in self.threads:
+      thread.join()
+    self.threads = []
+
+  def loop(self):
+    poll = self.app.config['TASK_QUEUE_POLL_INTERVAL']
+    while not self.stopped:
+      try:
+        job, next_run_at = self.store.claim(time.time())
+      except Exception:
+        self.app.logger.exception('Claiming a task failed')
+        job, next_run_at = None, None
+      if job is None:
+        timeout = poll if next_run_at is None else min(poll, max(next_run_at - time.time(), 0))
+        with self.wakeup:
+          if not self.stopped:
+            self.wakeup.wait(timeout)
+        continue
+      with self.lock:
+        self.running += 1
+      try:
+        self.run(job)
+      except Exception:
+        self.app.logger.exception('Task %s could not be completed', job.name)
+      finally:
+        with self.lock:
+          self.running -= 1
+
+  def run(self, job):
+    config = self.app.config
+    while True:
+      started = time.time()
+      try:
+        if has_app_context() and current_app._get_current_object() is self.app:
+          # eager jobs: a nested app context would tear down the caller's session
+          self.queue.registry[job.name](*job.args)
+        else:
+          with self.app.app_context():
+            self.queue.registry[job.name](*job.args)
+      except Exception as e:
+        error = '{}: {}'.format(type(e).__name__, e)
+        if job.attempts >= config['TASK_QUEUE_MAX_RETRIES']:
+          self.app.logger.exception('Task %s failed after %d attempts', job.name, job.attempts + 1)
+          self.count('failed')
+          if self.store is not None:
+            self.store.fail(job, error)
+          return
+        self.count('retried')
+        backoff = config['TASK_QUEUE_BACKOFF'] * 2 ** job.attempts
+        if self.store is None:
+          job = job._replace(attempts=job.attempts + 1)
+          continue
+        self.store.retry(job, time.time() + backoff, error)
+        return
+
+      finished = time.time()
+      if self.store is not None:
+        self.store.finish(job)
+      with self.lock:
+        self.counts['succeeded'] += 1
+        self.latencies.append(finished - job.enqueued_at)
+        self.durations.append(finished - started)
+      return
+
+  def metrics(self):
+    with self.lock:
+      counts = dict(self.counts, running=self.running)
+      latencies, durations = sorted(self.latencies), sorted(self.durations)
+    counts['depth'] = self.store.depth() if self.store is not None else 0
+    counts['backend'] = self.app.config['TASK_QUEUE_BACKEND']
+    counts['workers'] = len(self.threads)
+    counts['latency_ms'] = summarize(latencies)
+    counts['duration_ms'] = summarize(durations)
+    return counts
+
+
+def summarize(samples):
+  '''avg/p50/p95/max in milliseconds of sorted samples in seconds.'''
+  if not samples:
+    return None
+  pick = lambda share: samples[min(int(len(samples) * share), len(samples) - 1)] * 1000
+  return {
+    "avg": round(sum(samples) / len(samples) * 1000, 2),
+    "p50": round(pick(0.5), 2),
+    "p95": round(pick(0.95), 2),
+    "max": round(samples[-1] * 1000, 2),
+  }
+
+
+class TaskQueue(object):
+
+  def __init__(self, db=None, app=None):
+    self.db = db
+    self.registry = {}
+    if db is not None:
+      event.listen(db.session, 'after_commit', self.enqueue_committed)
+      event.listen(db.session, 'after_rollback', self.discard_uncommitted)
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app):
+    app.config.setdefault('TASK_QUEUE_BACKEND', 'thread')
+    app.config.setdefault('TASK_QUEUE_PATH', 'tasks.sqlite')
+    app.config.setdefault('TASK_QUEUE_WORKERS', 2)
+    app.config.setdefault('TASK_QUEUE_MAX_RETRIES', 3)
+    app.config.setdefault('TASK_QUEUE_BACKOFF', 1.0)
+    app.config.setdefault('TASK_QUEUE_POLL_INTERVAL', 1.0)
+    app.config.setdefault('TASK_QUEUE_LEASE', 300)
+
+    backend = app.config['TASK_QUEUE_BACKEND']
+    if backend == 'eager':
+      store = None
+    elif backend == 'sqlite':
+      store = SQLiteStore(app.config['TASK_QUEUE_PATH'], app.config['TASK_QUEUE_LEASE'])
+    else:
+      store = MemoryStore()
+    app.extensions['tasks'] = Worker(app, self, store)
+
+  @property
+  def worker(self):
+    return current_app.extensions['tasks']
+
+  def task(self, func):
+    '''Registers func as a task under its name.'''
+    self.registry[func.__name__] = func
+    return func
+
+  def enqueue(self, name, *args, delay=0, key=None):
+    '''
+    Queues the task called name with args (JSON-serializable) to run in
+    delay seconds. Returns False if a job with key was already waiting.
+    '''
+    if name not in self.registry:
+      raise KeyError('unknown task: ' + name)
+    return self.worker.put(name, list(args), delay, key)
+
+  def after_commit(self, name, *args, delay=0, key=None):
+    '''Queues the task when the current transaction commits.'''
+    jobs = self.db.session.info.setdefault('tasks', [])
+    if key is None or all(job[3] != key for job in jobs):
+      jobs.append((name, args, delay, key))
+
+  def enqueue_committed(self, session):
+    for name, args, delay, key in session.info.pop('tasks', []):
+      self.enqueue(name, *args, delay=delay, key=key)
+
+  def discard_uncommitted(self, session):
+    session.info.pop('tasks', None)
+
+  def metrics(self):
+    return self.worker.metrics()
+
+  def stop(self):
+    self.worker.stop()
+
+  def join(self, timeout=None):
+    '''Waits until no job is queued or running; False on timeout.'''
+    deadline = None if timeout is None else time.time() + timeout
+    while self.worker.store is not None and (self.worker.store.depth() or self.worker.running):
+      if deadline is not None and time.time() > deadline:
+        return False
+      time.sleep(0.01)
+    return True
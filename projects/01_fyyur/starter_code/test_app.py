@@ -0,0 +1,939 @@
+import io
+import os
+import base64
+import gzip
+import json
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+from app import create_app, venues_near, geocode_venues, task_queue, engine_options, compile_templates, db, Venue, Artist, Show, venue_areas, refresh_venue_summary, genre_names, check_show_counters, roll_show_counters, search_catalog, \
+    keyset_page, page_cache, explain_queries, import_shows, seed_database, show_conflicts, split_shows
+from cache import MemoryCache
+from tasks import MemoryStore, SQLiteStore
+from formatting import DateTimeFormatter
+from profiler import recording, statement_shape
+from schedule import IntervalIndex, free_slots
+import benchmark
+
+
+class FyyurTestCase(unittest.TestCase):
+    """This class represents the fyyur test case"""
+
+    def setUp(self):
+        """Define test variables and initialize app. Executed before each test. """
+        self.app = create_app({
+            'TESTING': True,
+            'SQLALCHEMY_DATABASE_URI': 'sqlite://',
+            'PAGE_CACHE_ENABLED': False,
+            'TASK_QUEUE_BACKEND': 'eager',
+        })
+        self.client = self.app.test_client
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+        self.artist = Artist(name='Guns N Petals', city='San Francisco', state='CA', genres=['Rock n Roll'])
+        db.session.add(self.artist)
+        db.session.commit()
+        self.artist_id = self.artist.id
+
+    def tearDown(self):
+        """Executed after reach test"""
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def add_venue(self, name, city, state, upcoming=0, past=0):
+        venue = Venue(name=name, city=city, state=state, genres=['Jazz'])
+        now = datetime.now()
+        for i in range(upcoming):
+            venue.shows.append(Show(artist_id=self.artist_id, start_time=now + timedelta(days=i + 1)))
+        for i in range(past):
+            venue.shows.append(Show(artist_id=self.artist_id, start_time=now - timedelta(days=i + 1)))
+        db.session.add(venue)
+        db.session.commit()
+        return venue
+
+    def count_queries(self, method, url, **kwargs):
+        # start from an empty identity map, like a fresh request would
+        db.session.remove()
+        with recording() as profile:
+            res = getattr(self.client(), method)(url, **kwargs)
+        return res, profile.count
+
+    def assertQueryBudget(self, url, budget):
+        res, queries = self.count_queries('get', url)
+        self.assertEqual(res.status_code, 200)
+        self.assertLessEqual(queries, budget, '{} ran {} queries'.format(url, queries))
+
+    def test_venue_areas(self):
+        self.add_venue('The Musical Hop', 'San Francisco', 'CA', upcoming=2, past=1)
+        self.add_venue('Park Square Live Music & Coffee', 'San Francisco', 'CA', past=3)
+        self.add_venue('The Dueling Pianos Bar', 'New York', 'NY', upcoming=1)
+
+        areas, page = venue_areas()
+
+        self.assertEqual([(a['city'], a['state']) for a in areas], [('San Francisco', 'CA'), ('New York', 'NY')])
+        self.assertEqual([v['num_upcoming_shows'] for v in areas[0]['venues']], [2, 0])
+        self.assertEqual(areas[1]['venues'][0]['num_upcoming_shows'], 1)
+
+    def test_venues_query_count_is_constant(self):
+        self.add_venue('The Musical Hop', 'San Francisco', 'CA', upcoming=2, past=1)
+        res, baseline = self.count_queries('get', '/venues')
+        self.assertEqual(res.status_code, 200)
+
+        for i in range(10):
+            self.add_venue('Venue {}'.format(i), 'City {}'.format(i), 'NY', upcoming=3, past=3)
+        res, queries = self.count_queries('get', '/venues')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(b'Venue 9', res.data)
+        self.assertEqual(queries, baseline)
+
+    def test_venues_from_summary(self):
+        # a materialized view on PostgreSQL, so not part of create_all()'s tables
+        self.assertNotIn('VenueAreaSummary', db.metadata.tables)
+        self.app.config.update(VENUES_FROM_SUMMARY=True, VENUE_SUMMARY_REFRESH_DELAY=None)
+        self.add_venue('The Musical Hop', 'San Francisco', 'CA', upcoming=2, past=1)
+        refresh_venue_summary()
+        self.add_venue('The Dueling Pianos Bar', 'New York', 'NY', upcoming=1)
+        genre_names()
+
+        # not refreshed yet
+        res, queries = self.count_queries('get', '/venues')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(queries, 1)
+        self.assertIn(b'The Musical Hop', res.data)
+        self.assertNotIn(b'The Dueling Pianos Bar', res.data)
+
+        # writes refresh it after the commit
+        self.app.config['VENUE_SUMMARY_REFRESH_DELAY'] = 0
+        venue = self.add_venue('Park Square Live Music & Coffee', 'San Francisco', 'CA', upcoming=1)
+        db.session.delete(venue.shows[0])
+        db.session.commit()
+
+        areas, page = venue_areas()
+        self.assertEqual([(a['city'], a['state']) for a in areas], [('San Francisco', 'CA'), ('New York', 'NY')])
+        self.assertEqual([(v['name'], v['num_upcoming_shows']) for v in areas[0]['venues']],
+                         [('The Musical Hop', 2), ('Park Square Live Music & Coffee', 0)])
+        self.assertEqual(areas[1]['venues'][0]['num_upcoming_shows'], 1)
+
+    def test_show_venue_query_count_is_constant(self):
+        venue = self.add_venue('The Musical Hop', 'San Francisco', 'CA', upcoming=1, past=1)
+        res, baseline = self.count_queries('get', '/venues/{}'.format(venue.id))
+        self.assertEqual(res.status_code, 200)
+
+        venue = self.add_venue('Park Square Live Music & Coffee', 'San Francisco', 'CA', upcoming=20, past=30)
+        res, queries = self.count_queries('get', '/venues/{}'.format(venue.id))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(b'20 Upcoming Shows', res.data)
+        self.assertIn(b'30 Past Shows', res.data)
+        self.assertEqual(queries, baseline)
+
+    def test_show_artist_query_count_is_constant(self):
+        self.add_venue('The Musical Hop', 'San Francisco', 'CA', upcoming=1)
+        res, baseline = self.count_queries('get', '/artists/{}'.format(self.artist_id))
+        self.assertEqual(res.status_code, 200)
+
+        for i in range(10):
+            self.add_venue('Venue {}'.format(i), 'San Francisco', 'CA', upcoming=1, past=1)
+        res, queries = self.count_queries('get', '/artists/{}'.format(self.artist_id))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(b'11 Upcoming Shows', res.data)
+        self.assertEqual(queries, baseline)
+
+    def test_show_timeline(self):
+        venue_id = self.add_venue('The Musical Hop', 'San Francisco', 'CA', upcoming=2, past=3).id
+        db.session.remove()
+
+        venue = Venue.query.get(venue_id)
+        self.assertEqual(venue.num_upcoming_shows, 2)
+        self.assertEqual(venue.num_past_shows, 3)
+        self.assertNotIn('shows', venue.__dict__)
+
+        upcoming = venue.upcoming_shows
+        self.assertIs(venue.upcoming_shows, upcoming)
+        self.assertEqual([s.start_time for s in upcoming], sorted(s.start_time for s in upcoming))
+
+        venue.shows.append(Show(artist_id=self.artist_id, start_time=datetime.now() + timedelta(days=30)))
+        db.session.commit()
+        self.assertEqual(venue.num_upcoming_shows, 3)
+        self.assertEqual(len(venue.upcoming_shows), 3)
+
+    def test_show_counters(self):
+        venue_id = self.add_venue('The Musical Hop', 'San Francisco', 'CA', upcoming=2, past=3).id
+        venue = Venue.query.get(venue_id)
+        artist = Artist.query.get(self.artist_id)
+        self.assertEqual((venue.upcoming_shows_count, venue.past_shows_count), (2, 3))
+        self.assertEqual((artist.upcoming_shows_count, artist.past_shows_count), (2, 3))
+
+        show = venue.upcoming_shows[0]
+        show.start_time = datetime.now() - timedelta(days=10)
+        db.session.commit()
+        self.assertEqual((venue.upcoming_shows_count, venue.past_shows_count), (1, 4))
+
+        db.session.delete(venue.past_shows[0])
+        db.session.commit()
+        self.assertEqual((venue.upcoming_shows_count, venue.past_shows_count), (1, 3))
+        self.assertEqual(check_show_counters(), [])
+
+    def test_roll_and_repair_show_counters(self):
+        venue_id = self.add_venue('The Musical Hop', 'San Francisco', 'CA', upcoming=2).id
+        later = datetime.now() + timedelta(days=1, hours=1)
+
+        self.assertEqual(len(check_show_counters(now=later)), 2)
+        tags = ('venues', 'artists', 'venue:{}'.format(venue_id), 'artist:{}'.format(self.artist_id))
+        versions = [page_cache.version(tag) for tag in tags]
+        roll_show_counters(datetime.now(), now=later)
+        self.assertEqual(check_show_counters(now=later), [])
+        for tag, version in zip(tags, versions):
+            self.assertNotEqual(page_cache.version(tag), version, tag)
+
+        venue = Venue.query.get(venue_id)
+        self.assertEqual((venue.upcoming_shows_count, venue.past_shows_count), (1, 1))
+
+        venue.upcoming_shows_count = 7
+        db.session.commit()
+        self.assertEqual(check_show_counters(repair=True, now=later), [('Venue', venue_id, (7, 1), (1, 1))])
+        self.assertEqual(check_show_counters(now=later), [])
+
+    def test_show_starting_now_is_past(self):
+        venue_id = self.add_venue('The Musical Hop', 'San Francisco', 'CA', past=1).id
+        show = Show.query.filter_by(venue_id=venue_id).one()
+        started = show.start_time
+
+        self.assertEqual(split_shows([show], now=started), ([show], []))
+        self.assertEqual(check_show_counters(now=started), [])
+        roll_show_counters(started - timedelta(minutes=1), now=started)
+        venue = Venue.query.get(venue_id)
+        self.assertEqual((venue.upcoming_shows_count, venue.past_shows_count), (0, 1))
+        self.assertEqual(check_show_counters(now=started - timedelta(seconds=1)),
+                         [('Venue', venue_id, (0, 1), (1, 0)), ('Artist', self.artist_id, (0, 1), (1, 0))])
+
+    def test_search_venues(self):
+        self.add_venue('The Musical Hop', 'San Francisco', 'CA', upcoming=1)
+        self.add_venue('Park Square Live Music & Coffee', 'San Francisco', 'CA')
+        self.add_venue('The Dueling Pianos Bar', 'New York', 'NY')
+
+        self.assertEqual([v.name for v in search_catalog(Venue, 'Hop')], ['The Musical Hop'])
+        self.assertEqual(len(search_catalog(Venue, 'music')), 2)
+        self.assertEqual([v.name for v in search_catalog(Venue, 'new york')], ['The Dueling Pianos Bar'])
+        self.assertEqual(len(search_catalog(Venue, 'jazz')), 3)
+        self.assertEqual(len(search_catalog(Venue, 'jazz', limit=2)), 2)
+
+        self.add_venue('Hop Scotch', 'Austin', 'TX')
+        self.assertEqual([v.name for v in search_catalog(Venue, 'hop')], ['Hop Scotch', 'The Musical Hop'])
+        self.assertEqual([v.name for v in search_catalog(Venue, 'ny')], ['The Dueling Pianos Bar'])
+        self.assertEqual([v.name for v in search_catalog(Venue, 'x')], ['Hop Scotch'])
+        self.assertEqual(search_catalog(Venue, 'yk'), [])
+
+        res = self.client().post('/venues/search', data={'search_term': 'Music'})
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(b'Park Square Live Music', res.data)
+
+    def test_search_artists(self):
+        res = self.client().post('/artists/search', data={'search_term': 'petals'})
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(b'Guns N Petals', res.data)
+
+        res = self.client().post('/artists/search', data={'search_term': 'band'})
+        self.assertNotIn(b'Guns N Petals', res.data)
+
+    def test_keyset_pages(self):
+        for i in range(5):
+            db.session.add(Artist(name='Artist {}'.format(i)))
+        db.session.commit()
+        artists = [a.id for a in Artist.query.order_by(Artist.id)]
+
+        page = keyset_page(Artist.query, [Artist.id], size=4)
+        self.assertEqual([a.id for a in page.items], artists[:4])
+        self.assertIsNone(page.prev_cursor)
+
+        page = keyset_page(Artist.query, [Artist.id], after=page.next_cursor, size=4)
+        self.assertEqual([a.id for a in page.items], artists[4:])
+        self.assertIsNone(page.next_cursor)
+
+        page = keyset_page(Artist.query, [Artist.id], before=page.prev_cursor, size=4)
+        self.assertEqual([a.id for a in page.items], artists[:4])
+        self.assertIsNone(page.prev_cursor)
+        self.assertIsNotNone(page.next_cursor)
+
+    def test_paginated_shows(self):
+        self.app.config['PAGE_SIZE'] = 2
+        try:
+            self.add_venue('The Musical Hop', 'San Francisco', 'CA', upcoming=3)
+            res = self.client().get('/shows')
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual(res.data.count(b'tile-show'), 2)
+            self.assertIn(b'Next', res.data)
+
+            after = keyset_page(Show.query, [Show.start_time, Show.id], size=2).next_cursor
+            res = self.client().get('/shows?after=' + after)
+            self.assertEqual(res.data.count(b'tile-show'), 1)
+            self.assertIn(b'Previous', res.data)
+            self.assertNotIn(b'Next', res.data)
+
+            res = self.client().get('/shows?after=garbage')
+            self.assertEqual(res.status_code, 400)
+            # cursors of the wrong shape for the listing's keys
+            bad = {
+                '/venues': ([1], ['x', 1], {'a': 1}, ['CA', 'San Francisco', [1]]),
+                '/artists': ([], [1, 2], {'a': 1}, [None], [True]),
+                '/api/v1/venues': (['x', 1], [[1]]),
+            }
+            for url, cursors in bad.items():
+                for values in cursors:
+                    cursor = base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+                    res = self.client().get(url + '?after=' + cursor)
+                    self.assertEqual(res.status_code, 400, (url, values))
+        finally:
+            self.app.config['PAGE_SIZE'] = 50
+
+    def test_memory_cache_evicts(self):
+        cache = MemoryCache(max_entries=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual((cache.get('a'), cache.get('b'), cache.get('c')), (1, None, 3))
+
+        cache.set('d', 4, ex=-1)
+        self.assertIsNone(cache.get('d'))
+
+    def test_page_cache_invalidation(self):
+        self.app.config['PAGE_CACHE_ENABLED'] = True
+        venue_id = self.add_venue('The Musical Hop', 'San Francisco', 'CA', upcoming=1).id
+        other_id = self.add_venue('The Dueling Pianos Bar', 'New York', 'NY').id
+        venue_url, other_url = '/venues/{}'.format(venue_id), '/venues/{}'.format(other_id)
+        artist_url = '/artists/{}'.format(self.artist_id)
+
+        for url in (venue_url, other_url, artist_url, '/venues'):
+            res, queries = self.count_queries('get', url)
+            self.assertEqual(res.status_code, 200)
+            res, queries = self.count_queries('get', url)
+            self.assertEqual(queries, 0)
+
+        res = self.client().post('/artists/{}/edit'.format(self.artist_id), data={'name': 'Guns N Roses'})
+        self.assertEqual(res.status_code, 302)
+
+        res, queries = self.count_queries('get', venue_url)
+        self.assertGreater(queries, 0)
+        self.assertIn(b'Guns N Roses', res.data)
+        res, queries = self.count_queries('get', artist_url)
+        self.assertGreater(queries, 0)
+        res, queries = self.count_queries('get', other_url)
+        self.assertEqual(queries, 0)
+        res, queries = self.count_queries('get', '/venues')
+        self.assertEqual(queries, 0)
+
+    def test_show_queries_use_indexes(self):
+        self.add_venue('The Musical Hop', 'San Francisco', 'CA', upcoming=3, past=3)
+        for name, lines, uses_index in explain_queries():
+            self.assertTrue(uses_index, '{}: {}'.format(name, lines))
+
+    def test_import_shows(self):
+        venue_id = self.add_venue('The Musical Hop', 'San Francisco', 'CA').id
+        future = (datetime.now() + timedelta(days=3)).isoformat()
+        stream = io.StringIO(
+            'artist_id,venue_id,start_time\n'
+            '{a},{v},{t}\n'
+            '{a},9999,{t}\n'
+            '{a},{v},not a date\n'
+            '{a},{v},2019-05-21T21:30:00\n'.format(a=self.artist_id, v=venue_id, t=future))
+
+        result = import_shows(stream, batch_size=2)
+
+        self.assertEqual(result['inserted'], 2)
+        self.assertEqual([line for line, error in result['errors']], [3, 4])
+        venue = Venue.query.get(venue_id)
+        self.assertEqual((venue.upcoming_shows_count, venue.past_shows_count), (1, 1))
+
+    def test_import_shows_route(self):
+        venue_id = self.add_venue('The Musical Hop', 'San Francisco', 'CA').id
+        ndjson = '{{"artist_id": {}, "venue_id": {}, "start_time": "2035-04-01T20:00:00"}}\nnope\n'.format(
+            self.artist_id, venue_id).encode()
+
+        res = self.client().post('/shows/import', data={'file': (io.BytesIO(ndjson), 'shows.ndjson')})
+        self.assertEqual(res.status_code, 403)
+
+        self.app.config['BULK_IMPORT_TOKEN'] = 'secret'
+        try:
+            res = self.client().post('/shows/import', data={'file': (io.BytesIO(ndjson), 'shows.ndjson')},
+                                     headers={'Authorization': 'Bearer wrong'})
+            self.assertEqual(res.status_code, 401)
+
+            res = self.client().post('/shows/import', data={'file': (io.BytesIO(ndjson), 'shows.ndjson')},
+                                     headers={'Authorization': 'Bearer secret'})
+            data = json.loads(res.data)
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual(data['inserted'], 1)
+            self.assertEqual(data['errors'][0]['line'], 2)
+        finally:
+            self.app.config['BULK_IMPORT_TOKEN'] = None
+
+    def test_seed_database(self):
+        anchor = datetime(2030, 1, 1)
+        seed_database(5, 4, 50, seed=7, batch_size=8, anchor=anchor)
+
+        self.assertEqual(Venue.query.count(), 5)
+        self.assertEqual(Artist.query.count(), 5)
+        self.assertEqual(Show.query.count(), 50)
+        self.assertEqual(check_show_counters(), [])
+        self.assertTrue(search_catalog(Venue, Venue.query.first().name))
+        venue = Venue.query.first()
+        areas, page = venue_areas(genre=venue.genres[0])
+        self.assertIn(venue.id, [v['id'] for area in areas for v in area['venues']])
+
+        first = [(s.artist_id, s.venue_id, s.start_time) for s in Show.query.order_by(Show.id)]
+        Show.query.delete()
+        Venue.query.delete()
+        Artist.query.filter(Artist.id != self.artist_id).delete()
+        db.session.commit()
+        seed_database(5, 4, 50, seed=7, batch_size=50, anchor=anchor)
+        again = [(s.artist_id, s.venue_id, s.start_time) for s in Show.query.order_by(Show.id)]
+        self.assertEqual(first, again)
+
+    def test_query_budgets(self):
+        venue_id = self.add_venue('The Musical Hop', 'San Francisco', 'CA', upcoming=5, past=5).id
+        genre_names()  # the genre facets are cached across requests
+        self.assertQueryBudget('/venues', 1)
+        self.assertQueryBudget('/artists', 1)
+        self.assertQueryBudget('/shows', 1)
+        # the validator aggregate, then the row and its shows
+        self.assertQueryBudget('/venues/{}'.format(venue_id), 3)
+        self.assertQueryBudget('/artists/{}'.format(self.artist_id), 3)
+
+    def test_query_profiler(self):
+        self.assertEqual(statement_shape('SELECT * FROM "Show" WHERE id IN (?, ?, ?) AND x = 3'),
+                         'SELECT * FROM "Show" WHERE id IN (?) AND x = ?')
+
+        for i in range(3):
+            self.add_venue('Venue {}'.format(i), 'Austin', 'TX', upcoming=1)
+        db.session.remove()
+        with recording() as profile:
+            for venue in Venue.query.all():
+                venue.shows
+        self.assertEqual(len(profile.repeated()), 1)
+
+        genre_names()
+        self.app.config.update(QUERY_PROFILER_ENABLED=True, QUERY_PROFILER_TOOLBAR=True)
+        try:
+            res = self.client().get('/venues')
+        finally:
+            self.app.config.update(QUERY_PROFILER_ENABLED=False, QUERY_PROFILER_TOOLBAR=False)
+        self.assertTrue(res.headers['X-Query-Profile'].startswith('count=1;'))
+        self.assertIn(b'id="query-profile"', res.data)
+
+    def test_streamed_shows(self):
+        self.add_venue('The Musical Hop', 'San Francisco', 'CA', upcoming=3, past=2)
+        self.app.config.update(PAGE_SIZE=2, SHOWS_STREAM_BATCH_SIZE=2, SHOWS_STREAM_BUFFER=5,
+                               PAGE_CACHE_ENABLED=True)
+        db.session.remove()
+        with recording() as profile:
+            res = self.client().get('/shows?all=1', buffered=False)
+            self.assertTrue(res.is_streamed)
+            # nothing is fetched before the client starts reading
+            self.assertEqual(profile.count, 0)
+            body = b''.join(res.response)
+            res.close()
+        self.assertEqual(body.count(b'tile-show'), 5)
+        self.assertNotIn(b'class="pager"', body)
+        self.assertEqual(profile.count, 1)
+
+        res = self.client().get('/shows?all=1')
+        self.assertEqual(res.data.count(b'tile-show'), 5)
+
+    def test_conditional_get(self):
+        venue_id = self.add_venue('The Musical Hop', 'San Francisco', 'CA', upcoming=2, past=1).id
+        url = '/venues/{}'.format(venue_id)
+        res = self.client().get(url)
+        etag, last_modified = res.headers['ETag'], res.headers['Last-Modified']
+
+        # a revalidation runs the validator query only
+        res, queries = self.count_queries('get', url, headers={'If-None-Match': etag})
+        self.assertEqual((res.status_code, res.data, queries), (304, b'', 1))
+        res = self.client().get(url, headers={'If-Modified-Since': last_modified})
+        self.assertEqual(res.status_code, 304)
+
+        # any change to the venue, its shows or their artists is a new version
+        artist = Artist.query.get(self.artist_id)
+        artist.name = 'Guns N Roses'
+        db.session.commit()
+        res = self.client().get(url, headers={'If-None-Match': etag})
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(b'Guns N Roses', res.data)
+
+        for url in ('/venues', '/artists', '/shows', '/artists/{}'.format(self.artist_id)):
+            etag = self.client().get(url).headers['ETag']
+            self.assertEqual(self.client().get(url, headers={'If-None-Match': etag}).status_code, 304)
+        etag = self.client().get('/shows').headers['ETag']
+        Show.query.filter(Show.venue_id == venue_id).first().start_time = datetime.now() + timedelta(days=9)
+        db.session.commit()
+        self.assertEqual(self.client().get('/shows', headers={'If-None-Match': etag}).status_code, 200)
+
+        # so does a genre change that only shows up in the facets
+        self.add_venue('The Dueling Pianos Bar', 'New York', 'NY')
+        res = self.client().get('/artists')
+        etag = res.headers['ETag']
+        self.assertNotIn('Last-Modified', res.headers)
+        venue = Venue.query.get(venue_id)
+        venue.genres = ['Polka']
+        db.session.commit()
+        res = self.client().get('/artists', headers={'If-None-Match': etag})
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(b'Polka', res.data)
+
+        # cached pages keep their validators
+        self.app.config['PAGE_CACHE_ENABLED'] = True
+        etag = self.client().get('/artists').headers['ETag']
+        res, queries = self.count_queries('get', '/artists', headers={'If-None-Match': etag})
+        self.assertEqual((res.status_code, queries), (304, 0))
+
+    def test_datetime_formatter(self):
+        import babel.dates
+        formatter = DateTimeFormatter(locale='en', max_entries=2)
+        start = datetime(2035, 4, 1, 20, 0)
+        for format in ('full', 'long', 'medium', 'short', "EEEE MMMM, d, y 'at' h:mma"):
+            self.assertEqual(formatter(start, format), babel.dates.format_datetime(start, format, locale='en'))
+        self.assertEqual(formatter('2035-04-01 20:00:00', 'full', 'de'),
+                         babel.dates.format_datetime(start, 'full', locale='de'))
+
+        formatter.cache_clear()
+        formatter(start, 'full')
+        formatter(start, 'full')
+        formatter(start + timedelta(hours=1), 'full')
+        formatter(start + timedelta(hours=2), 'full')
+        info = formatter.cache_info()
+        self.assertEqual((info.hits, info.currsize), (1, 2))
+
+    def test_genre_filters(self):
+        hop = self.add_venue('The Musical Hop', 'San Francisco', 'CA').id
+        bar = self.add_venue('The Dueling Pianos Bar', 'New York', 'NY').id
+        Venue.query.get(bar).genres = ['Classical', 'Jazz']
+        artist = Artist(name='Matt Quevedo', city='New York', state='NY', genres=['Jazz'])
+        db.session.add(artist)
+        db.session.commit()
+        self.assertEqual(genre_names(), ['Classical', 'Jazz', 'Rock n Roll'])
+
+        areas, page = venue_areas(genre='Classical')
+        self.assertEqual([venue['id'] for area in areas for venue in area['venues']], [bar])
+        areas, page = venue_areas(genre='Jazz')
+        self.assertEqual(sorted(venue['id'] for area in areas for venue in area['venues']), [hop, bar])
+
+        res = self.client().get('/artists?genre=Jazz')
+        self.assertIn(b'Matt Quevedo', res.data)
+        self.assertNotIn(b'Guns N Petals', res.data)
+        self.assertIn(b'href="/artists?genre=Rock+n+Roll"', res.data)
+        res = self.client().post('/venues/search', data={'search_term': 'the', 'genre': 'Classical'})
+        self.assertIn(b'The Dueling Pianos Bar', res.data)
+        self.assertNotIn(b'The Musical Hop', res.data)
+        res = self.client().get('/api/v1/venues?genre=Jazz&fields=id')
+        self.assertEqual(len(res.get_json()['data']), 2)
+        res = self.client().get('/api/v1/artists/search?q=a&genre=Rock+n+Roll')
+        self.assertEqual([row['id'] for row in res.get_json()['data']], [self.artist_id])
+
+        # links follow edits and deletes
+        db.session.delete(Venue.query.get(bar))
+        Artist.query.get(self.artist_id).genres = ['Jazz']
+        db.session.commit()
+        areas, page = venue_areas(genre='Classical')
+        self.assertEqual(areas, [])
+        res = self.client().get('/api/v1/artists?genre=Jazz&fields=id')
+        self.assertEqual(len(res.get_json()['data']), 2)
+
+    def test_genre_facets_follow_new_genres(self):
+        self.app.config['PAGE_CACHE_ENABLED'] = True
+        self.add_venue('The Musical Hop', 'San Francisco', 'CA')
+        for url in ('/venues', '/artists'):
+            self.assertNotIn(b'Polka', self.client().get(url).data)
+
+        db.session.add(Artist(name='The Polka Kings', city='Austin', state='TX', genres=['Polka']))
+        db.session.commit()
+        for url in ('/venues', '/artists'):
+            self.assertIn(b'Polka', self.client().get(url).data, url)
+
+    def test_task_queue(self):
+        calls = []
+
+        @task_queue.task
+        def flaky_task(name):
+            calls.append(name)
+            if len(calls) < 3:
+                raise RuntimeError('not yet')
+
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, 'tasks.sqlite')
+        try:
+            for backend in ('thread', 'sqlite'):
+                del calls[:]
+                db.session.remove()
+                app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite://', 'TASK_QUEUE_BACKEND': backend,
+                                  'TASK_QUEUE_PATH': path, 'TASK_QUEUE_BACKOFF': 0.01, 'TASK_QUEUE_POLL_INTERVAL': 0.01})
+                with app.app_context():
+                    db.create_all()
+                    # queued on commit, dropped on rollback
+                    db.session.add(Venue(name='Rolled Back'))
+                    task_queue.after_commit('flaky_task', 'rolled back')
+                    db.session.rollback()
+                    task_queue.after_commit('flaky_task', backend)
+                    task_queue.after_commit('flaky_task', backend)
+                    self.assertEqual(calls, [])
+                    db.session.commit()
+                    self.assertTrue(task_queue.join(timeout=5))
+
+                    self.assertEqual(calls, [backend] * 4)
+                    metrics = app.test_client().get('/api/v1/tasks/metrics').get_json()
+                    self.assertEqual((metrics['enqueued'], metrics['retried'], metrics['succeeded']), (2, 2, 2))
+                    self.assertEqual(metrics['depth'], 0)
+                    self.assertIsNotNone(metrics['latency_ms'])
+
+                    # keyed jobs waiting to run are not queued twice
+                    self.assertTrue(task_queue.enqueue('flaky_task', 'later', delay=60, key='later'))
+                    self.assertFalse(task_queue.enqueue('flaky_task', 'later', delay=60, key='later'))
+                    self.assertEqual(task_queue.metrics()['depth'], 1)
+                    task_queue.stop()
+                db.session.remove()
+
+            # the sqlite queue outlives its app
+            with create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite://', 'TASK_QUEUE_BACKEND': 'sqlite',
+                             'TASK_QUEUE_PATH': path}).app_context():
+                self.assertEqual(task_queue.metrics()['depth'], 1)
+        finally:
+            db.session.remove()
+            del task_queue.registry['flaky_task']
+            shutil.rmtree(directory)
+
+    def test_keyed_job_retry(self):
+        directory = tempfile.mkdtemp()
+        try:
+            for store in (MemoryStore(), SQLiteStore(os.path.join(directory, 'tasks.sqlite'))):
+                self.assertTrue(store.put('refresh', [], 0, key='refresh'))
+                job, due = store.claim(1)
+                store.retry(job, 10, 'failed')
+                # the pending retry still holds the key
+                self.assertFalse(store.put('refresh', [], 0, key='refresh'))
+                self.assertEqual(store.depth(), 1)
+                job, due = store.claim(11)
+                store.finish(job)
+                self.assertTrue(store.put('refresh', [], 0, key='refresh'))
+        finally:
+            shutil.rmtree(directory)
+
+    def test_venues_near(self):
+        sf = self.add_venue('The Musical Hop', 'San Francisco', 'CA').id
+        oakland = self.add_venue('Park Square Live Music & Coffee', 'Oakland', 'CA').id
+        self.add_venue('The Dueling Pianos Bar', 'New York', 'NY')
+        self.add_venue('Nowhere Hall', 'Nowhere', 'ZZ')
+        venue = Venue.query.get(sf)
+        self.assertEqual((venue.latitude, venue.longitude, venue.geohash[:5]), (37.7749, -122.4194, '9q8yy'))
+
+        res = self.client().get('/api/v1/venues/near?lat=37.7749&lng=-122.4194&km=20')
+        data = res.get_json()['data']
+        self.assertEqual([row['id'] for row in data], [sf, oakland])
+        self.assertAlmostEqual(data[1]['distance_km'], 13.43, places=2)
+        res = self.client().get('/api/v1/venues/near?lat=37.7749&lng=-122.4194&km=5')
+        self.assertEqual([row['id'] for row in res.get_json()['data']], [sf])
+        self.assertEqual(self.client().get('/api/v1/venues/near?lat=95&lng=0').status_code, 400)
+        self.assertEqual(self.client().get('/api/v1/venues/near?lat=0&lng=0&km=5000').status_code, 400)
+
+        # moving a venue places it again, explicit coordinates win
+        venue = Venue.query.get(oakland)
+        venue.city, venue.state = 'New York', 'NY'
+        db.session.commit()
+        self.assertEqual(venue.latitude, 40.7128)
+        venue.latitude, venue.longitude = 37.8, -122.27
+        db.session.commit()
+        self.assertEqual(len(venues_near(37.7749, -122.4194, 20)), 2)
+
+    def test_geocode_venues(self):
+        seed_database(6, 2, 0, seed=3)
+        self.assertEqual(Venue.query.filter(Venue.latitude.is_(None)).count(), 0)
+        db.session.execute(Venue.__table__.update().values(latitude=None, longitude=None, geohash=None))
+        self.assertEqual(geocode_venues(), 6)
+        venue = Venue.query.first()
+        self.assertIn(venue.id, [row.id for row, distance in venues_near(venue.latitude, venue.longitude, 1)])
+
+    def test_show_form_lookups(self):
+        self.add_venue('The Musical Hop', 'San Francisco', 'CA')
+        self.add_venue('the musical box', 'Oakland', 'CA')
+        self.add_venue('Musically 100% Jazz', 'New York', 'NY')
+        self.add_venue('Park Square Live Music & Coffee', 'San Francisco', 'CA')
+
+        res, queries = self.count_queries('get', '/shows/create')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(queries, 0)
+        self.assertIn(b'data-lookup="/api/v1/venues/lookup"', res.data)
+
+        res = self.client().get('/api/v1/venues/lookup?q=THE%20MUSICAL')
+        self.assertEqual([choice['label'] for choice in res.get_json()['data']],
+                         ['the musical box (Oakland, CA)', 'The Musical Hop (San Francisco, CA)'])
+        res = self.client().get('/api/v1/venues/lookup?q=musically%20100%25')
+        self.assertEqual(len(res.get_json()['data']), 1)
+        res = self.client().get('/api/v1/venues/lookup?q=&limit=2')
+        self.assertEqual(len(res.get_json()['data']), 2)
+        res = self.client().get('/api/v1/artists/lookup?q=guns')
+        self.assertEqual(res.get_json()['data'], [{"id": self.artist_id, "label": 'Guns N Petals (San Francisco, CA)'}])
+
+    def test_choices_snapshot(self):
+        venue_id = self.add_venue('The Musical Hop', 'San Francisco', 'CA').id
+        res, queries = self.count_queries('get', '/api/v1/choices')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(queries, 2)
+        snapshot = res.get_json()
+        self.assertEqual(snapshot['venues'], [[venue_id, 'The Musical Hop (San Francisco, CA)']])
+        self.assertEqual(res.headers['ETag'], '"{}"'.format(snapshot['version']))
+
+        # served from the cache until a venue or artist changes
+        res, queries = self.count_queries('get', '/api/v1/choices', headers={'If-None-Match': res.headers['ETag']})
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(queries, 0)
+        self.add_venue('Park Square Live Music & Coffee', 'San Francisco', 'CA', upcoming=1)
+        res = self.client().get('/api/v1/choices', headers={'If-None-Match': res.headers['ETag']})
+        self.assertEqual(res.status_code, 200)
+        self.assertNotEqual(res.get_json()['version'], snapshot['version'])
+        self.assertEqual(len(res.get_json()['venues']), 2)
+
+    def test_show_scheduling(self):
+        venue_id = self.add_venue('The Musical Hop', 'San Francisco', 'CA').id
+        other_venue_id = self.add_venue('Park Square Live Music & Coffee', 'Oakland', 'CA').id
+        other = Artist(name='The Wild Sax Band', city='San Francisco', state='CA', genres=['Jazz'])
+        db.session.add(other)
+        db.session.commit()
+        other_id = other.id
+
+        def book(start_time, artist_id, venue_id=venue_id, **form):
+            before = Show.query.count()
+            self.client().post('/shows/create', data=dict(
+                form, artist_id=artist_id, venue_id=venue_id, start_time=start_time))
+            db.session.remove()
+            return Show.query.count() > before
+
+        self.assertTrue(book('2035-04-01 20:00', self.artist_id, duration=90))
+        self.assertFalse(book('2035-04-01 21:00', other_id))
+        self.assertFalse(book('2035-04-01 20:30', self.artist_id, other_venue_id))
+        self.assertTrue(book('2035-04-01 21:30', other_id))
+        self.assertEqual(Show.query.order_by(Show.id).first().end_time, datetime(2035, 4, 1, 21, 30))
+
+        # a show written by another process, which this one's schedules miss
+        db.session.execute(Show.__table__.insert(), [dict(
+            artist_id=other_id, venue_id=other_venue_id, start_time=datetime(2035, 4, 3, 20),
+            end_time=datetime(2035, 4, 3, 22), updated_at=datetime.utcnow())])
+        db.session.commit()
+        self.assertFalse(book('2035-04-03 21:00', self.artist_id, other_venue_id))
+        self.assertFalse(book('2035-04-03 19:00', other_id))
+        Show.query.filter_by(start_time=datetime(2035, 4, 3, 20)).delete()
+        db.session.commit()
+
+        url = '/api/v1/venues/{}/free?from=2035-04-01T18:00&to=2035-04-02T00:00&minutes=60'.format(venue_id)
+        self.assertEqual(self.client().get(url).get_json()['data'],
+                         [{'start_time': '2035-04-01T18:00:00', 'end_time': '2035-04-01T20:00:00'}])
+        # moving a show keeps its length and frees its old period
+        Show.query.order_by(Show.id).first().start_time = datetime(2035, 4, 1, 23, 30)
+        db.session.commit()
+        res = self.client().get(url + '&artist_id={}'.format(other_id))
+        self.assertEqual(res.get_json()['data'],
+                         [{'start_time': '2035-04-01T18:00:00', 'end_time': '2035-04-01T21:30:00'}])
+        self.assertEqual(self.client().get(url.replace('2035-04-02', '2036-04-02')).status_code, 400)
+        self.assertEqual(self.client().get('/api/v1/venues/9999/free?from=2035-04-01').status_code, 404)
+
+        stream = io.StringIO(
+            'artist_id,venue_id,start_time,duration\n'
+            '{a},{v},2035-04-01T22:00:00,60\n'
+            '{o},{w},2035-04-02T12:00:00,60\n'
+            '{a},{w},2035-04-02T12:30:00,60\n'
+            '{a},{w},2035-04-02T13:00:00,60\n'.format(a=self.artist_id, o=other_id, v=venue_id, w=other_venue_id))
+        result = import_shows(stream, batch_size=10)
+        self.assertEqual(result['inserted'], 2)
+        self.assertEqual([line for line, error in result['errors']], [2, 4])
+        self.assertIn('venue is already booked from 2035-04-01 21:30', result['errors'][0][1])
+
+        self.assertEqual(list(show_conflicts('venue_id')), [])
+        db.session.execute(Show.__table__.insert().values(
+            artist_id=other_id, venue_id=other_venue_id,
+            start_time=datetime(2035, 4, 2, 12, 30), end_time=datetime(2035, 4, 2, 12, 45)))
+        db.session.commit()
+        self.assertEqual(len(list(show_conflicts('venue_id'))), 1)
+        self.assertEqual(len(list(show_conflicts('artist_id'))), 1)
+
+    def test_interval_index(self):
+        hour = timedelta(hours=1)
+        day = datetime(2035, 4, 1)
+        # a long booking that outlasts shorter ones after it
+        index = IntervalIndex([(1, day, day + 10 * hour), (2, day + hour, day + 2 * hour)])
+        index.add(3, day + 12 * hour, day + 13 * hour)
+        self.assertEqual(index.conflict(day + 9 * hour, day + 11 * hour)[2], 1)
+        self.assertEqual(index.conflict(day + 9 * hour, day + 11 * hour, exclude=1), None)
+        self.assertEqual([booking[2] for booking in index.overlapping(day + hour, day + 13 * hour)], [1, 2, 3])
+        self.assertIsNone(index.conflict(day + 10 * hour, day + 12 * hour))
+        self.assertEqual(free_slots([index.overlapping(day, day + 24 * hour)], day, day + 24 * hour, 2 * hour),
+                         [(day + 10 * hour, day + 12 * hour), (day + 13 * hour, day + 24 * hour)])
+
+    def test_json_api(self):
+        venue_id = self.add_venue('The Musical Hop', 'San Francisco', 'CA', upcoming=2, past=1).id
+
+        res = self.client().get('/api/v1/venues?fields=name,id')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.get_json()['data'], [{'id': venue_id, 'name': 'The Musical Hop'}])
+        self.assertEqual(self.client().get('/api/v1/venues?fields=nope').status_code, 400)
+
+        artist = self.client().get('/api/v1/artists/{}'.format(self.artist_id)).get_json()
+        self.assertEqual((artist['name'], artist['upcoming_shows_count']), ('Guns N Petals', 2))
+        self.assertEqual(self.client().get('/api/v1/venues/9999').get_json()['error'], 404)
+        shows = self.client().get('/api/v1/shows?fields=venue_name').get_json()['data']
+        self.assertEqual(shows, [{'venue_name': 'The Musical Hop'}] * 3)
+        self.assertEqual(self.client().get('/api/v1/venues/search?q=hop').get_json()['count'], 1)
+
+        res = self.client().get('/api/v1/venues/{}'.format(venue_id))
+        etag = res.headers['ETag']
+        res = self.client().get('/api/v1/venues/{}'.format(venue_id), headers={'If-None-Match': etag})
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.data, b'')
+
+        res = self.client().get('/api/v1/venues/{}'.format(venue_id), headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(res.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(json.loads(gzip.decompress(res.data))['name'], 'The Musical Hop')
+
+    def test_engine_options(self):
+        config = dict(self.app.config, DATABASE_POOL_SIZE=8, DATABASE_MAX_OVERFLOW=2, DATABASE_POOL_RECYCLE=600,
+                      DATABASE_POOL_PRE_PING=True, DATABASE_STATEMENT_TIMEOUT=5000)
+        self.assertEqual(engine_options(config), {'pool_pre_ping': True})
+
+        config['SQLALCHEMY_DATABASE_URI'] = 'postgresql://localhost/fyyurapp'
+        self.assertEqual(engine_options(config), {
+            'pool_pre_ping': True, 'pool_size': 8, 'max_overflow': 2, 'pool_recycle': 600,
+            'connect_args': {'options': '-c statement_timeout=5000'},
+        })
+
+        other = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite://', 'PAGE_SIZE': 2})
+        self.assertEqual(other.config['PAGE_SIZE'], 2)
+        self.assertNotEqual(self.app.config['PAGE_SIZE'], 2)
+        self.assertIsNot(other.extensions['page_cache'], self.app.extensions['page_cache'])
+
+    def test_apps_keep_their_own_indexes(self):
+        self.add_venue('The Musical Hop', 'San Francisco', 'CA')
+        self.assertEqual([v.name for v in search_catalog(Venue, 'hop')], ['The Musical Hop'])
+
+        db.session.remove()
+        other = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite://', 'TASK_QUEUE_BACKEND': 'eager'})
+        with other.app_context():
+            db.create_all()
+            db.session.add(Venue(name='Nowhere Hall', city='Austin', state='TX', genres=['Jazz']))
+            db.session.add(Venue(name='Hop Along Hall', city='Austin', state='TX', genres=['Jazz']))
+            db.session.commit()
+            self.assertEqual([v.name for v in search_catalog(Venue, 'hop')], ['Hop Along Hall'])
+            db.session.remove()
+        self.assertEqual([v.name for v in search_catalog(Venue, 'hop')], ['The Musical Hop'])
+
+    def test_search_indexes_follow_other_processes(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        config = {
+            'TESTING': True,
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(directory, 'fyyur.db'),
+            'TASK_QUEUE_BACKEND': 'eager',
+        }
+        first, second = create_app(config), create_app(config)
+        # processes sharing a redis store
+        second.extensions['page_cache'] = first.extensions['page_cache']
+
+        db.session.remove()
+        with first.app_context():
+            db.create_all()
+            db.session.add(Venue(name='The Musical Hop', city='San Francisco', state='CA', genres=['Jazz']))
+            db.session.commit()
+            self.assertEqual([v.name for v in search_catalog(Venue, 'hop')], ['The Musical Hop'])
+            db.session.remove()
+        with second.app_context():
+            self.assertEqual([v.name for v in search_catalog(Venue, 'hop')], ['The Musical Hop'])
+            db.session.add(Venue(name='Hop Along Hall', city='Austin', state='TX', genres=['Jazz']))
+            db.session.commit()
+            db.session.remove()
+        with first.app_context():
+            self.assertEqual([v.name for v in search_catalog(Venue, 'hop')], ['Hop Along Hall', 'The Musical Hop'])
+            Venue.query.filter_by(name='The Musical Hop').delete()
+            db.session.commit()
+            db.session.remove()
+        with second.app_context():
+            self.assertEqual([v.name for v in search_catalog(Venue, 'hop')], ['Hop Along Hall'])
+            db.session.remove()
+
+    def test_replica_routing(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        replicated = create_app({
+            'TESTING': True,
+            'PAGE_CACHE_ENABLED': False,
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(directory, 'primary.db'),
+            'DATABASE_REPLICA_URLS': ['sqlite:///' + os.path.join(directory, 'replica.db')],
+        })
+        # the scoped session is shared by every app on this thread
+        db.session.remove()
+        with replicated.app_context():
+            db.create_all()
+            db.metadata.create_all(db.get_engine(replicated, bind='replica1'))
+            db.session.add(Venue(name='Primary Hall', city='Austin', state='TX', genres=['Jazz']))
+            db.session.commit()
+            db.session.remove()
+
+            # the replica has not caught up: read-only pages do not see the venue yet
+            writer, reader = replicated.test_client(), replicated.test_client()
+            self.assertNotIn(b'Primary Hall', writer.get('/venues').data)
+            self.assertEqual(writer.get('/venues/1').status_code, 404)
+
+            # ...until this client writes, then it reads its writes from the primary
+            res = writer.post('/venues/create', data={'name': 'Second Hall', 'city': 'Austin', 'state': 'TX'})
+            self.assertEqual(res.status_code, 302)
+            data = writer.get('/venues').data
+            self.assertIn(b'Primary Hall', data)
+            self.assertIn(b'Second Hall', data)
+            self.assertEqual(writer.get('/venues/1').status_code, 200)
+            self.assertNotIn(b'Second Hall', reader.get('/venues').data)
+
+            db.session.remove()
+            db.drop_all()
+        db.session.remove()
+
+    def test_template_bytecode_cache(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        warmed = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite://', 'TEMPLATE_CACHE_DIR': directory,
+                             'TEMPLATE_WARMUP': True})
+        names = compile_templates(warmed)
+        self.assertIn('layouts/main.html', names)
+        self.assertIn('pages/show_venue.html', names)
+        self.assertEqual(len(os.listdir(directory)), len(names))
+
+    def test_benchmark_compare(self):
+        self.assertEqual(benchmark.percentile([5, 1, 4, 2, 3], 0.5), 3)
+
+        def report(p95, queries):
+            handle, path = tempfile.mkstemp(suffix='.json')
+            with os.fdopen(handle, 'w') as f:
+                json.dump({'routes': {'GET /venues': {'p50_ms': 1.0, 'p95_ms': p95, 'p99_ms': p95, 'queries': queries}}}, f)
+            self.addCleanup(os.remove, path)
+            return path
+
+        baseline = report(10.0, 1)
+        self.assertEqual(benchmark.main(['compare', baseline, report(11.0, 1), '--threshold', '0.2']), 0)
+        self.assertEqual(benchmark.main(['compare', baseline, report(13.0, 1), '--threshold', '0.2']), 1)
+        self.assertEqual(benchmark.main(['compare', baseline, report(9.0, 2)]), 1)
+
+    def test_navbar_search_on_detail_pages(self):
+        venue_id = self.add_venue('The Musical Hop', 'San Francisco', 'CA').id
+        self.assertIn(b'placeholder="Find a venue"', self.client().get('/venues/{}'.format(venue_id)).data)
+        self.assertIn(b'placeholder="Find an artist"', self.client().get('/artists/{}'.format(self.artist_id)).data)
+        res = self.client().post('/venues/search', data={'search_term': 'hop'})
+        self.assertIn(b'placeholder="Find a venue"', res.data)
+
+    def test_404_show_venue(self):
+        res = self.client().get('/venues/9999')
+        self.assertEqual(res.status_code, 404)
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()